@@ -0,0 +1,300 @@
+"""
+Columnar export of mood entries for program-wide analytics.
+
+Rows are read across all users in keyset-paginated batches over the primary
+key (archived blocks first, then mood_entries), each batch its own short
+read, and turned into Arrow record batches of the same size. Those go out as
+an Arrow IPC stream or a Parquet file (one row group per ROW_GROUP_ROWS), so
+memory stays flat however large the table is and SQLite writers are never
+held up for the length of an export.
+
+Every row carries the user's cohort, their signup month (YYYY-MM). The text
+columns (user_message, eli_response) are left out unless asked for: most
+analyses only need scores, labels and tags, and the text is most of the
+bytes and, for replies, a decompression per row.
+
+cohort_rollup() aggregates batches into per cohort and week (or month)
+totals in-process. export_analytics.py runs both against a backup snapshot,
+so analysis doesn't have to read the live database at all.
+
+pyarrow is only imported when an export runs.
+"""
+from datetime import date, timedelta
+
+from sqlalchemy import select
+
+import archive
+from database import ArchiveBlock, MoodEntry, User, engine
+
+FORMATS = {
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+BATCH_ROWS = 5000
+ROW_GROUP_ROWS = 100000
+BLOCKS_PER_READ = 20
+# Partial rollup rows kept before they are re-aggregated
+COMPACT_ROWS = 200000
+
+TEXT_COLUMNS = ("user_message", "eli_response")
+_HOT_COLUMNS = (
+    MoodEntry.id, MoodEntry.user_id, MoodEntry.created_at, MoodEntry.local_day,
+    MoodEntry.sentiment_score, MoodEntry.sentiment_label, MoodEntry.mood_tags,
+)
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise RuntimeError("analytics exports need pyarrow; pip install pyarrow")
+    return pyarrow
+
+
+def schema(include_text=False):
+    pa = _pyarrow()
+    fields = [
+        pa.field("id", pa.int64(), nullable=False),
+        pa.field("user_id", pa.int64()),
+        pa.field("cohort", pa.string()),
+        pa.field("created_at", pa.timestamp("us")),
+        pa.field("local_day", pa.date32()),
+        pa.field("sentiment_score", pa.float64()),
+        pa.field("sentiment_label", pa.string()),
+        pa.field("mood_tags", pa.string()),
+        pa.field("archived", pa.bool_(), nullable=False),
+    ]
+    if include_text:
+        fields += [pa.field(name, pa.string()) for name in TEXT_COLUMNS]
+    return pa.schema(fields)
+
+
+def _cohorts(bind):
+    """{user_id: signup month}"""
+    with bind.connect() as conn:
+        return {
+            user_id: created_at.strftime("%Y-%m") if created_at else None
+            for user_id, created_at in conn.execute(select(User.id, User.created_at))
+        }
+
+
+def _record_batch(pa, batch_schema, rows, cohorts, archived):
+    """rows are (id, user_id, created_at, local_day, score, label, tags[, message, reply])"""
+    columns = list(zip(*rows))
+    arrays = [
+        columns[0], columns[1], [cohorts.get(user_id) for user_id in columns[1]],
+        *columns[2:7], [archived] * len(rows), *columns[7:],
+    ]
+    return pa.RecordBatch.from_arrays(
+        [pa.array(values, type=field.type) for values, field in zip(arrays, batch_schema)],
+        schema=batch_schema,
+    )
+
+
+def _archived_rows(bind, include_text, start, end):
+    """Lists of archived rows in hot-row order, a block or so at a time"""
+    last_id = 0
+    while True:
+        query = select(ArchiveBlock.id, ArchiveBlock.user_id, ArchiveBlock.codec, ArchiveBlock.payload) \
+            .where(ArchiveBlock.id > last_id)
+        # Blocks hold one month of created_at (UTC), and local_day is at most a day off it
+        if start is not None:
+            query = query.where(ArchiveBlock.month >= (start - timedelta(days=1)).strftime("%Y-%m"))
+        if end is not None:
+            query = query.where(ArchiveBlock.month <= (end + timedelta(days=1)).strftime("%Y-%m"))
+        with bind.connect() as conn:
+            blocks = conn.execute(query.order_by(ArchiveBlock.id).limit(BLOCKS_PER_READ)).all()
+        if not blocks:
+            return
+        for block_id, user_id, codec, payload in blocks:
+            rows = []
+            for row in archive.decode_block(codec, payload):
+                day = date.fromisoformat(row[7]) if row[7] else None
+                if (start is not None and (day is None or day < start)) or \
+                        (end is not None and (day is None or day > end)):
+                    continue
+                rows.append((row[0], user_id, row[1], day, *row[4:7], *((row[2], row[3]) if include_text else ())))
+            if rows:
+                yield rows
+        last_id = blocks[-1][0]
+
+
+def _hot_rows(bind, include_text, start, end, batch_rows):
+    columns = _HOT_COLUMNS + ((MoodEntry.user_message, MoodEntry.eli_response) if include_text else ())
+    last_id = 0
+    while True:
+        query = select(*columns).where(MoodEntry.id > last_id)
+        if start is not None:
+            query = query.where(MoodEntry.local_day >= start)
+        if end is not None:
+            query = query.where(MoodEntry.local_day <= end)
+        with bind.connect() as conn:
+            rows = conn.execute(query.order_by(MoodEntry.id).limit(batch_rows)).all()
+        if not rows:
+            return
+        yield rows
+        if len(rows) < batch_rows:
+            return
+        last_id = rows[-1][0]
+
+
+def iter_batches(bind=engine, include_text=False, start=None, end=None, include_archived=True,
+                 batch_rows=BATCH_ROWS):
+    """Yield Arrow record batches of every entry (local_day between start and end), archived first"""
+    pa = _pyarrow()
+    batch_schema = schema(include_text)
+    cohorts = _cohorts(bind)
+
+    if include_archived:
+        pending = []
+        for rows in _archived_rows(bind, include_text, start, end):
+            pending += rows
+            if len(pending) >= batch_rows:
+                yield _record_batch(pa, batch_schema, pending, cohorts, True)
+                pending = []
+        if pending:
+            yield _record_batch(pa, batch_schema, pending, cohorts, True)
+
+    for rows in _hot_rows(bind, include_text, start, end, batch_rows):
+        yield _record_batch(pa, batch_schema, rows, cohorts, False)
+
+
+class _Sink:
+    """Write-only file object whose bytes are handed out between batches"""
+
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self.parts.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b"".join(self.parts)
+        self.parts = []
+        return data
+
+
+def _arrow_chunks(pa, batches, batch_schema):
+    sink = _Sink()
+    writer = pa.ipc.new_stream(sink, batch_schema, options=pa.ipc.IpcWriteOptions(compression="zstd"))
+    for batch in batches:
+        writer.write_batch(batch)
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+def _parquet_chunks(pa, batches, batch_schema):
+    import pyarrow.parquet as pq
+
+    sink = _Sink()
+    writer = pq.ParquetWriter(sink, batch_schema, compression="zstd")
+    pending, pending_rows = [], 0
+    for batch in batches:
+        pending.append(batch)
+        pending_rows += batch.num_rows
+        if pending_rows >= ROW_GROUP_ROWS:
+            writer.write_table(pa.Table.from_batches(pending, batch_schema), row_group_size=ROW_GROUP_ROWS)
+            pending, pending_rows = [], 0
+            yield sink.drain()
+    if pending:
+        writer.write_table(pa.Table.from_batches(pending, batch_schema), row_group_size=ROW_GROUP_ROWS)
+    writer.close()
+    yield sink.drain()
+
+
+def stream_export(fmt, include_text=False, start=None, end=None, bind=engine):
+    """Return an iterator of bytes (Arrow IPC stream or Parquet) for a StreamingResponse or a file"""
+    pa = _pyarrow()
+    batch_schema = schema(include_text)
+    batches = iter_batches(bind, include_text=include_text, start=start, end=end)
+    if fmt == "parquet":
+        chunks = _parquet_chunks(pa, batches, batch_schema)
+    else:
+        chunks = _arrow_chunks(pa, batches, batch_schema)
+    return (chunk for chunk in chunks if chunk)
+
+
+_METRICS = ("entries", "scored", "score", "positive", "negative", "neutral")
+
+
+def _aggregate(table, keys):
+    """Sum the metrics per keys, keeping their column names"""
+    grouped = table.group_by(keys).aggregate([(name, "sum") for name in _METRICS])
+    return grouped.rename_columns([name[:-4] if name.endswith("_sum") else name for name in grouped.column_names])
+
+
+def cohort_rollup(batches, period="week"):
+    """
+    Totals per cohort and period (week starting Monday, or month) of
+    local_day, over record batches from iter_batches(): entries, distinct
+    users, scored entries, mean sentiment score and label counts. Returns a
+    pyarrow Table sorted by cohort and period.
+    """
+    pa = _pyarrow()
+    import pyarrow.compute as pc
+
+    if period not in ("week", "month"):
+        raise ValueError("period must be 'week' or 'month'")
+    keys = ["cohort", period, "user_id"]
+
+    partials, partial_rows = [], 0
+    for batch in batches:
+        if not batch.num_rows:
+            continue
+        score = batch.column("sentiment_score")
+        label = batch.column("sentiment_label")
+        partial = pa.table({
+            "cohort": batch.column("cohort"),
+            period: pc.floor_temporal(batch.column("local_day"), unit=period, week_starts_monday=True),
+            "user_id": batch.column("user_id"),
+            "entries": pa.array([1] * batch.num_rows, pa.int64()),
+            "scored": pc.cast(pc.is_valid(score), pa.int64()),
+            "score": pc.fill_null(score, 0.0),
+            "positive": pc.cast(pc.fill_null(pc.equal(label, "positive"), False), pa.int64()),
+            "negative": pc.cast(pc.fill_null(pc.equal(label, "negative"), False), pa.int64()),
+            "neutral": pc.cast(pc.fill_null(pc.equal(label, "neutral"), False), pa.int64()),
+        })
+        partials.append(_aggregate(partial, keys))
+        partial_rows += partials[-1].num_rows
+        if partial_rows >= COMPACT_ROWS:
+            partials = [_aggregate(pa.concat_tables(partials), keys)]
+            partial_rows = partials[0].num_rows
+
+    if not partials:
+        return None
+
+    per_user = pa.concat_tables(partials)
+    totals = per_user.group_by(["cohort", period]).aggregate(
+        [(name, "sum") for name in _METRICS] + [("user_id", "count_distinct")]
+    )
+    scored = totals.column("scored_sum")
+    mean_score = pc.if_else(
+        pc.equal(scored, 0), None, pc.round(pc.divide(totals.column("score_sum"), pc.cast(scored, pa.float64())), 4)
+    )
+    return pa.table({
+        "cohort": totals.column("cohort"),
+        period: totals.column(period),
+        "entries": totals.column("entries_sum"),
+        "users": totals.column("user_id_count_distinct"),
+        "scored": scored,
+        "mean_score": mean_score,
+        "positive": totals.column("positive_sum"),
+        "negative": totals.column("negative_sum"),
+        "neutral": totals.column("neutral_sum"),
+    }).sort_by([("cohort", "ascending"), (period, "ascending")])
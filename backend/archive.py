@@ -0,0 +1,262 @@
+"""
+Hot/cold tiering for mood entries.
+
+archive_old_entries() moves entries older than the archive age out of
+mood_entries into compressed blocks, one per user and calendar month
+(mood_entry_archive). The hot table and its indexes then only hold recent
+activity. Whole months are archived at a time, each in its own transaction,
+so the job can be stopped and rerun safely. Entries still waiting for
+deferred sentiment stay hot until they are scored. Archived ids are never
+handed out again, because mood_entries ids are AUTOINCREMENT.
+
+Blocks are zstd-compressed when the zstandard package is installed and zlib
+otherwise; each block records its codec, so both can be read back. Archived
+entries stay visible to:
+  - export: archived blocks are streamed before the hot rows
+  - search: a contentless FTS index (mood_entry_archive_fts) covers archived
+    text, and matching blocks are decompressed to build the results
+  - trends and stats: per-day score sums are kept in archived_day_stats
+
+Run it with `python archive_entries.py`.
+"""
+import json
+import zlib
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, exists, func, insert, select
+
+from cache import make_cache
+from database import ArchiveBlock, ArchivedDay, ArchivedEntry, EnrichmentJob, MoodEntry
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+DEFAULT_ARCHIVE_AFTER_DAYS = 180
+
+# Order of the fields in each archived row
+BLOCK_COLUMNS = (
+    "id", "created_at", "user_message", "eli_response",
+    "sentiment_score", "sentiment_label", "mood_tags", "local_day",
+)
+
+ZSTD_LEVEL = 9
+ZLIB_LEVEL = 9
+
+# Decoded blocks, for search results that land in the archive
+block_cache = make_cache("archive_blocks", max_entries=256)
+
+
+def compress(data):
+    """(codec, payload) using the best codec available"""
+    if zstandard is not None:
+        return "zstd", zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return "zlib", zlib.compress(data, ZLIB_LEVEL)
+
+
+def decompress(codec, payload):
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("this archive block is zstd-compressed; install zstandard to read it")
+        return zstandard.ZstdDecompressor().decompress(payload)
+    if codec == "zlib":
+        return zlib.decompress(payload)
+    raise ValueError(f"unknown archive codec: {codec}")
+
+
+def encode_rows(rows):
+    return json.dumps([
+        [r.id, r.created_at.isoformat(), r.user_message, r.eli_response,
+         r.sentiment_score, r.sentiment_label, r.mood_tags,
+         r.local_day.isoformat() if r.local_day else None]
+        for r in rows
+    ], separators=(",", ":")).encode("utf-8")
+
+
+def decode_block(codec, payload):
+    """Rows of a block as lists in BLOCK_COLUMNS order, created_at as a datetime"""
+    rows = json.loads(decompress(codec, payload))
+    for row in rows:
+        row[1] = datetime.fromisoformat(row[1])
+    return rows
+
+
+def load_block(db, block_id):
+    rows = block_cache.get(str(block_id))
+    if rows is None:
+        codec, payload = db.execute(
+            select(ArchiveBlock.codec, ArchiveBlock.payload).where(ArchiveBlock.id == block_id)
+        ).one()
+        rows = decode_block(codec, payload)
+        block_cache.set(str(block_id), rows)
+    return rows
+
+
+def archive_cutoff(older_than_days, now=None):
+    """Start of the month containing now - older_than_days; everything before it is archived"""
+    day = ((now or datetime.utcnow()) - timedelta(days=older_than_days)).date()
+    return datetime(day.year, day.month, 1)
+
+
+def _next_month(month_start):
+    if month_start.month == 12:
+        return month_start.replace(year=month_start.year + 1, month=1)
+    return month_start.replace(month=month_start.month + 1)
+
+
+def _not_pending():
+    """Entries still waiting for deferred sentiment (see enrichment.py) stay hot until scored"""
+    return ~exists().where(EnrichmentJob.entry_id == MoodEntry.id)
+
+
+def _archive_month(conn, user_id, month_start):
+    """Move one user's entries for one month into a block. Returns (entries, raw bytes, stored bytes)"""
+    rows = conn.execute(
+        select(MoodEntry.__table__)
+        .where(
+            MoodEntry.user_id == user_id,
+            MoodEntry.created_at >= month_start,
+            MoodEntry.created_at < _next_month(month_start),
+            _not_pending(),
+        )
+        .order_by(MoodEntry.id)
+    ).all()
+    if not rows:
+        return 0, 0, 0
+
+    raw = encode_rows(rows)
+    codec, payload = compress(raw)
+    block_id = conn.execute(insert(ArchiveBlock).values(
+        user_id=user_id,
+        month=month_start.strftime("%Y-%m"),
+        codec=codec,
+        entry_count=len(rows),
+        raw_bytes=len(raw),
+        payload=payload,
+        archived_at=datetime.utcnow(),
+    )).inserted_primary_key[0]
+
+    conn.execute(insert(ArchivedEntry), [
+        {"id": r.id, "block_id": block_id} for r in rows
+    ])
+    conn.exec_driver_sql(
+        "INSERT INTO mood_entry_archive_fts(rowid, user_message, owner) VALUES (?, ?, ?)",
+        [(r.id, r.user_message, f"u{user_id}") for r in rows]
+    )
+
+    days = {}
+    for r in rows:
+        day = r.local_day or r.created_at.date()
+        stats = days.setdefault(day, [0, 0, 0.0, 0.0])
+        stats[0] += 1
+        if r.sentiment_score is not None:
+            stats[1] += 1
+            stats[2] += r.sentiment_score
+            stats[3] += r.sentiment_score * r.sentiment_score
+    conn.exec_driver_sql(
+        """INSERT INTO archived_day_stats
+           (user_id, local_day, entry_count, score_count, score_sum, score_sum_sq)
+           VALUES (?, ?, ?, ?, ?, ?)
+           ON CONFLICT (user_id, local_day) DO UPDATE SET
+             entry_count = entry_count + excluded.entry_count,
+             score_count = score_count + excluded.score_count,
+             score_sum = score_sum + excluded.score_sum,
+             score_sum_sq = score_sum_sq + excluded.score_sum_sq""",
+        [(user_id, day.isoformat(), *stats) for day, stats in days.items()]
+    )
+
+    # The hot search index is updated by the mood_entries delete trigger
+    conn.execute(delete(MoodEntry).where(MoodEntry.id.in_([r.id for r in rows])))
+    return len(rows), len(raw), len(payload)
+
+
+def archive_old_entries(bind, older_than_days=DEFAULT_ARCHIVE_AFTER_DAYS, dry_run=False):
+    """Archive every whole month older than the cutoff. Returns a totals dict."""
+    cutoff = archive_cutoff(older_than_days)
+    month = func.strftime("%Y-%m", MoodEntry.created_at)
+    with bind.begin() as conn:
+        groups = conn.execute(
+            select(MoodEntry.user_id, month, func.count())
+            .where(MoodEntry.created_at < cutoff, MoodEntry.user_id.isnot(None), _not_pending())
+            .group_by(MoodEntry.user_id, month)
+            .order_by(MoodEntry.user_id, month)
+        ).all()
+
+    totals = {"cutoff": cutoff.date().isoformat(), "blocks": 0, "entries": 0, "raw_bytes": 0, "stored_bytes": 0}
+    if dry_run:
+        totals["blocks"] = len(groups)
+        totals["entries"] = sum(count for _, _, count in groups)
+        return totals
+
+    for user_id, month_key, _ in groups:
+        month_start = datetime.strptime(month_key, "%Y-%m")
+        with bind.begin() as conn:
+            entries, raw_bytes, stored_bytes = _archive_month(conn, user_id, month_start)
+        if entries:
+            totals["blocks"] += 1
+            totals["entries"] += entries
+            totals["raw_bytes"] += raw_bytes
+            totals["stored_bytes"] += stored_bytes
+            if totals["blocks"] % 500 == 0:
+                print(f"   {totals['blocks']} blocks, {totals['entries']} entries archived")
+    return totals
+
+
+def iter_user_blocks(db, user_id):
+    """Yield the decoded rows of each of a user's blocks, oldest month first"""
+    blocks = db.execute(
+        select(ArchiveBlock.id, ArchiveBlock.month)
+        .where(ArchiveBlock.user_id == user_id)
+        .order_by(ArchiveBlock.month, ArchiveBlock.id)
+    ).all()
+    for block_id, _ in blocks:
+        codec, payload = db.execute(
+            select(ArchiveBlock.codec, ArchiveBlock.payload).where(ArchiveBlock.id == block_id)
+        ).one()
+        # End the read transaction between blocks, like the hot export batches
+        db.commit()
+        yield decode_block(codec, payload)
+
+
+def archived_day_rows(db, user_id, start, end):
+    """(local_day, count, sum, sum_of_squares) per archived day, in trend-query shape"""
+    return db.query(
+        ArchivedDay.local_day,
+        ArchivedDay.score_count,
+        ArchivedDay.score_sum,
+        ArchivedDay.score_sum_sq,
+    ).filter(
+        ArchivedDay.user_id == user_id,
+        ArchivedDay.local_day >= start,
+        ArchivedDay.local_day <= end,
+        ArchivedDay.score_count > 0
+    ).all()
+
+
+def archived_count(db, user_id):
+    return db.query(func.coalesce(func.sum(ArchivedDay.entry_count), 0)).filter(
+        ArchivedDay.user_id == user_id
+    ).scalar()
+
+
+def purge_users(conn, user_ids):
+    """Delete everything archived for the given users (a list or a select of ids)"""
+    blocks = conn.execute(
+        select(ArchiveBlock.id, ArchiveBlock.user_id, ArchiveBlock.codec, ArchiveBlock.payload)
+        .where(ArchiveBlock.user_id.in_(user_ids))
+    ).all()
+    for block_id, user_id, codec, payload in blocks:
+        # Contentless FTS rows can only be deleted by repeating the indexed values
+        conn.exec_driver_sql(
+            "INSERT INTO mood_entry_archive_fts(mood_entry_archive_fts, rowid, user_message, owner) "
+            "VALUES ('delete', ?, ?, ?)",
+            [(row[0], row[2], f"u{user_id}") for row in decode_block(codec, payload)]
+        )
+        block_cache.delete(str(block_id))
+    conn.execute(delete(ArchivedEntry).where(ArchivedEntry.block_id.in_(
+        select(ArchiveBlock.id).where(ArchiveBlock.user_id.in_(user_ids))
+    )))
+    conn.execute(delete(ArchivedDay).where(ArchivedDay.user_id.in_(user_ids)))
+    conn.execute(delete(ArchiveBlock).where(ArchiveBlock.user_id.in_(user_ids)))
+    return len(blocks)
@@ -0,0 +1,66 @@
+"""
+Move old mood entries into compressed cold storage
+
+Usage: python archive_entries.py [--older-than-days 180] [--dry-run] [--vacuum]
+
+Every whole calendar month older than the cutoff is moved out of
+mood_entries into one compressed block per user and month (see archive.py).
+Export, search, trends and stats keep reading archived entries. Safe to run
+repeatedly, e.g. nightly from cron.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import func, select
+
+import archive
+from database import engine, init_db, MoodEntry
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive old mood entries into compressed monthly blocks")
+    parser.add_argument("--older-than-days", type=int,
+                        default=int(os.environ.get("ELI_ARCHIVE_AFTER_DAYS", archive.DEFAULT_ARCHIVE_AFTER_DAYS)))
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would be archived")
+    parser.add_argument("--vacuum", action="store_true", help="VACUUM afterwards to return freed pages to the OS")
+    args = parser.parse_args()
+
+    init_db()
+
+    print("=" * 60)
+    print("ARCHIVE MOOD ENTRIES")
+    print("=" * 60)
+    codec = "zstd" if archive.zstandard is not None else "zlib (install zstandard for zstd)"
+    print(f"\n  cutoff: entries before {archive.archive_cutoff(args.older_than_days).date()}")
+    print(f"  codec:  {codec}")
+
+    start = time.perf_counter()
+    totals = archive.archive_old_entries(engine, args.older_than_days, dry_run=args.dry_run)
+    elapsed = time.perf_counter() - start
+
+    if args.dry_run:
+        print(f"\n  would archive {totals['entries']} entries into {totals['blocks']} blocks")
+        return
+
+    print(f"\n  archived {totals['entries']} entries into {totals['blocks']} blocks in {elapsed:.1f}s")
+    if totals["raw_bytes"]:
+        print(f"  {totals['raw_bytes'] / 1e6:.1f} MB of rows stored as {totals['stored_bytes'] / 1e6:.1f} MB "
+              f"({totals['raw_bytes'] / totals['stored_bytes']:.1f}x)")
+
+    with engine.connect() as conn:
+        hot = conn.execute(select(func.count(MoodEntry.id))).scalar()
+    print(f"  {hot} entries remain in mood_entries")
+
+    if args.vacuum:
+        print("\n  vacuuming...")
+        with engine.connect() as conn:
+            conn.exec_driver_sql("VACUUM")
+        print("  done")
+
+
+if __name__ == "__main__":
+    main()
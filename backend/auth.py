@@ -1,13 +1,18 @@
+import hmac
+import os
 import jwt
 from datetime import datetime, timedelta
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, Header, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
 from database import get_db, User
+from timing import span
 
 SECRET_KEY = "your-secret-key-change-in-production"  # Change this in production
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_DAYS = 30
+# Shared secret for admin-only endpoints; unset means they are closed
+ADMIN_TOKEN = os.environ.get("ELI_ADMIN_TOKEN", "")
 
 security = HTTPBearer(auto_error=False)
 
@@ -29,15 +34,17 @@ def get_current_user(
     if not credentials:
         return None
 
-    token = credentials.credentials
+    # Only the token check is "auth"; the user lookup is already timed as "db"
+    with span("auth"):
+        token = credentials.credentials
 
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id: int = payload.get("sub")
-        if user_id is None:
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+            user_id: int = payload.get("sub")
+            if user_id is None:
+                return None
+        except jwt.PyJWTError:
             return None
-    except jwt.PyJWTError:
-        return None
 
     user = db.query(User).filter(User.id == user_id).first()
     return user
@@ -56,21 +63,22 @@ def get_current_user_required(
             detail="Not authenticated"
         )
 
-    token = credentials.credentials
+    with span("auth"):
+        token = credentials.credentials
 
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id: int = payload.get("sub")
-        if user_id is None:
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+            user_id: int = payload.get("sub")
+            if user_id is None:
+                raise HTTPException(
+                    status_code=status.HTTP_401_UNAUTHORIZED,
+                    detail="Invalid authentication credentials"
+                )
+        except jwt.PyJWTError:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Invalid authentication credentials"
             )
-    except jwt.PyJWTError:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid authentication credentials"
-        )
 
     user = db.query(User).filter(User.id == user_id).first()
     if user is None:
@@ -80,3 +88,11 @@ def get_current_user_required(
         )
 
     return user
+
+def require_admin(x_admin_token: str = Header(None)):
+    """Allow the request only if its X-Admin-Token header matches ELI_ADMIN_TOKEN"""
+    if not ADMIN_TOKEN or not x_admin_token or not hmac.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin token required"
+        )
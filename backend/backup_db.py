@@ -0,0 +1,196 @@
+"""
+Online backups of mood_tracker.db
+
+Usage:
+  python backup_db.py backup [--keep 7] [--dir backups]     take a snapshot now (safe while the app runs)
+  python backup_db.py list                                  list stored snapshots
+  python backup_db.py verify [SNAPSHOT]                     check a snapshot (default: the newest)
+  python backup_db.py restore SNAPSHOT [--target PATH]      restore (stop the app first)
+  python backup_db.py bench [--seconds 5] [--rate 200]      measure write latency during backups
+
+See backups.py for how snapshots are taken. bench works on a temporary copy
+of the database: a writer thread commits single-row inserts at a fixed rate
+while the copy sits idle, then while paced backups run back to back, then
+while unpaced ones do, and the write latency of each phase is compared.
+"""
+import argparse
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import backups
+
+
+def print_manifest(manifest):
+    print(f"  {manifest['file']}")
+    print(f"     taken {manifest['created_at']}  "
+          f"{manifest['raw_bytes'] / 1e6:.1f} MB -> {manifest['stored_bytes'] / 1e6:.1f} MB  "
+          f"copy {manifest['copy_seconds']:.2f}s in {manifest['steps']} steps, "
+          f"compress {manifest['compress_seconds']:.2f}s, restarts {manifest['restarts']}")
+
+
+def cmd_backup(args):
+    manifest = backups.backup_now(
+        backup_dir=args.dir, keep=args.keep, step_pages=args.step_pages, step_sleep_ms=args.step_sleep_ms
+    )
+    print_manifest(manifest)
+    if not manifest["wal"]:
+        print("\n  NOTE: the database is not in WAL mode, so concurrent writes restart the copy;"
+              " start the app once (init_db) to switch it")
+
+
+def cmd_list(args):
+    snapshots = backups.list_snapshots(args.dir)
+    if not snapshots:
+        print(f"  No snapshots in {args.dir}")
+    for manifest in snapshots:
+        print_manifest(manifest)
+
+
+def _snapshot_arg(args):
+    if args.snapshot:
+        return args.snapshot
+    snapshots = backups.list_snapshots(args.dir)
+    if not snapshots:
+        sys.exit(f"ERROR: no snapshots in {args.dir}")
+    return snapshots[0]["path"]
+
+
+def cmd_verify(args):
+    path = _snapshot_arg(args)
+    print(f"  Verifying {path}")
+    result = backups.verify_snapshot(path)
+    for table, count in sorted(result["tables"].items()):
+        print(f"     {table:<20} {count:>10,} rows")
+    if not result["ok"]:
+        for problem in result["problems"]:
+            print(f"     PROBLEM: {problem}")
+        sys.exit(1)
+    print("\n  OK: hash matches and integrity_check passed")
+
+
+def cmd_restore(args):
+    path = _snapshot_arg(args)
+    target = args.target or backups.database_path()
+    print(f"  Restoring {path}")
+    print(f"        into {target}")
+    result = backups.restore_snapshot(path, target, backup_dir=args.dir, safety_backup=not args.no_safety_backup)
+    if result["safety_backup"]:
+        print(f"  Previous contents saved as {result['safety_backup']}")
+    for table, count in sorted(result["tables"].items()):
+        print(f"     {table:<20} {count:>10,} rows")
+    print("\n  Restore complete; start the app again")
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def cmd_bench(args):
+    source = backups.database_path()
+    with tempfile.TemporaryDirectory() as workdir:
+        db_path = os.path.join(workdir, "bench.db")
+        backups.copy_database(source, db_path, step_pages=-1, step_sleep_ms=0)
+        conn = sqlite3.connect(db_path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE bench_writes (id INTEGER PRIMARY KEY, payload TEXT, created_at REAL)")
+        conn.commit()
+        conn.close()
+        print(f"  Working copy: {os.path.getsize(db_path) / 1e6:.1f} MB; writer at {args.rate} commits/s")
+
+        latencies = {}
+        phase = {"name": None}
+        stop = threading.Event()
+
+        def writer():
+            conn = sqlite3.connect(db_path, timeout=30)
+            interval = 1.0 / args.rate
+            next_at = time.perf_counter()
+            while not stop.is_set():
+                started = time.perf_counter()
+                conn.execute("INSERT INTO bench_writes (payload, created_at) VALUES (?, ?)", ("x" * 200, time.time()))
+                conn.commit()
+                latencies.setdefault(phase["name"], []).append((time.perf_counter() - started) * 1000)
+                next_at += interval
+                time.sleep(max(0.0, next_at - time.perf_counter()))
+            conn.close()
+
+        thread = threading.Thread(target=writer, daemon=True)
+        runs = {}
+
+        def run_phase(name, step_pages=None, step_sleep_ms=None):
+            phase["name"] = name
+            deadline = time.perf_counter() + args.seconds
+            count = 0
+            while time.perf_counter() < deadline:
+                if step_pages is None:
+                    time.sleep(0.05)
+                    continue
+                backups.backup_now(db_path, os.path.join(workdir, "snapshots"), keep=1,
+                                   step_pages=step_pages, step_sleep_ms=step_sleep_ms, label=name)
+                count += 1
+            runs[name] = count
+
+        thread.start()
+        run_phase("idle")
+        run_phase("paced", args.step_pages, args.step_sleep_ms)
+        run_phase("unpaced", -1, 0)
+        stop.set()
+        thread.join()
+
+    print("\n" + "=" * 60)
+    print("WRITE LATENCY")
+    print("=" * 60)
+    print(f"  {'phase':<10} {'backups':>8} {'writes':>8} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for name in ("idle", "paced", "unpaced"):
+        values = latencies.get(name, [])
+        if not values:
+            continue
+        print(f"  {name:<10} {runs.get(name, 0):>8} {len(values):>8} {statistics.median(values):>8.2f} "
+              f"{percentile(values, 99):>8.2f} {max(values):>8.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Online backups of the mood tracker database")
+    parser.add_argument("--dir", default=backups.BACKUP_DIR, help="Snapshot directory")
+    sub = parser.add_subparsers(dest="command")
+
+    backup = sub.add_parser("backup", help="Take a snapshot now")
+    backup.add_argument("--keep", type=int, default=backups.KEEP, help="Snapshots to keep")
+    sub.add_parser("list", help="List snapshots")
+    verify = sub.add_parser("verify", help="Check a snapshot")
+    verify.add_argument("snapshot", nargs="?")
+    restore = sub.add_parser("restore", help="Restore a snapshot (stop the app first)")
+    restore.add_argument("snapshot")
+    restore.add_argument("--target", help="Database to overwrite (default: the app's)")
+    restore.add_argument("--no-safety-backup", action="store_true",
+                         help="Don't snapshot the current contents first")
+    bench = sub.add_parser("bench", help="Measure write latency during backups, on a copy")
+    bench.add_argument("--seconds", type=float, default=5.0, help="Duration of each phase")
+    bench.add_argument("--rate", type=int, default=200, help="Writer commits per second")
+    for command in (backup, bench):
+        command.add_argument("--step-pages", type=int, default=backups.STEP_PAGES)
+        command.add_argument("--step-sleep-ms", type=float, default=backups.STEP_SLEEP_MS)
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print(f"DATABASE BACKUP: {(args.command or 'backup').upper()}")
+    print("=" * 60 + "\n")
+
+    if args.command in (None, "backup"):
+        if args.command is None:
+            args.keep, args.step_pages, args.step_sleep_ms = backups.KEEP, backups.STEP_PAGES, backups.STEP_SLEEP_MS
+        cmd_backup(args)
+    else:
+        {"list": cmd_list, "verify": cmd_verify, "restore": cmd_restore, "bench": cmd_bench}[args.command](args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,347 @@
+"""
+Online backups of the SQLite database.
+
+A snapshot is copied with SQLite's online backup API a few pages at a time
+(ELI_BACKUP_STEP_PAGES), sleeping between steps (ELI_BACKUP_STEP_SLEEP_MS)
+so the copy never hogs the disk. The database runs in WAL mode (see
+init_db), and the backup connection holds one read transaction for the whole
+copy: it reads a consistent snapshot while writers keep committing to the
+WAL, so writes never wait for the backup and never force it to start over.
+The price is that the WAL can't be checkpointed past that snapshot until the
+copy ends, so it grows by whatever is written meanwhile. (On a database in
+rollback-journal mode a write from another connection restarts the copy
+instead; restarts are counted and the backup gives up after MAX_RESTARTS.)
+
+Each snapshot is copied to a temporary file, switched to a self-contained
+rollback journal, hashed, compressed (zstd, or gzip without zstandard) into
+ELI_BACKUP_DIR and described by a JSON manifest next to it. Only the newest
+ELI_BACKUP_KEEP snapshots are kept. verify_snapshot() decompresses one and
+checks its hash and PRAGMA integrity_check; restore_snapshot() verifies,
+saves the current database as a snapshot too, then copies the snapshot in
+through SQLite so the target is never a torn file.
+
+With ELI_BACKUP_INTERVAL_MINUTES set, BackupJob takes snapshots from inside
+the API; under serve.py the workers elect one holder of ELI_BACKUP_LOCK.
+backup_db.py is the command line (backup, list, verify, restore, bench).
+"""
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from database import engine
+from process_lock import try_lock
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+BACKUP_DIR = os.environ.get("ELI_BACKUP_DIR", "backups")
+KEEP = int(os.environ.get("ELI_BACKUP_KEEP", "7"))
+STEP_PAGES = int(os.environ.get("ELI_BACKUP_STEP_PAGES", "256"))
+STEP_SLEEP_MS = float(os.environ.get("ELI_BACKUP_STEP_SLEEP_MS", "5"))
+INTERVAL_MINUTES = float(os.environ.get("ELI_BACKUP_INTERVAL_MINUTES", "0"))
+LOCK_PATH = os.environ.get("ELI_BACKUP_LOCK", "backups.lock")
+
+MAX_RESTARTS = 10
+ZSTD_LEVEL = 3
+_CHUNK = 1 << 20
+
+
+class BackupError(Exception):
+    pass
+
+
+def database_path():
+    return os.path.abspath(engine.url.database)
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def copy_database(source_path, dest_path, step_pages=STEP_PAGES, step_sleep_ms=STEP_SLEEP_MS,
+                  max_restarts=MAX_RESTARTS):
+    """Copy a live database with the online backup API, paced. Returns copy statistics"""
+    started = time.perf_counter()
+    source = sqlite3.connect(source_path, timeout=30, isolation_level=None)
+    dest = sqlite3.connect(dest_path, isolation_level=None)
+    stats = {"steps": 0, "restarts": 0, "pages": 0, "wal": False}
+    try:
+        # The copy is a scratch file until it's complete, so skip its journal and
+        # fsyncs; they would compete with the live database's commits for the disk
+        dest.execute("PRAGMA journal_mode=OFF")
+        dest.execute("PRAGMA synchronous=OFF")
+        stats["wal"] = source.execute("PRAGMA journal_mode").fetchone()[0].lower() == "wal"
+        if stats["wal"]:
+            # Pin one read snapshot for the whole copy; writers carry on in the WAL
+            source.execute("BEGIN")
+            source.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+
+        last_remaining = None
+
+        def progress(status, remaining, total):
+            nonlocal last_remaining
+            stats["steps"] += 1
+            stats["pages"] = total
+            if last_remaining is not None and remaining > last_remaining:
+                stats["restarts"] += 1
+                if stats["restarts"] > max_restarts:
+                    raise BackupError(f"backup restarted {stats['restarts']} times by concurrent writes")
+            last_remaining = remaining
+            if remaining and step_sleep_ms:
+                time.sleep(step_sleep_ms / 1000)
+
+        source.backup(dest, pages=step_pages, progress=progress)
+        if stats["wal"]:
+            source.execute("COMMIT")
+        # A single self-contained file, whatever mode the source was in
+        dest.execute("PRAGMA journal_mode=DELETE")
+    finally:
+        dest.close()
+        source.close()
+    stats["seconds"] = round(time.perf_counter() - started, 3)
+    return stats
+
+
+def _compress(path, out_path):
+    with open(path, "rb") as src, open(out_path, "wb") as dst:
+        if zstandard is not None:
+            zstandard.ZstdCompressor(level=ZSTD_LEVEL).copy_stream(src, dst)
+        else:
+            with gzip.GzipFile(fileobj=dst, mode="wb", compresslevel=6) as gz:
+                shutil.copyfileobj(src, gz, _CHUNK)
+
+
+def _decompress(path, out_path):
+    with open(path, "rb") as src, open(out_path, "wb") as dst:
+        if path.endswith(".zst"):
+            if zstandard is None:
+                raise BackupError("this snapshot is zstd-compressed; install zstandard to read it")
+            zstandard.ZstdDecompressor().copy_stream(src, dst)
+        elif path.endswith(".gz"):
+            with gzip.GzipFile(fileobj=src, mode="rb") as gz:
+                shutil.copyfileobj(gz, dst, _CHUNK)
+        else:
+            raise BackupError(f"unknown snapshot format: {path}")
+
+
+def _manifest_path(snapshot_path):
+    return snapshot_path.rsplit(".db.", 1)[0] + ".json"
+
+
+def list_snapshots(backup_dir=BACKUP_DIR):
+    """Manifests of the stored snapshots, newest first"""
+    if not os.path.isdir(backup_dir):
+        return []
+    manifests = []
+    for name in os.listdir(backup_dir):
+        if name.endswith(".json"):
+            with open(os.path.join(backup_dir, name)) as f:
+                manifest = json.load(f)
+            manifest["path"] = os.path.join(backup_dir, manifest["file"])
+            manifests.append(manifest)
+    return sorted(manifests, key=lambda m: m["created_at"], reverse=True)
+
+
+def rotate(backup_dir=BACKUP_DIR, keep=KEEP):
+    """Delete all but the newest `keep` snapshots; returns the files removed"""
+    removed = []
+    for manifest in list_snapshots(backup_dir)[keep:]:
+        for path in (manifest["path"], _manifest_path(manifest["path"])):
+            if os.path.exists(path):
+                os.remove(path)
+                removed.append(path)
+    return removed
+
+
+def backup_now(source_path=None, backup_dir=BACKUP_DIR, keep=KEEP, step_pages=STEP_PAGES,
+               step_sleep_ms=STEP_SLEEP_MS, label="mood_tracker"):
+    """Take, compress and record one snapshot, then rotate. Returns its manifest"""
+    source_path = source_path or database_path()
+    if not os.path.exists(source_path):
+        raise BackupError(f"no database at {source_path}")
+    os.makedirs(backup_dir, exist_ok=True)
+    created_at = datetime.utcnow()
+    stamp = created_at.strftime("%Y%m%dT%H%M%S%fZ")
+    file_name = f"{label}-{stamp}.db." + ("zst" if zstandard is not None else "gz")
+    snapshot_path = os.path.join(backup_dir, file_name)
+
+    with tempfile.TemporaryDirectory(dir=backup_dir) as workdir:
+        copy_path = os.path.join(workdir, "snapshot.db")
+        stats = copy_database(source_path, copy_path, step_pages, step_sleep_ms)
+        raw_bytes = os.path.getsize(copy_path)
+        sha256 = _sha256(copy_path)
+        compress_started = time.perf_counter()
+        partial_path = os.path.join(workdir, file_name)
+        _compress(copy_path, partial_path)
+        compress_seconds = time.perf_counter() - compress_started
+        os.replace(partial_path, snapshot_path)
+
+    manifest = {
+        "file": file_name,
+        "created_at": created_at.isoformat(timespec="microseconds"),
+        "source": source_path,
+        "raw_bytes": raw_bytes,
+        "stored_bytes": os.path.getsize(snapshot_path),
+        "sha256": sha256,
+        "copy_seconds": stats["seconds"],
+        "compress_seconds": round(compress_seconds, 3),
+        "steps": stats["steps"],
+        "restarts": stats["restarts"],
+        "wal": stats["wal"],
+    }
+    with open(_manifest_path(snapshot_path), "w") as f:
+        json.dump(manifest, f, indent=2)
+    rotate(backup_dir, keep)
+    manifest["path"] = snapshot_path
+    return manifest
+
+
+def _load_manifest(snapshot_path):
+    manifest_path = _manifest_path(snapshot_path)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path) as f:
+        return json.load(f)
+
+
+def verify_snapshot(snapshot_path, keep_copy_at=None):
+    """
+    Decompress a snapshot and check it. Returns {"ok", "problems", "tables"};
+    with keep_copy_at the decompressed database is left at that path.
+    """
+    problems = []
+    tables = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        copy_path = keep_copy_at or os.path.join(workdir, "verify.db")
+        _decompress(snapshot_path, copy_path)
+
+        manifest = _load_manifest(snapshot_path)
+        if manifest is None:
+            problems.append("manifest missing; hash not checked")
+        elif _sha256(copy_path) != manifest["sha256"]:
+            problems.append("sha256 does not match the manifest")
+
+        conn = sqlite3.connect(f"file:{copy_path}?mode=ro", uri=True)
+        try:
+            integrity = [row[0] for row in conn.execute("PRAGMA integrity_check")]
+            if integrity != ["ok"]:
+                problems.extend(integrity[:10])
+            for (name,) in conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table' AND name IN "
+                "('users', 'mood_entries', 'settings', 'mood_entry_archive', 'daily_summaries')"
+            ):
+                tables[name] = conn.execute(f'SELECT COUNT(*) FROM "{name}"').fetchone()[0]
+        except sqlite3.DatabaseError as e:
+            problems.append(str(e))
+        finally:
+            conn.close()
+    return {"ok": not problems, "problems": problems, "tables": tables}
+
+
+def restore_snapshot(snapshot_path, target_path=None, backup_dir=BACKUP_DIR, safety_backup=True):
+    """
+    Replace the target database's contents with a verified snapshot. The
+    current contents are saved as a snapshot first. Stop the API before
+    restoring: the file stays consistent, but running workers keep cached
+    state (settings, trends) from before.
+    """
+    target_path = target_path or database_path()
+    with tempfile.TemporaryDirectory() as workdir:
+        copy_path = os.path.join(workdir, "restore.db")
+        result = verify_snapshot(snapshot_path, keep_copy_at=copy_path)
+        if not result["ok"]:
+            raise BackupError("snapshot failed verification: " + "; ".join(result["problems"]))
+
+        safety = None
+        if safety_backup and os.path.exists(target_path):
+            safety = backup_now(target_path, backup_dir, keep=KEEP + 1, label="pre-restore")
+
+        source = sqlite3.connect(copy_path)
+        target = sqlite3.connect(target_path, timeout=30)
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
+    return {"tables": result["tables"], "safety_backup": safety["path"] if safety else None}
+
+
+class BackupJob:
+    """Takes a snapshot every INTERVAL_MINUTES in whichever process holds the backup lock"""
+
+    def __init__(self, interval_minutes=INTERVAL_MINUTES, backup_dir=BACKUP_DIR, lock_path=LOCK_PATH):
+        self.interval = interval_minutes * 60
+        self.backup_dir = backup_dir
+        self.lock_path = lock_path
+        self._lock_file = None
+        self._stop = threading.Event()
+        self._thread = None
+        self.last = None
+        self.failures = 0
+
+    def start(self):
+        if self.interval <= 0 or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="backup-job", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    def seconds_until_due(self):
+        """Based on the newest snapshot on disk, so restarts don't trigger extra backups"""
+        snapshots = list_snapshots(self.backup_dir)
+        if not snapshots:
+            return 0
+        age = (datetime.utcnow() - datetime.fromisoformat(snapshots[0]["created_at"])).total_seconds()
+        return max(self.interval - age, 0)
+
+    def _run(self):
+        while not self._stop.is_set():
+            if self._lock_file is None:
+                self._lock_file = try_lock(self.lock_path)
+                if self._lock_file is None:
+                    self._stop.wait(min(self.interval, 300))
+                    continue
+            wait = self.seconds_until_due()
+            if wait > 0:
+                self._stop.wait(wait)
+                continue
+            try:
+                self.last = backup_now(backup_dir=self.backup_dir)
+                print(f"💾 Backup {self.last['file']}: {self.last['stored_bytes'] / 1e6:.1f} MB "
+                      f"in {self.last['copy_seconds'] + self.last['compress_seconds']:.1f}s")
+            except Exception as e:
+                self.failures += 1
+                print(f"Backup failed: {e}")
+                self._stop.wait(min(self.interval, 300))
+
+    def stats(self):
+        return {
+            "interval_minutes": self.interval / 60,
+            "holder": self._lock_file is not None,
+            "failures": self.failures,
+            "last": {k: v for k, v in self.last.items() if k != "path"} if self.last else None,
+        }
+
+
+job = BackupJob()
@@ -0,0 +1,140 @@
+"""
+A/B benchmark: one combined completion (reply + sentiment as JSON) against
+the two-call path (EliAI.chat, then EliAI.analyze_sentiment).
+
+Usage: python benchmark_combined_call.py [--rounds 3] [--engine llm]
+
+Each phrase is sent through both paths every round (alternating which goes
+first) and the script reports latency, requests and tokens per check-in,
+how often the combined JSON failed validation, and how closely the combined
+sentiment agrees with the two-call score. Needs OPENAI_API_KEY; every round
+makes real API calls.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import eli_ai
+from eli_ai import eli
+
+test_phrases = [
+    "I'm feeling overwhelmed today",
+    "Things are going well",
+    "I need someone to talk to",
+    "Feeling anxious",
+    "I'm so happy today!",
+    "Everything is terrible",
+    "Just checking in",
+    "I accomplished something today",
+    "I'm worried about tomorrow",
+    "My parole officer said I'm doing great, but I still can't find a job",
+]
+
+history = [
+    {"user_message": "I had a rough night", "eli_response": "I'm sorry to hear that. What made it rough?"},
+    {"user_message": "Couldn't sleep, kept thinking about my interview",
+     "eli_response": "That sounds stressful. How are you feeling about it now?"},
+]
+
+usage = {"requests": 0, "prompt_tokens": 0, "completion_tokens": 0}
+_complete = eli._complete
+
+
+def counting_complete(priority, **kwargs):
+    response = _complete(priority, **kwargs)
+    usage["requests"] += 1
+    if getattr(response, "usage", None) is not None:
+        usage["prompt_tokens"] += response.usage.prompt_tokens
+        usage["completion_tokens"] += response.usage.completion_tokens
+    return response
+
+
+eli._complete = counting_complete
+
+
+def run(path, phrase):
+    """Returns (seconds, sentiment_data or None, usage delta)"""
+    before = dict(usage)
+    start = time.perf_counter()
+    if path == "two-call":
+        eli.chat(phrase, history)
+        sentiment = eli.analyze_sentiment(phrase)
+    else:
+        try:
+            _, sentiment = eli.chat_with_sentiment(phrase, history)
+        except Exception as e:
+            print(f"  combined call failed validation: {e}")
+            sentiment = None
+    elapsed = time.perf_counter() - start
+    return elapsed, sentiment, {k: usage[k] - before[k] for k in usage}
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the combined and two-call chat paths")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--engine", default="llm", choices=["llm", "auto", "local"],
+                        help="Sentiment engine for the two-call path (default: llm)")
+    args = parser.parse_args()
+
+    if not eli_ai.OPENAI_API_KEY:
+        sys.exit("ERROR: OPENAI_API_KEY is not set")
+    eli_ai.SENTIMENT_ENGINE = args.engine
+
+    results = {"two-call": [], "combined": []}
+    pairs = []
+
+    print("=" * 80)
+    print("COMBINED CALL BENCHMARK")
+    print("=" * 80)
+    print(f"{len(test_phrases)} phrases x {args.rounds} rounds, two-call sentiment engine: {args.engine}")
+
+    for round_number in range(args.rounds):
+        order = ["two-call", "combined"] if round_number % 2 == 0 else ["combined", "two-call"]
+        for phrase in test_phrases:
+            sentiments = {}
+            for path in order:
+                elapsed, sentiment, delta = run(path, phrase)
+                results[path].append((elapsed, delta, sentiment is not None))
+                sentiments[path] = sentiment
+            if sentiments["combined"] is not None:
+                pairs.append((phrase, sentiments["two-call"], sentiments["combined"]))
+        print(f"  round {round_number + 1}/{args.rounds} done")
+
+    print(f"\n{'path':<10} {'p50 ms':>8} {'p95 ms':>8} {'req/check-in':>13} {'prompt tok':>11} {'compl tok':>10} {'valid':>7}")
+    for path, rows in results.items():
+        latencies = [row[0] * 1000 for row in rows]
+        n = len(rows)
+        print(f"{path:<10} {statistics.median(latencies):>8.0f} {percentile(latencies, 95):>8.0f} "
+              f"{sum(r[1]['requests'] for r in rows) / n:>13.2f} "
+              f"{sum(r[1]['prompt_tokens'] for r in rows) / n:>11.0f} "
+              f"{sum(r[1]['completion_tokens'] for r in rows) / n:>10.0f} "
+              f"{sum(r[2] for r in rows) / n:>7.0%}")
+
+    print("\nAGREEMENT (combined vs two-call)")
+    if not pairs:
+        print("  no valid combined responses")
+        return
+    diffs = [abs(combined["polarity"] - two_call["polarity"]) for _, two_call, combined in pairs]
+    same_label = sum(two_call["label"] == combined["label"] for _, two_call, combined in pairs)
+    print(f"  label agreement:      {same_label / len(pairs):.0%} ({same_label}/{len(pairs)})")
+    print(f"  mean |polarity diff|: {statistics.mean(diffs):.3f}")
+    print(f"  max |polarity diff|:  {max(diffs):.3f}")
+
+    print("\nPER PHRASE (last round)")
+    for phrase, two_call, combined in pairs[-len(test_phrases):]:
+        print(f"  {two_call['polarity']:>6.2f} {combined['polarity']:>6.2f}  {phrase}")
+
+    print("\n" + "=" * 80)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+"""
+Microbenchmarks for the eli_ai and auth hot paths, with saved baselines
+
+Usage: python benchmark_components.py [--save] [--check] [--only NAME,...]
+                                      [--baseline PATH] [--tolerance 0.25]
+
+Times each component in isolation (no network, no database) and reports the
+best and median time per operation over --repeats runs:
+
+  sentiment_llm       EliAI.analyze_sentiment through a stubbed OpenAI client
+  sentiment_textblob  the TextBlob fallback when the OpenAI call fails
+  mood_tags           EliAI.get_mood_tags
+  chat_prompt         EliAI.chat (prompt assembly with history) on the stub
+  jwt_encode          auth.create_access_token
+  jwt_decode          decoding and verifying that token
+  bcrypt_verify       User.check_password
+  entries_serialize   MoodEntryResponse validation + JSON for 50 entries
+
+--save writes the results to the baseline file (default
+benchmark_baseline.json next to this script). --check compares against it
+and exits with code 1 if any benchmark's best time got slower by more than
+--tolerance. Baselines only mean something on the machine that recorded
+them, so record one there first (e.g. on the CI runner).
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import timeit
+import types
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+
+PHRASES = [
+    "I'm feeling overwhelmed today",
+    "Things are going well",
+    "I need someone to talk to",
+    "Feeling anxious",
+    "I'm so happy today!",
+    "Everything is terrible",
+    "Just checking in",
+    "I accomplished something today",
+]
+
+HISTORY = [
+    {"user_message": "I had a rough night", "eli_response": "I'm sorry to hear that. What made it rough?"},
+    {"user_message": "Couldn't sleep, kept thinking about my interview",
+     "eli_response": "That sounds stressful. How are you feeling about it now?"},
+    {"user_message": "A bit better after coffee", "eli_response": "Small comforts count. What's next on your plate today?"},
+]
+
+
+class StubClient:
+    """Answers every completion instantly, or raises if fail=True"""
+
+    def __init__(self, content, fail=False):
+        message = types.SimpleNamespace(content=content)
+        usage = types.SimpleNamespace(prompt_tokens=0, completion_tokens=0, total_tokens=0)
+        self._response = types.SimpleNamespace(choices=[types.SimpleNamespace(message=message)], usage=usage)
+        self._fail = fail
+        self.chat = types.SimpleNamespace(completions=types.SimpleNamespace(create=self.create))
+
+    def create(self, **kwargs):
+        if self._fail:
+            raise RuntimeError("stubbed failure")
+        return self._response
+
+
+def _cycle(values):
+    state = {"i": 0}
+
+    def next_value():
+        state["i"] += 1
+        return values[state["i"] % len(values)]
+    return next_value
+
+
+def build_benchmarks():
+    """name -> zero-argument callable doing one operation"""
+    import jwt
+
+    import auth
+    import eli_ai
+    from database import MoodEntry, User
+    from eli_ai import EliAI
+
+    # Measure the OpenAI path, not the local model
+    eli_ai.SENTIMENT_ENGINE = "llm"
+    phrase = _cycle(PHRASES)
+
+    scoring = EliAI()
+    scoring.client = StubClient('{"score": -0.4, "reasoning": "Stressed"}')
+    failing = EliAI()
+    failing.client = StubClient("", fail=True)
+    failing.analyze_sentiment("warm up TextBlob")
+    chatting = EliAI()
+    chatting.client = StubClient("That sounds like a lot. What's weighing on you most?")
+
+    sentiments = [scoring.analyze_sentiment(p) for p in PHRASES] + [failing.analyze_sentiment(p) for p in PHRASES]
+    sentiment = _cycle(sentiments)
+
+    token = auth.create_access_token({"sub": 42})
+
+    user = User(username="bench", email="bench@example.com")
+    user.set_password("correct horse battery staple")
+
+    from typing import List
+    from pydantic import TypeAdapter
+    from main import MoodEntryResponse
+
+    now = datetime.utcnow()
+    entries = [
+        MoodEntry(
+            id=i, user_id=1, user_message=PHRASES[i % len(PHRASES)],
+            eli_response=HISTORY[i % len(HISTORY)]["eli_response"],
+            sentiment_score=0.25 + (i % 5) / 10, sentiment_label="neutral", mood_tags="calm, reflective",
+            created_at=now - timedelta(hours=i)
+        )
+        for i in range(50)
+    ]
+    adapter = TypeAdapter(List[MoodEntryResponse])
+
+    def serialize_entries():
+        # What FastAPI does with a response_model: validate, dump to JSON types, encode
+        value = adapter.validate_python(entries, from_attributes=True)
+        return json.dumps(adapter.dump_python(value, mode="json"))
+
+    return {
+        "sentiment_llm": lambda: scoring.analyze_sentiment(phrase()),
+        "sentiment_textblob": lambda: failing.analyze_sentiment(phrase()),
+        "mood_tags": lambda: scoring.get_mood_tags(sentiment()),
+        "chat_prompt": lambda: chatting.chat(phrase(), HISTORY),
+        "jwt_encode": lambda: auth.create_access_token({"sub": 42}),
+        "jwt_decode": lambda: jwt.decode(token, auth.SECRET_KEY, algorithms=[auth.ALGORITHM]),
+        "bcrypt_verify": lambda: user.check_password("correct horse battery staple"),
+        "entries_serialize": serialize_entries,
+    }
+
+
+def measure(fn, repeats, min_seconds):
+    """(best, median) seconds per call; each repeat runs long enough to time reliably"""
+    timer = timeit.Timer(fn)
+    loops, _ = timer.autorange()
+    loops = max(1, int(loops * min_seconds / 0.2))
+    per_call = [t / loops for t in timer.repeat(repeat=repeats, number=loops)]
+    return min(per_call), statistics.median(per_call), loops
+
+
+def environment():
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "processor": platform.processor() or None,
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def format_us(seconds):
+    us = seconds * 1e6
+    return f"{us:,.1f} us" if us < 10000 else f"{us / 1000:,.1f} ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmarks for eli_ai and auth hot paths")
+    parser.add_argument("--save", action="store_true", help="Write the results as the new baseline")
+    parser.add_argument("--check", action="store_true", help="Fail if slower than the baseline")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Allowed slowdown of the best time before --check fails (0.25 = 25%%)")
+    parser.add_argument("--only", help="Comma-separated benchmark names")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--min-seconds", type=float, default=0.2, help="Minimum duration of one repeat")
+    args = parser.parse_args()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        benchmarks = build_benchmarks()
+    if args.only:
+        names = [name.strip() for name in args.only.split(",")]
+        unknown = [name for name in names if name not in benchmarks]
+        if unknown:
+            sys.exit(f"ERROR: unknown benchmark(s): {', '.join(unknown)}")
+        benchmarks = {name: benchmarks[name] for name in names}
+
+    print("=" * 60)
+    print("COMPONENT BENCHMARKS")
+    print("=" * 60)
+
+    results = {}
+    for name, fn in benchmarks.items():
+        # The fallback paths print on every call
+        with contextlib.redirect_stdout(io.StringIO()):
+            best, median, loops = measure(fn, args.repeats, args.min_seconds)
+        results[name] = {"best_s": best, "median_s": median, "loops": loops}
+        print(f"  {name:<20} best {format_us(best):>12}   median {format_us(median):>12}   ({loops} loops)")
+
+    failed = False
+    if args.check:
+        if not os.path.exists(args.baseline):
+            sys.exit(f"ERROR: no baseline at {args.baseline}; record one with --save")
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+        print("\n" + "=" * 60)
+        print(f"COMPARED WITH BASELINE ({baseline['recorded_at']})")
+        print("=" * 60)
+        if baseline["environment"] != environment():
+            print("  WARNING: the baseline was recorded on a different machine or Python")
+        for name, result in results.items():
+            before = baseline["results"].get(name)
+            if before is None:
+                print(f"  {name:<20} no baseline")
+                continue
+            change = result["best_s"] / before["best_s"] - 1
+            status = "SLOWER" if change > args.tolerance else "ok"
+            failed = failed or status == "SLOWER"
+            print(f"  {name:<20} {format_us(before['best_s']):>12} -> {format_us(result['best_s']):>12}   "
+                  f"{change * 100:+6.1f}%   {status}")
+
+    if args.save:
+        with open(args.baseline, "w") as f:
+            json.dump({
+                "recorded_at": datetime.utcnow().isoformat(timespec="seconds"),
+                "environment": environment(),
+                "results": results,
+            }, f, indent=2)
+        print(f"\nBaseline saved to {args.baseline}")
+
+    if failed:
+        print(f"\nFAILED: at least one benchmark is more than {args.tolerance * 100:.0f}% slower than its baseline")
+        sys.exit(1)
+    if args.check:
+        print("\nOK")
+
+
+if __name__ == "__main__":
+    main()
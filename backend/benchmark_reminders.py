@@ -0,0 +1,112 @@
+"""
+Benchmark the reminder timing wheel at scale
+
+Usage: python benchmark_reminders.py [--users 300000] [--seed 7]
+
+Loads synthetic users (random reminder times across a spread of timezones)
+into a ReminderWheel in memory, then runs one simulated day minute by minute
+and reports load time, memory, per-tick cost and deliveries. For comparison
+it also times one pass of the naive approach: checking every user's local
+time each minute.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from reminders import ReminderWheel, epoch_minute
+from timezones import get_zone
+
+ZONES = [
+    "UTC", "America/New_York", "America/Chicago", "America/Denver", "America/Los_Angeles",
+    "America/Sao_Paulo", "Europe/London", "Europe/Berlin", "Europe/Moscow", "Africa/Lagos",
+    "Asia/Kolkata", "Asia/Shanghai", "Asia/Tokyo", "Australia/Sydney", "Pacific/Auckland",
+    "Asia/Kathmandu",
+]
+
+
+class CountingSink:
+    def __init__(self):
+        self.delivered = 0
+
+    def deliver(self, reminders):
+        self.delivered += len(reminders)
+
+
+def synthetic_settings(n_users, seed):
+    rng = random.Random(seed)
+    for user_id in range(1, n_users + 1):
+        # Most people pick a round time in the morning or evening
+        hour = rng.choice([7, 8, 8, 9, 9, 9, 12, 18, 20, 21, 21, 22])
+        minute = rng.choice([0, 0, 0, 15, 30, 30, 45, rng.randrange(60)])
+        yield user_id, 1, f"{hour:02d}:{minute:02d}", rng.choice(ZONES)
+
+
+def naive_scan(rows, now):
+    """What a scheduler without the wheel does every minute"""
+    due = 0
+    for _, _, reminder_time, tz_name in rows:
+        local = now.astimezone(get_zone(tz_name))
+        if f"{local.hour:02d}:{local.minute:02d}" == reminder_time:
+            due += 1
+    return due
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the reminder timing wheel")
+    parser.add_argument("--users", type=int, default=300000)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("REMINDER WHEEL BENCHMARK")
+    print("=" * 60)
+    print(f"  users: {args.users:,}   timezones: {len(ZONES)}")
+
+    rows = list(synthetic_settings(args.users, args.seed))
+    start_minute = epoch_minute()
+    sink = CountingSink()
+    wheel = ReminderWheel(sink)
+
+    started = time.perf_counter()
+    wheel.load(rows, start_minute)
+    load_seconds = time.perf_counter() - started
+
+    # Measured on a second wheel, since tracing slows the load down
+    tracemalloc.start()
+    traced = ReminderWheel(sink)
+    traced.load(rows, start_minute)
+    wheel_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    tick_ms = []
+    for minute in range(start_minute, start_minute + 24 * 60):
+        started = time.perf_counter()
+        wheel.advance(minute)
+        tick_ms.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    naive_scan(rows, datetime.now(timezone.utc))
+    naive_ms = (time.perf_counter() - started) * 1000
+
+    tick_ms.sort()
+    print("\n" + "=" * 60)
+    print("REPORT")
+    print("=" * 60)
+    print(f"  load:              {load_seconds * 1000:.0f} ms")
+    print(f"  wheel memory:      {wheel_bytes / 1e6:.1f} MB ({wheel_bytes / args.users:.0f} bytes per user)")
+    print(f"  delivered in 24h:  {sink.delivered:,} (every user exactly once: {sink.delivered == args.users})")
+    print(f"  tick p50:          {statistics.median(tick_ms):.3f} ms")
+    print(f"  tick p99:          {tick_ms[int(len(tick_ms) * 0.99)]:.3f} ms")
+    print(f"  tick max:          {tick_ms[-1]:.3f} ms (busiest minute)")
+    print(f"  naive scan:        {naive_ms:.0f} ms per minute, every minute")
+
+
+if __name__ == "__main__":
+    main()
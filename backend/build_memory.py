@@ -0,0 +1,145 @@
+"""
+Build the long-term memory index from the stored check-ins
+
+Usage: python build_memory.py [--user-id N] [--skip-idf] [--bench-queries 500]
+
+1. Counts in how many check-ins (hot and archived) each hashed word appears
+   and writes the IDF table (idf.npy in the memory directory)
+2. Rewrites every user's index file with the new weights (see memory.py)
+3. Times retrieval for random check-ins against their own user's index
+
+The app indexes new check-ins as they are saved, so this only needs to run
+once to backfill, and now and then to refresh the IDF weights. Safe while
+the app runs; a check-in saved while its user's file is being rewritten is
+left out until the next run.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+import zlib
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import func, select, union
+
+import archive
+import memory
+from database import ArchiveBlock, MoodEntry, SessionLocal, engine, init_db
+
+
+def iter_all_messages(conn):
+    """Every user_message, hot rows first, then the archive block by block"""
+    for (message,) in conn.execute(select(MoodEntry.user_message)).yield_per(5000):
+        yield message
+    for codec, payload in conn.execute(select(ArchiveBlock.codec, ArchiveBlock.payload)).yield_per(50):
+        for row in archive.decode_block(codec, payload):
+            yield row[2]
+
+
+def document_frequency():
+    """(per-word document counts, number of documents)"""
+    import numpy as np
+    df = np.zeros(memory.IDF_FEATURES, dtype=np.float64)
+    n_documents = 0
+    with engine.connect() as conn:
+        for message in iter_all_messages(conn):
+            hashed = {zlib.crc32(term.encode("utf-8")) % memory.IDF_FEATURES for term in memory.terms(message)}
+            df[list(hashed)] += 1
+            n_documents += 1
+    return df, n_documents
+
+
+def user_entries(db, user_id):
+    """[(entry_id, user_message)] for one user, archived entries first"""
+    entries = [(row[0], row[2]) for rows in archive.iter_user_blocks(db, user_id) for row in rows]
+    entries += db.query(MoodEntry.id, MoodEntry.user_message).filter(
+        MoodEntry.user_id == user_id
+    ).order_by(MoodEntry.id).all()
+    return entries
+
+
+def bench(db, n_queries):
+    """Search and recall latency (ms) for random hot check-ins, excluding themselves"""
+    sample = db.query(MoodEntry.id, MoodEntry.user_id, MoodEntry.user_message).order_by(
+        func.random()
+    ).limit(n_queries).all()
+    search_ms, recall_ms, found = [], [], 0
+    for entry_id, user_id, message in sample:
+        started = time.perf_counter()
+        matches = memory.index.search(user_id, message, exclude_ids=[entry_id])
+        search_ms.append((time.perf_counter() - started) * 1000)
+        started = time.perf_counter()
+        memory.recall(db, user_id, message, exclude_ids=[entry_id])
+        recall_ms.append((time.perf_counter() - started) * 1000)
+        found += bool(matches)
+    return search_ms, recall_ms, found
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the per-user memory index")
+    parser.add_argument("--user-id", type=int, help="Only rebuild this user's index")
+    parser.add_argument("--skip-idf", action="store_true", help="Keep the current IDF table")
+    parser.add_argument("--bench-queries", type=int, default=500, help="Queries to time afterwards (0 to skip)")
+    args = parser.parse_args()
+
+    init_db()
+
+    print("=" * 60)
+    print("BUILD MEMORY INDEX")
+    print("=" * 60)
+    print(f"\n  directory: {os.path.abspath(memory.MEMORY_DIR)}")
+
+    if not args.skip_idf:
+        started = time.perf_counter()
+        df, n_documents = document_frequency()
+        memory.index.save_idf(df, n_documents)
+        print(f"  IDF over {n_documents:,} check-ins, {int((df > 0).sum()):,} distinct words "
+              f"({time.perf_counter() - started:.1f}s)")
+    idf = memory.index.idf()
+    if idf is None:
+        print("  no IDF table yet; all words weigh the same")
+
+    db = SessionLocal()
+    try:
+        if args.user_id is not None:
+            user_ids = [args.user_id]
+        else:
+            user_ids = db.execute(union(
+                select(MoodEntry.user_id).distinct(), select(ArchiveBlock.user_id).distinct()
+            )).scalars().all()
+
+        started = time.perf_counter()
+        indexed = 0
+        for user_id in user_ids:
+            indexed += memory.index.rebuild_user(user_id, user_entries(db, user_id), idf)
+        elapsed = time.perf_counter() - started
+        sizes = [os.path.getsize(memory.index.user_path(u)) for u in user_ids
+                 if os.path.exists(memory.index.user_path(u))]
+        print(f"  indexed {indexed:,} check-ins for {len(user_ids):,} users in {elapsed:.1f}s")
+        if sizes:
+            print(f"  {sum(sizes) / 1e6:.1f} MB on disk, {sum(sizes) / max(indexed, 1):.0f} bytes per check-in, "
+                  f"largest user {max(sizes) / 1e3:.0f} KB")
+
+        if args.bench_queries and args.user_id is None and indexed:
+            search_ms, recall_ms, found = bench(db, args.bench_queries)
+            print("\n" + "=" * 60)
+            print("QUERY LATENCY")
+            print("=" * 60)
+            for name, values in (("search", search_ms), ("recall", recall_ms)):
+                print(f"  {name:<8} p50 {statistics.median(values):.3f} ms   p99 {percentile(values, 99):.3f} ms   "
+                      f"max {max(values):.3f} ms")
+            print(f"  {found}/{len(search_ms)} queries found at least one memory "
+                  f"(similarity >= {memory.MIN_SIMILARITY})")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+"""
+Small caches with hit/miss counters.
+
+Keys are strings; related keys share a prefix (e.g. "user:42:") so they can
+be invalidated together. Every cache registers itself so its stats can be
+reported from one place.
+
+Use make_cache() rather than the classes directly. In a single process it
+returns an in-memory Cache. When ELI_SHARED_CACHE_PATH is set (serve.py sets
+it for multi-worker runs) it returns a SharedCache backed by one SQLite file
+that every worker opens, so a value cached by one worker is a hit in all of
+them and invalidations reach every worker.
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+SHARED_CACHE_PATH = os.environ.get("ELI_SHARED_CACHE_PATH")
+
+_registry = {}
+# Connections a forked child found in its thread-locals; kept so they are never closed
+_inherited = []
+
+
+class Cache:
+    def __init__(self, name, max_entries=10000):
+        self.name = name
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        # Versions of the entries written with set_if_newer()
+        self._versions = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        _registry[name] = self
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def peek(self, key, default=None):
+        """Like get(), but without counting a hit or miss or touching LRU order"""
+        with self._lock:
+            return self._data.get(key, default)
+
+    def set(self, key, value):
+        with self._lock:
+            self._store(key, value, None)
+
+    def set_if_newer(self, key, value, version):
+        """Set unless the cached entry was written with a newer version; returns whether it was set"""
+        with self._lock:
+            current = self._versions.get(key)
+            if key in self._data and current is not None and current > version:
+                return False
+            self._store(key, value, version)
+            return True
+
+    def _store(self, key, value, version):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        if version is None:
+            self._versions.pop(key, None)
+        else:
+            self._versions[key] = version
+        while len(self._data) > self.max_entries:
+            evicted, _ = self._data.popitem(last=False)
+            self._versions.pop(evicted, None)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+            self._versions.pop(key, None)
+
+    def delete_prefix(self, prefix):
+        with self._lock:
+            for key in [k for k in self._data if k.startswith(prefix)]:
+                del self._data[key]
+                self._versions.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._versions.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+        }
+
+
+class SharedCache:
+    """
+    Cache stored in a SQLite file shared between worker processes.
+    Meant to live on tmpfs (/dev/shm): lookups are a primary-key read on a
+    local file, tens of microseconds, and never touch the main database.
+    Values are pickled, so only cache plain data.
+    """
+
+    # Trim back to max_entries after this many writes
+    EVICT_EVERY = 1000
+
+    def __init__(self, name, path, max_entries=10000):
+        self.name = name
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+        # serve.py imports this in the master and then forks, so no connection
+        # is kept from here; each process opens its own on first use
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        try:
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("""CREATE TABLE IF NOT EXISTS cache (
+                ns TEXT NOT NULL, key TEXT NOT NULL, value BLOB NOT NULL, updated REAL NOT NULL,
+                version REAL, PRIMARY KEY (ns, key)) WITHOUT ROWID""")
+        finally:
+            conn.close()
+        _registry[name] = self
+
+    def _conn(self):
+        """This thread's connection, opened by this process"""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid != os.getpid():
+            # Inherited across fork(): never use it, and don't close it either,
+            # since closing a parent's SQLite handle in the child is unsafe too
+            _inherited.append(conn)
+            conn = None
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            # Losing cache writes in a crash is harmless
+            conn.execute("PRAGMA synchronous = OFF")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key, default=None):
+        row = self._conn().execute(
+            "SELECT value FROM cache WHERE ns = ? AND key = ?", (self.name, key)
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return pickle.loads(row[0])
+
+    def peek(self, key, default=None):
+        row = self._conn().execute(
+            "SELECT value FROM cache WHERE ns = ? AND key = ?", (self.name, key)
+        ).fetchone()
+        return default if row is None else pickle.loads(row[0])
+
+    def set(self, key, value):
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO cache (ns, key, value, updated) VALUES (?, ?, ?, ?)",
+            (self.name, key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), time.time())
+        )
+        self._written(conn)
+
+    def set_if_newer(self, key, value, version):
+        """Set unless the cached entry was written with a newer version, atomically across workers"""
+        conn = self._conn()
+        cursor = conn.execute(
+            """INSERT INTO cache (ns, key, value, updated, version) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (ns, key) DO UPDATE SET
+                value = excluded.value, updated = excluded.updated, version = excluded.version
+            WHERE cache.version IS NULL OR cache.version <= excluded.version""",
+            (self.name, key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), time.time(), version)
+        )
+        self._written(conn)
+        return cursor.rowcount > 0
+
+    def _written(self, conn):
+        self._writes += 1
+        if self._writes % self.EVICT_EVERY == 0:
+            conn.execute("""DELETE FROM cache WHERE ns = ? AND key IN (
+                SELECT key FROM cache WHERE ns = ? ORDER BY updated DESC LIMIT -1 OFFSET ?)""",
+                (self.name, self.name, self.max_entries))
+
+    def delete(self, key):
+        self._conn().execute("DELETE FROM cache WHERE ns = ? AND key = ?", (self.name, key))
+
+    def delete_prefix(self, prefix):
+        # Range over the primary key instead of LIKE, so this stays an index seek
+        self._conn().execute(
+            "DELETE FROM cache WHERE ns = ? AND key >= ? AND key < ?",
+            (self.name, prefix, prefix + "\U0010ffff")
+        )
+
+    def clear(self):
+        self._conn().execute("DELETE FROM cache WHERE ns = ?", (self.name,))
+
+    def stats(self):
+        entries = self._conn().execute(
+            "SELECT COUNT(*) FROM cache WHERE ns = ?", (self.name,)
+        ).fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            "shared": True,
+            "pid": os.getpid(),
+        }
+
+
+def make_cache(name, max_entries=10000):
+    if SHARED_CACHE_PATH:
+        return SharedCache(name, SHARED_CACHE_PATH, max_entries=max_entries)
+    return Cache(name, max_entries=max_entries)
+
+
+def all_stats():
+    return {name: cache.stats() for name, cache in _registry.items()}
@@ -0,0 +1,92 @@
+"""
+Cold-start budget check for the API
+
+Usage: python check_import_time.py [--budget-ms 1200] [--runs 3]
+
+Imports main.py in a fresh interpreter under `python -X importtime` and
+fails (exit code 1) if:
+  - the cumulative import time of main (best of --runs) exceeds the budget
+  - any of the modules that are supposed to load lazily were imported
+
+Run it in CI so slow imports can't creep back into worker boot.
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Heavy modules that must only be imported on first use. (bcrypt is also
+# imported lazily by our code, but PyJWT's cryptography backend pulls it in
+# anyway; it costs under a millisecond.)
+LAZY_MODULES = ("openai", "textblob", "nltk", "numpy", "pyarrow")
+
+_LINE_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)$")
+
+
+def measure():
+    """Return ({module: cumulative_us} for top-level imports, set of all imported modules)"""
+    env = dict(os.environ, OPENAI_API_KEY=os.environ.get("OPENAI_API_KEY", "import-time-check"))
+    # Run from an empty directory so nothing touches a real database
+    with tempfile.TemporaryDirectory() as workdir:
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c",
+             f"import sys; sys.path.insert(0, {BACKEND_DIR!r}); import main"],
+            cwd=workdir, env=env, capture_output=True, text=True
+        )
+    if result.returncode != 0:
+        print(result.stderr)
+        raise SystemExit("ERROR: importing main failed")
+
+    top_level = {}
+    modules = set()
+    for line in result.stderr.splitlines():
+        match = _LINE_RE.match(line)
+        if not match:
+            continue
+        _, cumulative, indent, name = match.groups()
+        modules.add(name)
+        if not indent:
+            top_level[name] = int(cumulative)
+    return top_level, modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fail if importing the API gets slower than the budget")
+    parser.add_argument("--budget-ms", type=float,
+                        default=float(os.environ.get("IMPORT_TIME_BUDGET_MS", "1200")))
+    parser.add_argument("--runs", type=int, default=3, help="Take the best of this many runs")
+    args = parser.parse_args()
+
+    best = None
+    for _ in range(args.runs):
+        top_level, modules = measure()
+        if best is None or top_level["main"] < best[0]["main"]:
+            best = (top_level, modules)
+    top_level, modules = best
+    total_ms = top_level["main"] / 1000
+
+    print("=" * 60)
+    print("IMPORT TIME CHECK")
+    print("=" * 60)
+    print(f"\n  import main: {total_ms:.0f} ms (budget {args.budget_ms:.0f} ms)")
+
+    failed = False
+    eager = [name for name in LAZY_MODULES if name in modules]
+    if eager:
+        print(f"\nFAILED: these modules should load lazily but were imported: {', '.join(eager)}")
+        failed = True
+    if total_ms > args.budget_ms:
+        print(f"\nFAILED: import time is over budget by {total_ms - args.budget_ms:.0f} ms")
+        failed = True
+
+    if failed:
+        sys.exit(1)
+    print("\nOK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""
+Compress mood_entries.eli_response in place and report the effect
+
+Usage: python compress_text.py [--samples 20000] [--retrain] [--batch-size 5000] [--vacuum] [--report-only]
+
+1. Trains a zstd dictionary on a random sample of Eli's replies (first run,
+   or with --retrain) and stores it in compression_dictionaries
+2. Rewrites every row still stored as plain text (and, after --retrain,
+   rows compressed with an older dictionary) in keyset-paginated batches
+3. Reports table size before and after, and the per-value compress and
+   decompress cost plus the cost of reading replies through the ORM
+
+Safe to run while the app is up: plain and compressed rows are both
+readable, and each batch is its own short transaction. Processes that are
+already running keep writing with the dictionary they loaded at startup
+until they restart.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import bindparam, func, select, text, update
+
+import compressed_text
+from database import engine, init_db, CompressionDictionary, MoodEntry
+
+COLUMN = "mood_entries.eli_response"
+
+
+def table_bytes(conn):
+    return conn.exec_driver_sql(
+        "SELECT COALESCE(SUM(pgsize), 0) FROM dbstat WHERE name = 'mood_entries'"
+    ).scalar()
+
+
+def storage_counts(conn):
+    """(plain rows, compressed rows)"""
+    rows = dict(conn.exec_driver_sql(
+        "SELECT typeof(eli_response), COUNT(*) FROM mood_entries GROUP BY 1"
+    ).all())
+    return rows.get("text", 0), rows.get("blob", 0)
+
+
+def time_reads(n_rows):
+    """Seconds to load n_rows replies through the column type"""
+    start = time.perf_counter()
+    with engine.connect() as conn:
+        values = conn.execute(select(MoodEntry.eli_response).order_by(MoodEntry.id).limit(n_rows)).scalars().all()
+    return time.perf_counter() - start, len(values)
+
+
+def sample_replies(conn, n):
+    return conn.execute(
+        select(MoodEntry.eli_response).order_by(func.random()).limit(n)
+    ).scalars().all()
+
+
+def train(samples):
+    with engine.connect() as conn:
+        replies = sample_replies(conn, samples)
+    if len(replies) < 1000:
+        print(f"  only {len(replies)} replies stored; compressing without a dictionary for now")
+        return None
+    started = time.perf_counter()
+    dict_data = compressed_text.train_dictionary(replies)
+    with engine.begin() as conn:
+        dict_id = conn.execute(CompressionDictionary.__table__.insert().values(
+            column=COLUMN, dict_data=dict_data, sample_count=len(replies)
+        )).inserted_primary_key[0]
+    compressed_text.load_dictionaries(engine)
+    print(f"  trained dictionary {dict_id}: {len(dict_data) / 1024:.0f} KB from "
+          f"{len(replies)} samples in {time.perf_counter() - started:.1f}s")
+    return dict_id
+
+
+def rewrite(batch_size, current_dict_id):
+    """Recompress rows that are plain text or use an older dictionary"""
+    stale = "typeof(eli_response) = 'text'"
+    if current_dict_id:
+        # Bytes 2-5 of a compressed value hold its dictionary id
+        stale += f" OR substr(eli_response, 2, 4) != x'{current_dict_id.to_bytes(4, 'little').hex()}'"
+    statement = update(MoodEntry).where(MoodEntry.id == bindparam("entry_id")).values(
+        eli_response=bindparam("reply")
+    )
+    last_id = 0
+    total = 0
+    started = time.perf_counter()
+    while True:
+        with engine.begin() as conn:
+            batch_last = conn.exec_driver_sql(
+                "SELECT MAX(id) FROM (SELECT id FROM mood_entries WHERE id > ? ORDER BY id LIMIT ?)",
+                (last_id, batch_size)
+            ).scalar()
+            if batch_last is None:
+                break
+            stale_rows = conn.execute(
+                select(MoodEntry.id, MoodEntry.eli_response)
+                .where(MoodEntry.id > last_id, MoodEntry.id <= batch_last)
+                .where(text(f"({stale})"))
+            ).all()
+            if stale_rows:
+                conn.execute(statement, [{"entry_id": i, "reply": reply} for i, reply in stale_rows])
+            total += len(stale_rows)
+        last_id = batch_last
+        rate = total / max(time.perf_counter() - started, 1e-9)
+        print(f"  {total:>10,} rows rewritten  ({rate:,.0f} rows/s)")
+    return total, time.perf_counter() - started
+
+
+def microbench(replies):
+    """Median microseconds to compress and decompress one reply"""
+    compress_us, decompress_us = [], []
+    for reply in replies:
+        start = time.perf_counter()
+        packed = compressed_text.compress_text(reply)
+        middle = time.perf_counter()
+        compressed_text.decompress_text(packed)
+        end = time.perf_counter()
+        compress_us.append((middle - start) * 1e6)
+        decompress_us.append((end - middle) * 1e6)
+    return statistics.median(compress_us), statistics.median(decompress_us)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compress Eli's replies in place")
+    parser.add_argument("--samples", type=int, default=20000, help="Replies to train the dictionary on")
+    parser.add_argument("--retrain", action="store_true", help="Train a new dictionary even if one exists")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--read-rows", type=int, default=20000, help="Rows to time reads on")
+    parser.add_argument("--vacuum", action="store_true", help="VACUUM afterwards so the file shrinks")
+    parser.add_argument("--report-only", action="store_true")
+    args = parser.parse_args()
+
+    if not compressed_text.zstd_available():
+        sys.exit("ERROR: the zstandard package is required (pip install zstandard)")
+
+    init_db()
+
+    print("=" * 60)
+    print("COMPRESS ELI RESPONSES")
+    print("=" * 60)
+
+    with engine.connect() as conn:
+        before_bytes = table_bytes(conn)
+        plain, packed = storage_counts(conn)
+    before_read, n_read = time_reads(args.read_rows)
+    print(f"\n  mood_entries: {before_bytes / 1e6:.1f} MB, {plain:,} plain and {packed:,} compressed replies")
+    print(f"  reading {n_read:,} replies: {before_read * 1000:.0f} ms")
+    if args.report_only:
+        return
+
+    dict_id = compressed_text._current_dict_id
+    if args.retrain or not dict_id:
+        print("\n>> Training dictionary")
+        dict_id = train(args.samples) or dict_id
+
+    print("\n>> Rewriting rows")
+    total, elapsed = rewrite(args.batch_size, dict_id)
+
+    if args.vacuum:
+        print("\n>> Vacuuming")
+        with engine.connect() as conn:
+            conn.exec_driver_sql("VACUUM")
+
+    with engine.connect() as conn:
+        after_bytes = table_bytes(conn)
+        plain, packed = storage_counts(conn)
+        replies = sample_replies(conn, 2000)
+    after_read, n_read = time_reads(args.read_rows)
+    compress_us, decompress_us = microbench(replies)
+
+    print("\n" + "=" * 60)
+    print("REPORT")
+    print("=" * 60)
+    print(f"  rows rewritten:    {total:,} in {elapsed:.1f}s")
+    print(f"  storage:           {plain:,} plain, {packed:,} compressed")
+    print(f"  mood_entries size: {before_bytes / 1e6:.1f} MB -> {after_bytes / 1e6:.1f} MB "
+          f"({(1 - after_bytes / before_bytes) * 100 if before_bytes else 0:.0f}% smaller)"
+          + ("" if args.vacuum else "; run with --vacuum to return the space to the OS"))
+    print(f"  write overhead:    {compress_us:.1f} us per reply (median)")
+    print(f"  read overhead:     {decompress_us:.1f} us per reply (median)")
+    print(f"  reading {n_read:,} replies: {before_read * 1000:.0f} ms -> {after_read * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Transparently compressed text columns.
+
+CompressedText is a SQLAlchemy type that stores a string as a small header
+plus a zstd frame, compressed with a dictionary trained on the column's own
+data and stored in the compression_dictionaries table. Short, repetitive
+strings like Eli's replies compress poorly on their own but well against a
+shared dictionary.
+
+Stored value layout:
+
+    b"\\x01" + dictionary id (4 bytes, little endian, 0 = no dictionary) + zstd frame
+
+Values that don't get smaller are stored as plain text, and plain text is
+always readable, so existing rows keep working until compress_text.py has
+rewritten them and the migration can run while the app is up.
+
+Writers use the newest dictionary loaded in the process (load_dictionaries()
+runs from init_db()); readers fetch any dictionary they haven't seen yet on
+first use, so a dictionary trained by another process is picked up
+automatically.
+"""
+import struct
+import threading
+
+from sqlalchemy import Text
+from sqlalchemy.types import TypeDecorator
+
+ZSTD_LEVEL = 6
+
+_HEADER = b"\x01"
+_DICT_ID = struct.Struct("<I")
+_PREFIX_LEN = len(_HEADER) + _DICT_ID.size
+
+_dictionaries = {}
+_current_dict_id = 0
+_bind = None
+_lock = threading.Lock()
+# zstd (de)compressor objects can't be shared between threads
+_local = threading.local()
+
+
+def zstd_available():
+    try:
+        import zstandard  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def load_dictionaries(bind):
+    """Load every stored dictionary and write with the newest one from now on"""
+    global _bind, _current_dict_id
+    _bind = bind
+    with bind.connect() as conn:
+        rows = conn.exec_driver_sql(
+            "SELECT id, dict_data FROM compression_dictionaries ORDER BY id"
+        ).all()
+    with _lock:
+        for dict_id, data in rows:
+            _dictionaries[dict_id] = data
+        _current_dict_id = rows[-1][0] if rows else 0
+    _local.__dict__.clear()
+
+
+def _dictionary(dict_id):
+    data = _dictionaries.get(dict_id)
+    if data is None:
+        if _bind is None:
+            raise RuntimeError(f"compression dictionary {dict_id} is needed but none are loaded")
+        with _bind.connect() as conn:
+            row = conn.exec_driver_sql(
+                "SELECT dict_data FROM compression_dictionaries WHERE id = ?", (dict_id,)
+            ).first()
+        if row is None:
+            raise RuntimeError(f"compression dictionary {dict_id} does not exist")
+        with _lock:
+            data = _dictionaries.setdefault(dict_id, row[0])
+    return data
+
+
+def _compressor():
+    import zstandard
+
+    dict_id = _current_dict_id
+    cached = getattr(_local, "compressor", None)
+    if cached is None or cached[0] != dict_id:
+        dict_data = zstandard.ZstdCompressionDict(_dictionary(dict_id)) if dict_id else None
+        compressor = zstandard.ZstdCompressor(
+            level=ZSTD_LEVEL, dict_data=dict_data, write_checksum=False, write_dict_id=False
+        )
+        cached = _local.compressor = (dict_id, compressor)
+    return cached
+
+
+def _decompressor(dict_id):
+    import zstandard
+
+    decompressors = getattr(_local, "decompressors", None)
+    if decompressors is None:
+        decompressors = _local.decompressors = {}
+    decompressor = decompressors.get(dict_id)
+    if decompressor is None:
+        dict_data = zstandard.ZstdCompressionDict(_dictionary(dict_id)) if dict_id else None
+        decompressor = decompressors[dict_id] = zstandard.ZstdDecompressor(dict_data=dict_data)
+    return decompressor
+
+
+def compress_text(value):
+    """bytes in the stored layout, or the string itself if compression doesn't pay"""
+    raw = value.encode("utf-8")
+    dict_id, compressor = _compressor()
+    packed = _HEADER + _DICT_ID.pack(dict_id) + compressor.compress(raw)
+    return packed if len(packed) < len(raw) else value
+
+
+def decompress_text(value):
+    if isinstance(value, str):
+        return value
+    if value[:1] != _HEADER:
+        raise ValueError("unrecognized compressed text header")
+    (dict_id,) = _DICT_ID.unpack_from(value, 1)
+    return _decompressor(dict_id).decompress(value[_PREFIX_LEN:]).decode("utf-8")
+
+
+def train_dictionary(samples, dict_size=64 * 1024):
+    """Train a zstd dictionary from a list of strings"""
+    import zstandard
+
+    return zstandard.train_dictionary(dict_size, [s.encode("utf-8") for s in samples]).as_bytes()
+
+
+class CompressedText(TypeDecorator):
+    """Text column stored zstd-compressed against a shared dictionary"""
+
+    impl = Text
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None or not zstd_available():
+            return value
+        return compress_text(value)
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return decompress_text(value)
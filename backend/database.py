@@ -1,8 +1,9 @@
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, Float, ForeignKey
+from sqlalchemy import create_engine, event, inspect, select, Column, Integer, String, Text, Date, DateTime, Float, ForeignKey, Index, LargeBinary
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.orm import deferred, sessionmaker, relationship
 from datetime import datetime
-import bcrypt
+from compressed_text import CompressedText, load_dictionaries
+from timezones import DEFAULT_TIMEZONE, local_day
 
 SQLALCHEMY_DATABASE_URL = "sqlite:///./mood_tracker.db"
 
@@ -27,26 +28,47 @@ class User(Base):
     settings = relationship("Settings", back_populates="user", uselist=False)
 
     def set_password(self, password: str):
+        import bcrypt
         self.password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
 
     def check_password(self, password: str) -> bool:
+        import bcrypt
         return bcrypt.checkpw(password.encode('utf-8'), self.password_hash.encode('utf-8'))
 
+def _utc_day_default(context):
+    created_at = context.get_current_parameters().get("created_at") or datetime.utcnow()
+    return created_at.date()
+
 class MoodEntry(Base):
     __tablename__ = "mood_entries"
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey('users.id'), nullable=True, index=True)
     user_message = Column(Text, nullable=False)
-    eli_response = Column(Text, nullable=False)
+    # Stored compressed and only loaded (and decompressed) when accessed;
+    # queries that return it use undefer(MoodEntry.eli_response)
+    eli_response = deferred(Column(CompressedText, nullable=False))
     sentiment_score = Column(Float, nullable=True)
     sentiment_label = Column(String(50), nullable=True)
     mood_tags = Column(String(200), nullable=True)
+    # Where the score came from: "llm", "local", "textblob" or "seed". Rows
+    # stored before this existed are backfilled (see backfill_sentiment_sources);
+    # NULL means unknown. Only "llm" rows train the local model.
+    sentiment_source = Column(String(10), nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
+    # The user's local calendar day at created_at, set at insert time (UTC if not given)
+    local_day = Column(Date, default=_utc_day_default)
 
     # Relationships
     user = relationship("User", back_populates="mood_entries")
 
+    __table_args__ = (
+        Index("ix_mood_entries_user_local_day", "user_id", "local_day"),
+        # Ids are never reused, even after the newest rows are deleted: archived
+        # entries and mood_entry_tags keep referring to ids no longer in this table
+        {"sqlite_autoincrement": True},
+    )
+
 class Settings(Base):
     __tablename__ = "settings"
 
@@ -56,11 +78,295 @@ class Settings(Base):
     reminder_time = Column(String(10), default="09:00")
     privacy_mode = Column(Integer, default=0)
     safe_mode = Column(Integer, default=0)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    timezone = Column(String(64), default=DEFAULT_TIMEZONE)
+    # Indexed so the reminder scheduler can pick up recent changes cheaply
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
 
     # Relationships
     user = relationship("User", back_populates="settings")
 
+# A day's LLM summary, stored once generated. entry_count and last_entry_id
+# record which entries it covers, so it is only regenerated after new
+# check-ins that day. Weekly insights are built from these.
+class DailySummary(Base):
+    __tablename__ = "daily_summaries"
+
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    local_day = Column(Date, primary_key=True)
+    summary = Column(Text, nullable=False)
+    entry_count = Column(Integer, nullable=False)
+    last_entry_id = Column(Integer, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+# Check-ins saved before their sentiment was scored (see enrichment.py). A row
+# is written in the same transaction as its entry and deleted once the entry
+# has been enriched, so unfinished work survives restarts.
+class EnrichmentJob(Base):
+    __tablename__ = "enrichment_jobs"
+
+    entry_id = Column(Integer, primary_key=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
+    claimed_by = Column(String(64), nullable=True)
+    claimed_until = Column(DateTime, nullable=True)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+# zstd dictionaries for CompressedText columns (see compress_text.py)
+class CompressionDictionary(Base):
+    __tablename__ = "compression_dictionaries"
+
+    id = Column(Integer, primary_key=True)
+    column = Column(String(100), nullable=False)
+    dict_data = Column(LargeBinary, nullable=False)
+    sample_count = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+# Append-only ledger of OpenAI token usage, one row per completion (see
+# usage.py). user_id is NULL for guests and work not done for a user.
+class LLMUsage(Base):
+    __tablename__ = "llm_usage"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, nullable=True)
+    operation = Column(String(20), nullable=False)
+    model = Column(String(50), nullable=False)
+    prompt_tokens = Column(Integer, nullable=False)
+    completion_tokens = Column(Integer, nullable=False)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+# Per-user totals of llm_usage by UTC day, kept up to date by the same batched
+# writes, so a budget check is one primary-key read
+class LLMUsageDaily(Base):
+    __tablename__ = "llm_usage_daily"
+
+    user_id = Column(Integer, primary_key=True)
+    day = Column(Date, primary_key=True)
+    calls = Column(Integer, nullable=False, default=0)
+    prompt_tokens = Column(Integer, nullable=False, default=0)
+    completion_tokens = Column(Integer, nullable=False, default=0)
+
+# One row per tag per entry (MoodEntry.mood_tags split apart), so tag counts
+# over a date range are an index range scan instead of LIKE over every entry.
+# Rows outlive archiving, so entry_id has no foreign key.
+class MoodEntryTag(Base):
+    __tablename__ = "mood_entry_tags"
+
+    entry_id = Column(Integer, primary_key=True)
+    tag = Column(String(32), primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    local_day = Column(Date, nullable=False)
+
+    __table_args__ = (
+        Index("ix_mood_entry_tags_user_day_tag", "user_id", "local_day", "tag"),
+    )
+
+# Cold storage for old check-ins (see archive.py). Entries older than the
+# archive age are moved out of mood_entries into one compressed block per user
+# and month; archived_entries keeps a slim locator per entry and
+# archived_day_stats keeps the per-day score sums the trend queries need.
+class ArchiveBlock(Base):
+    __tablename__ = "mood_entry_archive"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    month = Column(String(7), nullable=False)  # YYYY-MM of created_at
+    codec = Column(String(10), nullable=False)
+    entry_count = Column(Integer, nullable=False)
+    raw_bytes = Column(Integer, nullable=False)
+    payload = Column(LargeBinary, nullable=False)
+    archived_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_mood_entry_archive_user_month", "user_id", "month"),
+    )
+
+class ArchivedEntry(Base):
+    __tablename__ = "archived_entries"
+
+    # The entry's original mood_entries id
+    id = Column(Integer, primary_key=True)
+    block_id = Column(Integer, ForeignKey('mood_entry_archive.id'), nullable=False)
+
+class ArchivedDay(Base):
+    __tablename__ = "archived_day_stats"
+
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    local_day = Column(Date, primary_key=True)
+    entry_count = Column(Integer, nullable=False, default=0)
+    # Count, sum and sum of squares of the non-null sentiment scores
+    score_count = Column(Integer, nullable=False, default=0)
+    score_sum = Column(Float, nullable=False, default=0.0)
+    score_sum_sq = Column(Float, nullable=False, default=0.0)
+
+# Full-text search over check-ins. The FTS5 table uses external content (a
+# view over mood_entries) so message text is not stored twice. Each row is
+# tagged with an "owner" token (u<user_id>) so searches can be scoped to one
+# user inside the MATCH itself, instead of filtering after ranking.
+SEARCH_INDEX_DDL = [
+    """CREATE VIEW IF NOT EXISTS mood_entries_fts_source AS
+       SELECT id, user_message, 'u' || user_id AS owner FROM mood_entries""",
+    """CREATE VIRTUAL TABLE IF NOT EXISTS mood_entries_fts USING fts5(
+       user_message, owner,
+       content='mood_entries_fts_source', content_rowid='id',
+       tokenize='porter unicode61')""",
+    """CREATE TRIGGER IF NOT EXISTS mood_entries_fts_insert AFTER INSERT ON mood_entries BEGIN
+       INSERT INTO mood_entries_fts(rowid, user_message, owner)
+       VALUES (new.id, new.user_message, 'u' || new.user_id);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS mood_entries_fts_delete AFTER DELETE ON mood_entries BEGIN
+       INSERT INTO mood_entries_fts(mood_entries_fts, rowid, user_message, owner)
+       VALUES ('delete', old.id, old.user_message, 'u' || old.user_id);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS mood_entries_fts_update AFTER UPDATE OF user_message, user_id ON mood_entries BEGIN
+       INSERT INTO mood_entries_fts(mood_entries_fts, rowid, user_message, owner)
+       VALUES ('delete', old.id, old.user_message, 'u' || old.user_id);
+       INSERT INTO mood_entries_fts(rowid, user_message, owner)
+       VALUES (new.id, new.user_message, 'u' || new.user_id);
+       END""",
+    # Archived entries are indexed separately. The text only exists inside
+    # compressed blocks, so this index is contentless (rowid = entry id) and
+    # archive.py maintains it directly.
+    """CREATE VIRTUAL TABLE IF NOT EXISTS mood_entry_archive_fts USING fts5(
+       user_message, owner, content='', tokenize='porter unicode61')""",
+]
+
+def init_search_index(bind):
+    """Create the FTS5 index and its triggers, backfilling existing rows the first time"""
+    with bind.begin() as conn:
+        exists = conn.exec_driver_sql(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'mood_entries_fts'"
+        ).first()
+        for statement in SEARCH_INDEX_DDL:
+            conn.exec_driver_sql(statement)
+        if not exists:
+            conn.exec_driver_sql("INSERT INTO mood_entries_fts(mood_entries_fts) VALUES ('rebuild')")
+
+@event.listens_for(MoodEntry.__table__, "before_drop")
+def _drop_search_index(target, connection, **kw):
+    # The triggers go away with mood_entries; the index and view must be dropped explicitly
+    connection.exec_driver_sql("DROP TABLE IF EXISTS mood_entries_fts")
+    connection.exec_driver_sql("DROP VIEW IF EXISTS mood_entries_fts_source")
+
+@event.listens_for(ArchivedEntry.__table__, "before_drop")
+def _drop_archive_search_index(target, connection, **kw):
+    connection.exec_driver_sql("DROP TABLE IF EXISTS mood_entry_archive_fts")
+
+# Columns added after the first release; create_all only creates missing
+# tables, so existing databases get these with ALTER TABLE
+ADDED_COLUMNS = [
+    ("mood_entries", "local_day", "DATE"),
+    ("settings", "timezone", f"VARCHAR(64) DEFAULT '{DEFAULT_TIMEZONE}'"),
+    ("mood_entries", "sentiment_source", "VARCHAR(10)"),
+]
+
+def migrate_schema(bind):
+    """Add columns and indexes missing from an existing database, then backfill them"""
+    inspector = inspect(bind)
+    added = set()
+    with bind.begin() as conn:
+        for table, column, ddl in ADDED_COLUMNS:
+            existing = {c["name"] for c in inspector.get_columns(table)}
+            if column not in existing:
+                conn.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}")
+                added.add((table, column))
+        rebuild_with_autoincrement(conn)
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+
+    # New rows always get local_day on insert, so only a fresh column needs filling
+    if ("mood_entries", "local_day") in added:
+        backfill_local_days(bind)
+    if ("mood_entries", "sentiment_source") in added:
+        backfill_sentiment_sources(bind)
+
+def rebuild_with_autoincrement(conn):
+    """
+    Recreate a mood_entries table from before ids were AUTOINCREMENT, keeping
+    every id, and start the id sequence above the highest hot or archived id.
+    Copies the whole table once; the search triggers and view are recreated by
+    init_search_index() right after.
+    """
+    table_sql = conn.exec_driver_sql(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'mood_entries'"
+    ).scalar()
+    if "AUTOINCREMENT" in table_sql.upper():
+        return
+
+    # The rename below fails while a view still refers to the old table
+    conn.exec_driver_sql("DROP VIEW IF EXISTS mood_entries_fts_source")
+    conn.exec_driver_sql("ALTER TABLE mood_entries RENAME TO mood_entries_old")
+    old_indexes = conn.exec_driver_sql(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'mood_entries_old' AND sql IS NOT NULL"
+    ).scalars().all()
+    for name in old_indexes:
+        conn.exec_driver_sql(f"DROP INDEX {name}")
+    MoodEntry.__table__.create(conn)
+    columns = ", ".join(column.name for column in MoodEntry.__table__.columns)
+    conn.exec_driver_sql(f"INSERT INTO mood_entries ({columns}) SELECT {columns} FROM mood_entries_old")
+    conn.exec_driver_sql("DROP TABLE mood_entries_old")
+
+    high_water = conn.exec_driver_sql(
+        "SELECT max(coalesce((SELECT max(id) FROM mood_entries), 0), coalesce((SELECT max(id) FROM archived_entries), 0))"
+    ).scalar()
+    conn.exec_driver_sql("DELETE FROM sqlite_sequence WHERE name = 'mood_entries'")
+    conn.exec_driver_sql("INSERT INTO sqlite_sequence (name, seq) VALUES ('mood_entries', ?)", (high_water,))
+
+def backfill_local_days(bind, batch_size=10000):
+    """Fill local_day for rows stored before it existed, using each user's timezone"""
+    with bind.begin() as conn:
+        # Users on UTC (or without settings) can be done in one statement
+        conn.exec_driver_sql(f"""
+            UPDATE mood_entries SET local_day = date(created_at)
+            WHERE local_day IS NULL AND user_id NOT IN (
+                SELECT user_id FROM settings
+                WHERE user_id IS NOT NULL AND timezone IS NOT NULL AND timezone != '{DEFAULT_TIMEZONE}'
+            )
+        """)
+        zones = dict(conn.exec_driver_sql(
+            f"SELECT user_id, timezone FROM settings WHERE user_id IS NOT NULL AND timezone != '{DEFAULT_TIMEZONE}'"
+        ).all())
+
+    for user_id, tz_name in zones.items():
+        while True:
+            with bind.begin() as conn:
+                rows = conn.execute(
+                    select(MoodEntry.id, MoodEntry.created_at)
+                    .where(MoodEntry.user_id == user_id, MoodEntry.local_day.is_(None))
+                    .limit(batch_size)
+                ).all()
+                if not rows:
+                    break
+                conn.exec_driver_sql(
+                    "UPDATE mood_entries SET local_day = ? WHERE id = ?",
+                    [(local_day(created_at, tz_name).isoformat(), entry_id) for entry_id, created_at in rows]
+                )
+
+def backfill_sentiment_sources(bind):
+    """
+    Mark rows scored before sentiment_source existed as 'llm', so the local
+    model can train on them. Before then every check-in was scored by gpt-4o,
+    falling back to TextBlob only when the call failed. TextBlob labels used a
+    narrower neutral band (+/-0.05 polarity against the LLM's +/-0.15), so rows
+    whose label disagrees with the LLM's thresholds are left NULL, as are the
+    seed_data.py user and generate_scale_data.py's default 'loadtest_' users.
+    Stored scores are rounded to 0.01, hence the small margin.
+    """
+    with bind.begin() as conn:
+        conn.exec_driver_sql("""
+            UPDATE mood_entries SET sentiment_source = 'llm'
+            WHERE sentiment_source IS NULL AND sentiment_score IS NOT NULL
+            AND (
+                (sentiment_label = 'positive' AND sentiment_score * 2 - 1 > 0.145)
+                OR (sentiment_label = 'negative' AND sentiment_score * 2 - 1 < -0.145)
+                OR (sentiment_label = 'neutral' AND sentiment_score * 2 - 1 BETWEEN -0.155 AND 0.155)
+            )
+            AND (user_id IS NULL OR user_id NOT IN (
+                SELECT id FROM users WHERE username = 'testuser' OR username LIKE 'loadtest\\_%' ESCAPE '\\'
+            ))
+        """)
+
 def get_db():
     db = SessionLocal()
     try:
@@ -68,4 +374,19 @@ def get_db():
     finally:
         db.close()
 
-Base.metadata.create_all(bind=engine)
+def init_db(bind=engine):
+    """Create tables, apply column migrations and set up the search index.
+    Called from the app's startup hook and by the maintenance scripts, not
+    at import time."""
+    with bind.connect() as conn:
+        # Persistent: readers, including online backups (see backups.py), no
+        # longer block writers, and writers don't block readers
+        conn.exec_driver_sql("PRAGMA journal_mode=WAL")
+    had_tags = inspect(bind).has_table(MoodEntryTag.__tablename__)
+    Base.metadata.create_all(bind=bind)
+    migrate_schema(bind)
+    init_search_index(bind)
+    load_dictionaries(bind)
+    if not had_tags:
+        from tags import backfill_entry_tags
+        backfill_entry_tags(bind)
@@ -3,6 +3,7 @@ Complete Database Deletion and Reset Script
 This script will completely delete the database file and recreate it from scratch.
 """
 import os
+import shutil
 import sys
 import time
 
@@ -29,8 +30,11 @@ def delete_and_reset_database():
             # Wait a moment for connections to fully close
             time.sleep(0.5)
 
-            # Delete the file
+            # Delete the file, and the WAL files so they can't be replayed into the new one
             os.remove(db_path)
+            for sidecar in (db_path + "-wal", db_path + "-shm"):
+                if os.path.exists(sidecar):
+                    os.remove(sidecar)
             print(f"   Database file deleted: {db_path}")
         except PermissionError:
             print("\nERROR: Database file is locked by another process!")
@@ -46,11 +50,17 @@ def delete_and_reset_database():
     else:
         print("\nNo existing database file found.")
 
+    # The memory index points at entry ids that no longer exist
+    import memory
+    if os.path.isdir(memory.MEMORY_DIR):
+        shutil.rmtree(memory.MEMORY_DIR)
+        print(f"   Memory index deleted: {memory.MEMORY_DIR}")
+
     print("\nStep 2: Creating fresh database with clean tables...")
 
-    # Import database module to trigger table creation
-    # This will automatically create the database file and tables
+    # Create the database file and tables
     import database
+    database.init_db()
 
     # Verify tables were created
     from sqlalchemy import inspect
@@ -1,8 +1,13 @@
 import os
-from openai import OpenAI
-from textblob import TextBlob
 import json
+import threading
 from dotenv import load_dotenv
+from llm_dispatcher import build_http_client, dispatcher
+from timing import span
+import usage
+
+# openai and textblob are slow to import, so they are imported on first use
+# (the OpenAI client is built the first time Eli needs it)
 
 # Load environment variables from .env file
 load_dotenv()
@@ -10,11 +15,76 @@ load_dotenv()
 # the newest OpenAI model is "gpt-5" which was released August 7, 2025.
 # do not change this unless explicitly requested by the user
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
-openai = OpenAI(api_key=OPENAI_API_KEY)
+
+# "llm" always asks gpt-4o, "local" always uses the trained model (see
+# train_sentiment.py), "auto" uses the local model when it is confident enough
+SENTIMENT_ENGINE = os.environ.get("ELI_SENTIMENT_ENGINE", "auto")
+LOCAL_SENTIMENT_MIN_CONFIDENCE = float(os.environ.get("ELI_LOCAL_SENTIMENT_MIN_CONFIDENCE", "0.75"))
+
+# When set, a check-in is one completion returning the reply and the sentiment
+# together as JSON (see EliAI.respond) instead of two separate requests
+COMBINED_CALL = os.environ.get("ELI_COMBINED_CALL", "0") == "1"
+
+COMBINED_INSTRUCTIONS = """
+
+Respond with ONLY a JSON object in this exact format:
+{"reply": "<your response to the user>", "score": <number between -1 and 1>, "reasoning": "<brief explanation>"}
+
+"reply" is what you say to the user. "score" is the emotional sentiment of the user's latest message, from -1 (very negative) to 1 (very positive), and "reasoning" briefly explains the score."""
+
+
+# What Eli says when the chat completion fails
+CHAT_FALLBACK = "I'm here with you. Sometimes I need a moment to gather my thoughts. Could you share that again?"
+
+
+def sentiment_from_polarity(polarity):
+    """Label and 0-1 score for an LLM polarity in [-1, 1]"""
+    if polarity > 0.15:
+        label = "positive"
+    elif polarity < -0.15:
+        label = "negative"
+    else:
+        label = "neutral"
+
+    # Normalize score to 0-1 range
+    score = (polarity + 1) / 2
+
+    return {
+        "score": round(score, 2),
+        "label": label,
+        "polarity": round(polarity, 2),
+        "source": "llm"
+    }
+
+
+def parse_combined_response(content):
+    """(reply, polarity) from a combined completion; ValueError if it doesn't validate"""
+    if not isinstance(content, str):
+        raise ValueError("empty response")
+    # json.JSONDecodeError is a ValueError too
+    result = json.loads(content)
+    if not isinstance(result, dict):
+        raise ValueError("expected a JSON object")
+
+    reply = result.get("reply")
+    if not isinstance(reply, str) or not reply.strip():
+        raise ValueError("missing reply")
+
+    polarity = result.get("score")
+    if isinstance(polarity, bool) or not isinstance(polarity, (int, float)):
+        raise ValueError("score is not a number")
+    if not -1 <= polarity <= 1:
+        raise ValueError(f"score {polarity} is out of range")
+
+    return reply.strip(), float(polarity)
+
 
 class EliAI:
     def __init__(self):
-        self.client = openai
+        self._client = None
+        self._client_lock = threading.Lock()
+        self._sentiment_model = None
+        self._sentiment_model_loaded = False
         self.system_prompt = """You are Eli, a compassionate and empathetic AI companion supporting individuals during their reentry period after incarceration. Your role is to:
 
 1. Listen with genuine empathy and without judgment
@@ -27,9 +97,76 @@ class EliAI:
 
 Your goal is to create a safe space for emotional expression and self-reflection."""
 
-    def analyze_sentiment(self, text):
-        """Analyze sentiment using OpenAI for more accurate emotional understanding"""
+    @property
+    def client(self):
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    from openai import OpenAI
+                    self._client = OpenAI(api_key=OPENAI_API_KEY, http_client=build_http_client())
+        return self._client
+
+    @client.setter
+    def client(self, value):
+        self._client = value
+
+    def _complete(self, priority, operation=None, **kwargs):
+        """Run a chat completion through the dispatcher at the given priority
+        class, attributing its time to the request's "llm" span and its tokens
+        to the current user and `operation` in the usage ledger"""
+        with dispatcher.slot(priority), span("llm"):
+            response = self.client.chat.completions.create(**kwargs)
+        usage.ledger.record(operation or priority, kwargs.get("model"), getattr(response, "usage", None))
+        return response
+
+    def local_sentiment(self, text):
+        """Score with the newest locally trained model, or None if none is available"""
+        if not self._sentiment_model_loaded:
+            try:
+                from sentiment_model import load_latest
+                self._sentiment_model = load_latest()
+            except Exception as e:
+                print(f"Local sentiment model unavailable: {e}")
+            self._sentiment_model_loaded = True
+
+        if self._sentiment_model is None:
+            return None
+        return self._sentiment_model.predict(text)
+
+    def offline_sentiment(self, text):
+        """Score without an LLM call: the local model if there is one, else TextBlob"""
+        local = self.local_sentiment(text)
+        if local is None:
+            return self.textblob_sentiment(text)
+        return {
+            "score": local["score"],
+            "label": local["label"],
+            "polarity": local["polarity"],
+            "source": "local"
+        }
+
+    def analyze_sentiment(self, text, fallback=True):
+        """Analyze sentiment using OpenAI for more accurate emotional understanding.
+        With fallback=False a failed OpenAI call raises instead of using TextBlob.
+        Users over their daily token budget always get the local model (or TextBlob)."""
+        over_budget = usage.ledger.over_budget()
+        if SENTIMENT_ENGINE != "llm" or over_budget:
+            local = self.local_sentiment(text)
+            if local is not None and (
+                SENTIMENT_ENGINE == "local" or over_budget or local["confidence"] >= LOCAL_SENTIMENT_MIN_CONFIDENCE
+            ):
+                return {
+                    "score": local["score"],
+                    "label": local["label"],
+                    "polarity": local["polarity"],
+                    "source": "local"
+                }
+
+        if over_budget:
+            return self.textblob_sentiment(text)
+
         try:
+
             # Use OpenAI to understand emotional tone more accurately
             prompt = f"""Analyze the emotional sentiment of this message on a scale from -1 (very negative) to 1 (very positive).
 
@@ -44,7 +181,9 @@ Examples:
 - "Feeling anxious" -> {{"score": -0.5, "reasoning": "Worried and uneasy"}}
 - "I need someone to talk to" -> {{"score": -0.3, "reasoning": "Seeking support, mild distress"}}"""
 
-            response = self.client.chat.completions.create(
+            response = self._complete(
+                "sentiment",
+                operation="sentiment",
                 model="gpt-4o",
                 messages=[
                     {"role": "system", "content": "You are an expert at understanding emotional tone and sentiment in text."},
@@ -55,52 +194,43 @@ Examples:
             )
 
             result = json.loads(response.choices[0].message.content)
-            polarity = float(result.get("score", 0))
+            return sentiment_from_polarity(float(result.get("score", 0)))
 
-            # Classify based on polarity
-            if polarity > 0.15:
+        except Exception as e:
+            if not fallback:
+                raise
+            # Fallback to TextBlob if OpenAI fails
+            print(f"OpenAI sentiment failed, using TextBlob: {e}")
+            return self.textblob_sentiment(text)
+
+    def textblob_sentiment(self, text):
+        try:
+            from textblob import TextBlob
+            blob = TextBlob(text)
+            polarity = blob.sentiment.polarity
+
+            if polarity > 0.05:
                 label = "positive"
-            elif polarity < -0.15:
+            elif polarity < -0.05:
                 label = "negative"
             else:
                 label = "neutral"
 
-            # Normalize score to 0-1 range
             score = (polarity + 1) / 2
 
             return {
                 "score": round(score, 2),
                 "label": label,
-                "polarity": round(polarity, 2)
+                "polarity": round(polarity, 2),
+                "source": "textblob"
+            }
+        except:
+            return {
+                "score": 0.5,
+                "label": "neutral",
+                "polarity": 0.0,
+                "source": "textblob"
             }
-
-        except Exception as e:
-            # Fallback to TextBlob if OpenAI fails
-            print(f"OpenAI sentiment failed, using TextBlob: {e}")
-            try:
-                blob = TextBlob(text)
-                polarity = blob.sentiment.polarity
-
-                if polarity > 0.05:
-                    label = "positive"
-                elif polarity < -0.05:
-                    label = "negative"
-                else:
-                    label = "neutral"
-
-                score = (polarity + 1) / 2
-
-                return {
-                    "score": round(score, 2),
-                    "label": label,
-                    "polarity": round(polarity, 2)
-                }
-            except:
-                return {
-                    "score": 0.5,
-                    "label": "neutral",
-                    "polarity": 0.0
-                }
 
     def get_mood_tags(self, sentiment_data):
         """Generate mood tags based on sentiment with more granular categories"""
@@ -124,21 +254,66 @@ Examples:
         else:
             return "calm, reflective"
 
-    def chat(self, user_message, conversation_history=None):
-        """Generate empathetic response from Eli"""
-        try:
-            messages = [{"role": "system", "content": self.system_prompt}]
+    def _conversation(self, system_prompt, user_message, conversation_history=None, memories=None):
+        messages = [{"role": "system", "content": system_prompt}]
+
+        if memories:
+            # Earlier check-ins found by memory.recall, beyond the recent turns
+            recalled = "\n".join(f'- {m["day"]}: "{m["user_message"]}"' for m in memories)
+            messages.append({"role": "system", "content": f"""Earlier check-ins from this person that may relate to what they are sharing now (most relevant first). Draw on them only when it helps, gently, without quoting them back:
+{recalled}"""})
+
+        if conversation_history:
+            for entry in conversation_history[-5:]:
+                messages.append({"role": "user", "content": entry.get("user_message", "")})
+                messages.append({"role": "assistant", "content": entry.get("eli_response", "")})
+
+        messages.append({"role": "user", "content": user_message})
+        return messages
 
-            if conversation_history:
-                for entry in conversation_history[-5:]:
-                    messages.append({"role": "user", "content": entry.get("user_message", "")})
-                    messages.append({"role": "assistant", "content": entry.get("eli_response", "")})
+    def respond(self, user_message, conversation_history=None, memories=None, priority="chat"):
+        """Eli's reply and the sentiment of the message: (reply, sentiment_data)"""
+        # Over budget, sentiment is scored locally, so the reply is a call on its own
+        if COMBINED_CALL and not usage.ledger.over_budget():
+            try:
+                return self.chat_with_sentiment(user_message, conversation_history, memories, priority)
+            except ValueError as e:
+                # The model answered, just not in the expected shape
+                print(f"Combined chat response didn't validate, using separate calls: {e}")
+            except Exception as e:
+                # The call itself failed (timeout, API error); retrying as two calls would
+                # only add load, so handle it like a failed chat() and score locally
+                print(f"Error in chat: {e}")
+                return CHAT_FALLBACK, self.offline_sentiment(user_message)
+        return self.chat(user_message, conversation_history, memories, priority), self.analyze_sentiment(user_message)
 
-            messages.append({"role": "user", "content": user_message})
+    def chat_with_sentiment(self, user_message, conversation_history=None, memories=None, priority="chat"):
+        """
+        One completion for both the reply and the sentiment score.
+        Raises ValueError if the JSON doesn't validate, and whatever the
+        client raised if the request fails.
+        """
+        response = self._complete(
+            priority,
+            operation="chat",
+            model="gpt-4o",
+            messages=self._conversation(
+                self.system_prompt + COMBINED_INSTRUCTIONS, user_message, conversation_history, memories
+            ),
+            response_format={"type": "json_object"},
+            max_completion_tokens=300
+        )
+        reply, polarity = parse_combined_response(response.choices[0].message.content)
+        return reply, sentiment_from_polarity(polarity)
 
-            response = self.client.chat.completions.create(
+    def chat(self, user_message, conversation_history=None, memories=None, priority="chat"):
+        """Generate empathetic response from Eli"""
+        try:
+            response = self._complete(
+                priority,
+                operation="chat",
                 model="gpt-4o",
-                messages=messages,
+                messages=self._conversation(self.system_prompt, user_message, conversation_history, memories),
                 max_completion_tokens=200
             )
 
@@ -146,61 +321,59 @@ Examples:
 
         except Exception as e:
             print(f"Error in chat: {e}")
-            return "I'm here with you. Sometimes I need a moment to gather my thoughts. Could you share that again?"
+            return CHAT_FALLBACK
 
-    def generate_daily_summary(self, entries):
-        """Generate a summary of the day's mood entries"""
-        if not entries:
-            return "No entries today yet. How are you feeling?"
-        
-        try:
-            entry_texts = [f"- {entry.user_message}" for entry in entries]
-            combined = "\n".join(entry_texts)
-            
-            prompt = f"""Based on these mood check-ins from today, provide a brief, supportive summary (2-3 sentences) that:
+    def summarize_day(self, messages, day_label="today"):
+        """Summarize one day's check-in messages. Raises if the LLM call fails."""
+        combined = "\n".join(f"- {message}" for message in messages)
+
+        prompt = f"""Based on these mood check-ins from {day_label}, provide a brief, supportive summary (2-3 sentences) that:
 1. Acknowledges the emotional journey
 2. Highlights any positive moments or growth
 3. Offers gentle encouragement
 
 Entries:
 {combined}"""
-            
-            response = self.client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {"role": "system", "content": self.system_prompt},
-                    {"role": "user", "content": prompt}
-                ],
-                max_completion_tokens=150
-            )
-            
-            return response.choices[0].message.content
-        
-        except Exception as e:
-            return "You've checked in multiple times today. That shows real commitment to understanding yourself better."
 
-    def generate_weekly_insights(self, entries):
-        """Generate insights from a week of entries"""
-        if not entries:
-            return "Start tracking your mood to see patterns and insights over time."
-        
+        response = self._complete(
+            "background",
+            operation="daily",
+            model="gpt-4o",
+            messages=[
+                {"role": "system", "content": self.system_prompt},
+                {"role": "user", "content": prompt}
+            ],
+            max_completion_tokens=150
+        )
+
+        return response.choices[0].message.content
+
+    def generate_weekly_insights(self, daily_summaries, label_counts):
+        """
+        Generate insights for a week from its daily summaries, a list of
+        (day label, entry count, summary), and the week's sentiment label counts
+        """
+        total = sum(label_counts.values())
+        if not total:
+            return self.weekly_fallback(label_counts)
+
         try:
-            positive_count = sum(1 for e in entries if e.sentiment_label == "positive")
-            negative_count = sum(1 for e in entries if e.sentiment_label == "negative")
-            total = len(entries)
-            
-            sample_entries = [f"- {e.user_message[:100]}" for e in entries[:10]]
-            combined = "\n".join(sample_entries)
-            
-            prompt = f"""Based on {total} mood entries this week ({positive_count} positive, {negative_count} negative), provide encouraging insights (3-4 sentences) that:
+            days = "\n".join(
+                f"- {day_label} ({count} check-ins): {summary}"
+                for day_label, count, summary in daily_summaries
+            )
+
+            prompt = f"""Based on {total} mood entries this week ({label_counts.get("positive", 0)} positive, {label_counts.get("negative", 0)} negative, {label_counts.get("neutral", 0)} neutral), provide encouraging insights (3-4 sentences) that:
 1. Recognize patterns or emotional themes
 2. Celebrate progress and resilience
 3. Offer perspective on the week
 
-Sample entries:
-{combined}"""
-            
-            response = self.client.chat.completions.create(
+Summary of each day:
+{days}"""
+
+            response = self._complete(
+                "background",
+                operation="weekly",
                 model="gpt-4o",
                 messages=[
                     {"role": "system", "content": self.system_prompt},
@@ -208,10 +381,17 @@ Sample entries:
                 ],
                 max_completion_tokens=200
             )
-            
+
             return response.choices[0].message.content
-        
+
         except Exception as e:
-            return f"You've made {len(entries)} entries this week. Each one is a step toward better self-understanding."
+            return self.weekly_fallback(label_counts)
+
+    def weekly_fallback(self, label_counts):
+        """Weekly insights text used when the LLM can't (or shouldn't) be asked"""
+        total = sum(label_counts.values())
+        if not total:
+            return "Start tracking your mood to see patterns and insights over time."
+        return f"You've made {total} entries this week. Each one is a step toward better self-understanding."
 
 eli = EliAI()
@@ -0,0 +1,262 @@
+"""
+Deferred sentiment enrichment, off the chat critical path.
+
+With ELI_DEFERRED_SENTIMENT=1, /api/chat only waits for Eli's reply. A signed-in
+user's check-in is saved with no sentiment yet, together with a row in
+enrichment_jobs in the same transaction. A worker thread in each API process
+then scores the entry, fills in sentiment_score, sentiment_label, mood_tags
+and the tag rows, and deletes the job. Dashboards show the entry unscored
+until that happens, usually within a second or two.
+
+Jobs are rows in the database, so work left unfinished at shutdown is picked
+up on the next start. The in-memory queue only holds entry ids waiting for
+this process's worker and is bounded (ELI_ENRICH_QUEUE_SIZE); when it is
+full, a job simply stays in the table until the worker's next sweep. A
+failed job is retried with exponential backoff, and the last attempt
+(ELI_ENRICH_MAX_ATTEMPTS) accepts the TextBlob fallback so every entry ends
+up scored. A worker claims a job with a lease before running it, so preforked
+processes never score the same entry at the same time.
+
+The same worker also brings earlier days' summaries up to date when the
+weekly view finds them stale (see summaries.py). Those jobs are only kept in
+memory: a lost one is queued again by the next weekly view.
+"""
+import os
+import queue
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, or_, update
+
+import tags
+import trends
+import usage
+from database import SessionLocal, EnrichmentJob, MoodEntry, MoodEntryTag
+from eli_ai import eli
+
+DEFERRED_SENTIMENT = os.environ.get("ELI_DEFERRED_SENTIMENT", "0") == "1"
+QUEUE_SIZE = int(os.environ.get("ELI_ENRICH_QUEUE_SIZE", "1000"))
+MAX_ATTEMPTS = int(os.environ.get("ELI_ENRICH_MAX_ATTEMPTS", "5"))
+
+SWEEP_SECONDS = 5.0
+LEASE_SECONDS = 120
+RETRY_BASE_SECONDS = 2.0
+RETRY_MAX_SECONDS = 300.0
+
+
+class EnrichmentWorker:
+    def __init__(self, session_factory=SessionLocal, queue_size=QUEUE_SIZE, max_attempts=MAX_ATTEMPTS):
+        self.session_factory = session_factory
+        self.max_attempts = max_attempts
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        # (user_id, day) of the summary jobs in the queue
+        self._summaries_queued = set()
+        self.counts = {"enqueued": 0, "overflowed": 0, "enriched": 0, "retried": 0, "dropped": 0,
+                       "summaries_enqueued": 0, "summarized": 0, "summary_failed": 0}
+
+    def _count(self, name):
+        with self._lock:
+            self.counts[name] += 1
+
+    def enqueue(self, entry_id):
+        """Hand a committed job to the worker; if the queue is full it waits for a sweep"""
+        try:
+            self.queue.put_nowait(entry_id)
+            self._count("enqueued")
+        except queue.Full:
+            self._count("overflowed")
+
+    def enqueue_summary(self, user_id, day):
+        """Have an earlier day's summary brought up to date; a day already queued isn't queued twice"""
+        key = (user_id, day)
+        with self._lock:
+            if key in self._summaries_queued:
+                return
+            self._summaries_queued.add(key)
+        try:
+            self.queue.put_nowait(("summary", user_id, day))
+            self._count("summaries_enqueued")
+        except queue.Full:
+            with self._lock:
+                self._summaries_queued.discard(key)
+            self._count("overflowed")
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        # The owner is taken here rather than at import so preforked workers differ
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="enrichment-worker", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5.0):
+        """Stop after the current job; queued jobs stay in the table for the next start"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        next_sweep = 0.0
+        while not self._stop.is_set():
+            if time.monotonic() >= next_sweep:
+                try:
+                    self.sweep()
+                except Exception as e:
+                    print(f"Enrichment sweep failed: {e}")
+                next_sweep = time.monotonic() + SWEEP_SECONDS
+            try:
+                job = self.queue.get(timeout=SWEEP_SECONDS)
+            except queue.Empty:
+                continue
+            if isinstance(job, tuple):
+                self.summarize(*job[1:])
+                continue
+            try:
+                self.process(job)
+            except Exception as e:
+                print(f"Enrichment of entry {job} failed: {e}")
+
+    def _due(self, now):
+        return (
+            EnrichmentJob.next_attempt_at <= now,
+            EnrichmentJob.attempts < self.max_attempts,
+            or_(EnrichmentJob.claimed_until.is_(None), EnrichmentJob.claimed_until < now),
+        )
+
+    def sweep(self):
+        """Queue due jobs from the table: left over from a restart, overflowed, or due for a retry"""
+        room = self.queue.maxsize - self.queue.qsize()
+        if room <= 0:
+            return 0
+        db = self.session_factory()
+        try:
+            entry_ids = db.query(EnrichmentJob.entry_id).filter(
+                *self._due(datetime.utcnow())
+            ).order_by(EnrichmentJob.next_attempt_at).limit(room).all()
+        finally:
+            db.close()
+        for (entry_id,) in entry_ids:
+            try:
+                self.queue.put_nowait(entry_id)
+            except queue.Full:
+                break
+        return len(entry_ids)
+
+    def _claim(self, db, entry_id):
+        """Take the job's lease; returns its attempt count, or None if it isn't ours to run"""
+        now = datetime.utcnow()
+        claimed = db.execute(
+            update(EnrichmentJob)
+            .where(EnrichmentJob.entry_id == entry_id, *self._due(now))
+            .values(claimed_by=self.owner, claimed_until=now + timedelta(seconds=LEASE_SECONDS))
+        ).rowcount
+        db.commit()
+        if not claimed:
+            return None
+        return db.query(EnrichmentJob.attempts).filter(EnrichmentJob.entry_id == entry_id).scalar()
+
+    def process(self, entry_id):
+        """Score one pending entry. Returns True once the entry is enriched"""
+        db = self.session_factory()
+        try:
+            attempts = self._claim(db, entry_id)
+            if attempts is None:
+                return False
+
+            entry = db.get(MoodEntry, entry_id)
+            if entry is None:
+                # Deleted (or archived) before it was scored
+                db.query(EnrichmentJob).filter(EnrichmentJob.entry_id == entry_id).delete()
+                db.commit()
+                self._count("dropped")
+                return False
+
+            try:
+                last_attempt = attempts + 1 >= self.max_attempts
+                with usage.for_user(entry.user_id):
+                    sentiment_data = eli.analyze_sentiment(entry.user_message, fallback=last_attempt)
+                entry.sentiment_score = sentiment_data["score"]
+                entry.sentiment_label = sentiment_data["label"]
+                entry.sentiment_source = sentiment_data.get("source")
+                entry.mood_tags = eli.get_mood_tags(sentiment_data)
+                # Replace rather than add, so re-scoring an entry is harmless
+                db.query(MoodEntryTag).filter(MoodEntryTag.entry_id == entry_id).delete()
+                db.flush()
+                tags.add_entry_tags(db, entry)
+                db.query(EnrichmentJob).filter(EnrichmentJob.entry_id == entry_id).delete()
+                db.commit()
+            except Exception as e:
+                db.rollback()
+                delay = min(RETRY_BASE_SECONDS * 2 ** attempts, RETRY_MAX_SECONDS)
+                db.execute(
+                    update(EnrichmentJob)
+                    .where(EnrichmentJob.entry_id == entry_id)
+                    .values(
+                        attempts=attempts + 1,
+                        next_attempt_at=datetime.utcnow() + timedelta(seconds=delay),
+                        claimed_by=None,
+                        claimed_until=None,
+                        last_error=str(e)[:500],
+                    )
+                )
+                db.commit()
+                self._count("retried")
+                print(f"Enrichment of entry {entry_id} failed (attempt {attempts + 1}), retrying in {delay:.0f}s: {e}")
+                return False
+
+            trends.invalidate_user(entry.user_id)
+            self._count("enriched")
+            return True
+        finally:
+            db.close()
+
+    def summarize(self, user_id, day):
+        """Run a summary job from enqueue_summary()"""
+        # summaries imports this module
+        import summaries
+
+        db = self.session_factory()
+        try:
+            with usage.for_user(user_id):
+                if usage.ledger.over_budget(user_id):
+                    summary = None
+                else:
+                    summary = summaries.summarize_past_day(db, user_id, day)
+            self._count("summarized" if summary is not None else "summary_failed")
+        except Exception as e:
+            self._count("summary_failed")
+            print(f"Summary of {day} for user {user_id} failed: {e}")
+        finally:
+            db.close()
+            with self._lock:
+                self._summaries_queued.discard((user_id, day))
+
+    def stats(self):
+        db = self.session_factory()
+        try:
+            pending, failed = db.query(
+                func.count(EnrichmentJob.entry_id),
+                func.count(EnrichmentJob.entry_id).filter(EnrichmentJob.attempts >= self.max_attempts),
+            ).one()
+        finally:
+            db.close()
+        with self._lock:
+            return {
+                "deferred": DEFERRED_SENTIMENT,
+                "running": self._thread is not None and self._thread.is_alive(),
+                "queued": self.queue.qsize(),
+                "queue_size": self.queue.maxsize,
+                "pending_jobs": pending,
+                "failed_jobs": failed,
+                **self.counts,
+            }
+
+
+worker = EnrichmentWorker()
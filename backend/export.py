@@ -0,0 +1,113 @@
+"""
+Streaming export of a user's full mood history as NDJSON or CSV.
+
+Archived months (see archive.py) are streamed first, one decompressed block
+at a time, followed by the entries still in mood_entries.
+
+Rows are read in keyset-paginated batches (WHERE id > last_id, served by the
+user_id index) and encoded batch by batch, so memory stays constant no matter
+how many years of entries a user has. Each batch is its own short read, which
+keeps SQLite writers from being blocked for the length of a large download.
+The first batch is small so the first bytes go out immediately.
+"""
+import csv
+import io
+import json
+import zlib
+
+from sqlalchemy import select
+
+import archive
+from database import SessionLocal, MoodEntry
+
+EXPORT_COLUMNS = (
+    "id", "created_at", "user_message", "eli_response",
+    "sentiment_score", "sentiment_label", "mood_tags",
+)
+
+FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+FIRST_BATCH_SIZE = 200
+BATCH_SIZE = 2000
+
+
+def iter_entry_batches(user_id, first_batch_size=FIRST_BATCH_SIZE, batch_size=BATCH_SIZE):
+    """Yield lists of row tuples (in EXPORT_COLUMNS order) for a user, oldest first"""
+    columns = [getattr(MoodEntry, name) for name in EXPORT_COLUMNS]
+    last_id = 0
+    limit = first_batch_size
+    db = SessionLocal()
+    try:
+        for rows in archive.iter_user_blocks(db, user_id):
+            yield [row[:len(EXPORT_COLUMNS)] for row in rows]
+
+        while True:
+            rows = db.execute(
+                select(*columns)
+                .where(MoodEntry.user_id == user_id, MoodEntry.id > last_id)
+                .order_by(MoodEntry.id)
+                .limit(limit)
+            ).all()
+            # End the read transaction between batches
+            db.commit()
+            if not rows:
+                return
+            yield rows
+            if len(rows) < limit:
+                return
+            last_id = rows[-1][0]
+            limit = batch_size
+    finally:
+        db.close()
+
+
+def _ndjson_chunks(batches):
+    for rows in batches:
+        yield "".join(
+            json.dumps({
+                "id": row[0],
+                "created_at": row[1].isoformat() if row[1] else None,
+                "user_message": row[2],
+                "eli_response": row[3],
+                "sentiment_score": row[4],
+                "sentiment_label": row[5],
+                "mood_tags": row[6],
+            }) + "\n"
+            for row in rows
+        )
+
+
+def _csv_chunks(batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    yield buffer.getvalue()
+    for rows in batches:
+        buffer.seek(0)
+        buffer.truncate()
+        for row in rows:
+            writer.writerow([row[0], row[1].isoformat() if row[1] else "", *row[2:]])
+        yield buffer.getvalue()
+
+
+def _gzip_chunks(chunks):
+    # wbits=31 writes a gzip header; a sync flush per chunk keeps bytes flowing
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def stream_export(user_id, fmt, gzip=False):
+    """Return an iterator of bytes for a StreamingResponse"""
+    batches = iter_entry_batches(user_id)
+    text_chunks = _ndjson_chunks(batches) if fmt == "ndjson" else _csv_chunks(batches)
+    byte_chunks = (chunk.encode("utf-8") for chunk in text_chunks)
+    if gzip:
+        return _gzip_chunks(byte_chunks)
+    return byte_chunks
@@ -0,0 +1,150 @@
+"""
+Program-wide analytics exports of mood_tracker.db
+
+Usage:
+  python export_analytics.py export [--format parquet|arrow] [--text] [--start DAY] [--end DAY]
+                                    [--out PATH] [--snapshot latest|PATH]
+  python export_analytics.py rollup [--period week|month] [--start DAY] [--end DAY]
+                                    [--csv PATH] [--snapshot latest|PATH]
+
+export writes every user's entries as a Parquet file (or Arrow IPC stream),
+leaving out user_message and eli_response unless --text is given. rollup
+prints entries, users, mean sentiment and label counts per signup cohort and
+week (or month). Both read the live database in short batches, which is safe
+while the app runs; with --snapshot they read a decompressed backup (see
+backup_db.py) instead and don't touch the live database at all. See
+analytics.py for the columns.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import date, datetime
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import create_engine
+
+import analytics
+import backups
+import database
+from compressed_text import load_dictionaries
+
+
+def open_source(args, workdir):
+    """The engine to read from: the live database, or a verified copy of a snapshot"""
+    if not args.snapshot:
+        return database.engine
+
+    path = args.snapshot
+    if path == "latest":
+        snapshots = backups.list_snapshots(args.backup_dir)
+        if not snapshots:
+            sys.exit(f"ERROR: no snapshots in {args.backup_dir}")
+        path = snapshots[0]["path"]
+    copy_path = os.path.join(workdir, "snapshot.db")
+    print(f"  Reading snapshot {path}")
+    result = backups.verify_snapshot(path, keep_copy_at=copy_path)
+    if not result["ok"]:
+        for problem in result["problems"]:
+            print(f"     PROBLEM: {problem}")
+        sys.exit(1)
+    bind = create_engine(f"sqlite:///{copy_path}")
+    # Replies are decompressed with the snapshot's own dictionaries
+    load_dictionaries(bind)
+    return bind
+
+
+def cmd_export(args, bind):
+    _, extension = analytics.FORMATS[args.format]
+    out = args.out or f"mood-entries-{datetime.utcnow().strftime('%Y%m%d')}.{extension}"
+    started = time.perf_counter()
+    size = 0
+    with open(out, "wb") as f:
+        for chunk in analytics.stream_export(args.format, include_text=args.text, start=args.start,
+                                             end=args.end, bind=bind):
+            f.write(chunk)
+            size += len(chunk)
+    elapsed = time.perf_counter() - started
+
+    rows = _count_rows(args.format, out)
+    print(f"  Wrote {rows:,} entries to {out} ({size / 1e6:.1f} MB) in {elapsed:.1f}s "
+          f"({rows / max(elapsed, 1e-9):,.0f} rows/s)")
+
+
+def _count_rows(fmt, path):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    if fmt == "parquet":
+        return pq.ParquetFile(path).metadata.num_rows
+    with pa.OSFile(path) as f:
+        return sum(batch.num_rows for batch in pa.ipc.open_stream(f))
+
+
+def cmd_rollup(args, bind):
+    started = time.perf_counter()
+    table = analytics.cohort_rollup(
+        analytics.iter_batches(bind, start=args.start, end=args.end), period=args.period
+    )
+    elapsed = time.perf_counter() - started
+    if table is None:
+        print("  No entries")
+        return
+
+    if args.csv:
+        import pyarrow.csv
+
+        pyarrow.csv.write_csv(table, args.csv)
+        print(f"  Wrote {table.num_rows:,} rows to {args.csv}")
+    else:
+        print(f"  {'cohort':<8} {args.period:<10} {'entries':>8} {'users':>7} {'mean':>6} "
+              f"{'pos':>7} {'neg':>7} {'neu':>7}")
+        for row in table.to_pylist():
+            mean = f"{row['mean_score']:.3f}" if row["mean_score"] is not None else "-"
+            print(f"  {row['cohort'] or '-':<8} {str(row[args.period]):<10} {row['entries']:>8,} "
+                  f"{row['users']:>7,} {mean:>6} {row['positive']:>7,} {row['negative']:>7,} {row['neutral']:>7,}")
+    print(f"\n  {sum(table.column('entries').to_pylist()):,} entries rolled up in {elapsed:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Program-wide analytics exports")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    def common(p):
+        p.add_argument("--start", type=date.fromisoformat, help="first local day (YYYY-MM-DD)")
+        p.add_argument("--end", type=date.fromisoformat, help="last local day (YYYY-MM-DD)")
+        p.add_argument("--snapshot", help="read a backup snapshot instead of the live database ('latest' or a path)")
+        p.add_argument("--backup-dir", default=backups.BACKUP_DIR)
+
+    p = sub.add_parser("export", help="write entries as Parquet or Arrow")
+    p.add_argument("--format", choices=sorted(analytics.FORMATS), default="parquet")
+    p.add_argument("--text", action="store_true", help="include user_message and eli_response")
+    p.add_argument("--out", help="output file (default mood-entries-YYYYMMDD.parquet)")
+    common(p)
+
+    p = sub.add_parser("rollup", help="per cohort and period totals")
+    p.add_argument("--period", choices=["week", "month"], default="week")
+    p.add_argument("--csv", help="write the table to this CSV file instead of printing it")
+    common(p)
+
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print(f"Analytics {args.command}")
+    print("=" * 60)
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            bind = open_source(args, workdir)
+            if args.command == "export":
+                cmd_export(args, bind)
+            else:
+                cmd_rollup(args, bind)
+            bind.dispose()
+    except RuntimeError as e:
+        sys.exit(f"ERROR: {e}")
+
+
+if __name__ == "__main__":
+    main()
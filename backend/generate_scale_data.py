@@ -0,0 +1,214 @@
+"""
+Generate a large synthetic dataset for scale testing
+
+Usage: python generate_scale_data.py --users 5000 --days 730 --seed 42
+
+With the defaults each user averages ~1,200 entries over two years, so
+--users 20000 gives roughly 25 million mood entries.
+
+Creates thousands of users, each with their own check-in habits, and bulk
+loads their mood entries with Core insert() + executemany in large chunks,
+one transaction per chunk. The same --seed always produces the same data.
+
+Per-user behaviour that makes the distributions realistic:
+  - how often they check in at all (some daily, some a few times a month)
+  - how many check-ins on an active day (heavy-tailed, 1 to 40)
+  - fewer check-ins on weekends, most in the morning and evening
+  - a slowly drifting mood baseline that decides which messages they send
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import bcrypt
+import numpy as np
+from sqlalchemy import delete, func, insert, select
+
+import archive
+import memory
+from database import engine, init_db, DailySummary, User, MoodEntry, MoodEntryTag, Settings
+from seed_data import SAMPLE_MESSAGES, ELI_RESPONSES
+from tags import tag_rows
+
+# Relative likelihood of a check-in per hour of the day (UTC), peaking in the
+# morning and evening with a quiet night
+HOUR_WEIGHTS = np.array([
+    0.3, 0.2, 0.1, 0.1, 0.1, 0.3, 0.8, 1.6, 2.2, 2.0, 1.4, 1.1,
+    1.3, 1.2, 1.0, 1.0, 1.2, 1.5, 1.9, 2.3, 2.4, 2.0, 1.3, 0.7,
+])
+HOUR_WEIGHTS = HOUR_WEIGHTS / HOUR_WEIGHTS.sum()
+
+# Monday..Sunday activity multipliers
+WEEKDAY_FACTORS = np.array([1.05, 1.05, 1.0, 1.0, 0.95, 0.8, 0.75])
+
+MESSAGE_POLARITIES = np.array([m[2] for m in SAMPLE_MESSAGES])
+
+
+def user_entries(rng, start_day, days):
+    """Yield (created_at, message_index, response_index) tuples for one user"""
+    active_probability = rng.beta(2.0, 2.5)
+    daily_rate = float(np.clip(rng.lognormal(np.log(3.0), 0.8), 1, 40))
+
+    # Mood baseline: a bounded random walk over the user's days
+    drift = np.cumsum(rng.normal(0, 0.05, size=days))
+    baseline = np.clip(rng.normal(0.1, 0.3) + drift, -0.9, 0.9)
+
+    weekdays = (np.arange(days) + start_day.weekday()) % 7
+    active = rng.random(days) < active_probability * WEEKDAY_FACTORS[weekdays]
+    counts = np.where(active, 1 + rng.poisson(daily_rate - 1, size=days), 0)
+    counts = np.minimum(counts, 40)
+
+    for day in np.nonzero(counts)[0]:
+        n = int(counts[day])
+        hours = rng.choice(24, size=n, p=HOUR_WEIGHTS)
+        seconds = rng.integers(0, 3600, size=n)
+        # Messages whose polarity is close to today's baseline are most likely
+        weights = np.exp(-((MESSAGE_POLARITIES - baseline[day]) ** 2) / 0.18)
+        messages = rng.choice(len(SAMPLE_MESSAGES), size=n, p=weights / weights.sum())
+        responses = rng.integers(0, len(ELI_RESPONSES), size=n)
+        day_start = start_day + timedelta(days=int(day))
+        for h, s, m, r in sorted(zip(hours, seconds, messages, responses)):
+            yield day_start + timedelta(hours=int(h), seconds=int(s)), int(m), int(r)
+
+
+def delete_previous_run(conn, prefix):
+    user_ids = select(User.id).where(User.username.like(f"{prefix}\\_%", escape="\\"))
+    archive.purge_users(conn, user_ids)
+    memory.index.drop_users(conn.execute(user_ids).scalars().all())
+    conn.execute(delete(MoodEntryTag).where(MoodEntryTag.user_id.in_(user_ids)))
+    conn.execute(delete(DailySummary).where(DailySummary.user_id.in_(user_ids)))
+    conn.execute(delete(MoodEntry).where(MoodEntry.user_id.in_(user_ids)))
+    conn.execute(delete(Settings).where(Settings.user_id.in_(user_ids)))
+    result = conn.execute(delete(User).where(User.username.like(f"{prefix}\\_%", escape="\\")))
+    return result.rowcount
+
+
+def create_users(conn, n_users, prefix, chunk_size, signup):
+    """Bulk insert users (all signed up at `signup`) and their default settings, returning their ids"""
+    # bcrypt is deliberately slow; all synthetic users share one hash
+    password_hash = bcrypt.hashpw(b"password123", bcrypt.gensalt()).decode("utf-8")
+    with conn.begin():
+        first_id = (conn.execute(select(func.max(User.id))).scalar() or 0) + 1
+
+    user_ids = list(range(first_id, first_id + n_users))
+    for start in range(0, n_users, chunk_size):
+        ids = user_ids[start:start + chunk_size]
+        with conn.begin():
+            conn.execute(insert(User), [
+                {
+                    "id": uid,
+                    "username": f"{prefix}_{uid:07d}",
+                    "email": f"{prefix}_{uid:07d}@example.com",
+                    "password_hash": password_hash,
+                    "created_at": signup,
+                }
+                for uid in ids
+            ])
+            conn.execute(insert(Settings), [{"user_id": uid} for uid in ids])
+    return user_ids
+
+
+def generate(n_users, days, seed, chunk_size, prefix, replace):
+    rng = np.random.default_rng(seed)
+    end_day = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    start_day = end_day - timedelta(days=days - 1)
+
+    print("=" * 70)
+    print("GENERATING SCALE TEST DATA")
+    print("=" * 70)
+    print(f"  Users: {n_users}, days: {days}, seed: {seed}, chunk size: {chunk_size}")
+
+    init_db()
+
+    with engine.connect() as conn:
+        # Bulk load settings for this connection only
+        conn.exec_driver_sql("PRAGMA synchronous = OFF")
+        conn.exec_driver_sql("PRAGMA cache_size = -200000")
+        conn.commit()
+
+        with conn.begin():
+            existing = conn.execute(
+                select(func.count()).select_from(User).where(User.username.like(f"{prefix}\\_%", escape="\\"))
+            ).scalar()
+        if existing:
+            if not replace:
+                print(f"\nERROR: {existing} '{prefix}_*' users already exist, use --replace to regenerate")
+                return False
+            with conn.begin():
+                removed = delete_previous_run(conn, prefix)
+            print(f"\n>> Removed {removed} users from a previous run")
+
+        started = time.perf_counter()
+        # Everyone signs up at the start of the first generated day, before their first entry
+        user_ids = create_users(conn, n_users, prefix, chunk_size, start_day)
+        print(f"\n>> Created {len(user_ids)} users in {time.perf_counter() - started:.1f}s")
+
+        with conn.begin():
+            next_id = (conn.execute(select(func.max(MoodEntry.id))).scalar() or 0) + 1
+        chunk = []
+        total = 0
+        started = time.perf_counter()
+
+        def flush():
+            nonlocal total
+            with conn.begin():
+                conn.execute(insert(MoodEntry), chunk)
+                entry_tags = [
+                    tag_row
+                    for row in chunk
+                    for tag_row in tag_rows(row["id"], row["user_id"], row["created_at"].date(), row["mood_tags"])
+                ]
+                if entry_tags:
+                    conn.execute(insert(MoodEntryTag), entry_tags)
+            total += len(chunk)
+            chunk.clear()
+            rate = total / (time.perf_counter() - started)
+            print(f"  {total:>12,} entries  ({rate:,.0f} rows/s)")
+
+        for user_id in user_ids:
+            for created_at, m, r in user_entries(rng, start_day, days):
+                message, label, polarity, tags = SAMPLE_MESSAGES[m]
+                chunk.append({
+                    "id": next_id,
+                    "user_id": user_id,
+                    "user_message": message,
+                    "eli_response": ELI_RESPONSES[r],
+                    "sentiment_score": round((polarity + 1) / 2, 2),
+                    "sentiment_label": label,
+                    "sentiment_source": "seed",
+                    "mood_tags": tags,
+                    "created_at": created_at,
+                })
+                next_id += 1
+                if len(chunk) >= chunk_size:
+                    flush()
+        if chunk:
+            flush()
+
+    elapsed = time.perf_counter() - started
+    print(f"\n>> Inserted {total:,} mood entries in {elapsed:.1f}s "
+          f"(avg {total / max(n_users, 1):,.0f} per user)")
+    print("\n" + "=" * 70)
+    print("GENERATION COMPLETE!")
+    print("=" * 70)
+    print(f"\nAll '{prefix}_*' users have the password: password123")
+    print("Run build_memory.py to index their check-ins for Eli's long-term memory")
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk generate synthetic users and mood entries")
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--days", type=int, default=730, help="Days of history per user")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--chunk-size", type=int, default=50000, help="Rows per insert transaction")
+    parser.add_argument("--prefix", default="loadtest", help="Username prefix for generated users")
+    parser.add_argument("--replace", action="store_true", help="Delete users from a previous run first")
+    args = parser.parse_args()
+
+    if not generate(args.users, args.days, args.seed, args.chunk_size, args.prefix, args.replace):
+        sys.exit(1)
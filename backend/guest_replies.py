@@ -0,0 +1,197 @@
+"""
+Cached replies for guests' quick prompts.
+
+Guests send no history, so a given prompt always makes the same gpt-4o
+request, and most guest traffic is the quick prompts on the chat page
+(QUICK_PROMPTS mirrors Chat.jsx). For those, and for any other short prompt
+guests keep sending (PROMOTE_AFTER times in one process), this keeps a small
+pool of Eli's replies per normalized prompt, each with its sentiment and
+mood tags:
+
+  - until a pool holds POOL_SIZE replies, guests get a live reply and it is
+    added to the pool, so filling it costs no extra calls
+  - a full pool is served in rotation, so repeat visitors see varied replies,
+    and takes nothing from the global rate limit (live replies do)
+  - replies older than TTL_MINUTES are still served, but a background thread
+    replaces them one at a time at "background" priority
+
+Pools live in a make_cache() cache, so under serve.py all workers share
+them. Signed-in users never use this: their chats carry history.
+"""
+import itertools
+import os
+import queue
+import re
+import threading
+import time
+
+import rate_limit
+from cache import make_cache
+from eli_ai import CHAT_FALLBACK, eli
+
+ENABLED = os.environ.get("ELI_GUEST_CACHE", "1") == "1"
+POOL_SIZE = int(os.environ.get("ELI_GUEST_CACHE_POOL", "4"))
+TTL_MINUTES = float(os.environ.get("ELI_GUEST_CACHE_TTL_MINUTES", "360"))
+PROMOTE_AFTER = int(os.environ.get("ELI_GUEST_CACHE_PROMOTE_AFTER", "3"))
+
+QUICK_PROMPTS = [
+    "I'm feeling overwhelmed today",
+    "Things are going well",
+    "I need someone to talk to",
+    "Feeling anxious",
+]
+
+# Longer messages are personal enough that they are never pooled
+MAX_PROMPT_CHARS = 80
+MAX_POOLS = 200
+# How long a refresh may take before another worker tries the same pool
+REFRESH_LEASE_SECONDS = 120
+
+pool_cache = make_cache("guest_replies", max_entries=MAX_POOLS)
+
+_SPACE_RE = re.compile(r"\s+")
+
+
+def normalize(message):
+    """Pool key for a message: case, spacing, curly quotes and end punctuation don't matter"""
+    text = message.replace("’", "'").lower()
+    return _SPACE_RE.sub(" ", text).strip().rstrip(".!?").strip()
+
+
+class GuestReplyCache:
+    def __init__(self, cache=pool_cache, pool_size=POOL_SIZE, ttl_minutes=TTL_MINUTES,
+                 promote_after=PROMOTE_AFTER):
+        self.cache = cache
+        self.pool_size = pool_size
+        self.ttl_seconds = ttl_minutes * 60
+        self.promote_after = promote_after
+        self.prompts = {normalize(p) for p in QUICK_PROMPTS}
+        self._seen = {}
+        self._rotation = itertools.count()
+        self._lock = threading.Lock()
+        self.queue = queue.Queue(maxsize=MAX_POOLS)
+        self._stop = threading.Event()
+        self._thread = None
+        self.counts = {"served": 0, "filled": 0, "uncached": 0, "refreshed": 0, "refresh_failed": 0}
+
+    def _count(self, name):
+        with self._lock:
+            self.counts[name] += 1
+
+    def _cacheable(self, key):
+        if key in self.prompts:
+            return True
+        if not key or len(key) > MAX_PROMPT_CHARS or not self.promote_after:
+            return False
+        with self._lock:
+            if len(self._seen) > 10000:
+                self._seen.clear()
+            self._seen[key] = self._seen.get(key, 0) + 1
+            if self._seen[key] >= self.promote_after and len(self.prompts) < MAX_POOLS:
+                self.prompts.add(key)
+                return True
+        return False
+
+    def _live(self, message, priority="chat"):
+        """A fresh reply: (variant dict, usable for the pool)"""
+        reply, sentiment_data = eli.respond(message, [], priority=priority)
+        variant = {
+            "reply": reply,
+            "sentiment": sentiment_data,
+            "mood_tags": eli.get_mood_tags(sentiment_data),
+            "created_at": time.time(),
+        }
+        return variant, reply != CHAT_FALLBACK
+
+    def reply(self, message):
+        """(reply, sentiment_data, mood_tags) for a guest's message"""
+        key = normalize(message)
+        if not ENABLED or not self._cacheable(key):
+            self._count("uncached")
+            rate_limit.limit_guest_llm()
+            variant, _ = self._live(message)
+        else:
+            pool = self.cache.get(key) or {"prompt": message, "replies": [], "refreshing_until": 0}
+            if len(pool["replies"]) >= self.pool_size:
+                variant = pool["replies"][next(self._rotation) % len(pool["replies"])]
+                self._count("served")
+                self._refresh_if_stale(key, pool)
+            else:
+                rate_limit.limit_guest_llm()
+                variant, usable = self._live(message)
+                if usable:
+                    # Re-read so replies added meanwhile by other requests are kept
+                    pool = self.cache.peek(key) or pool
+                    pool["replies"] = (pool["replies"] + [variant])[-self.pool_size:]
+                    self.cache.set(key, pool)
+                    self._count("filled")
+        return variant["reply"], variant["sentiment"], variant["mood_tags"]
+
+    def _refresh_if_stale(self, key, pool):
+        now = time.time()
+        oldest = min(variant["created_at"] for variant in pool["replies"])
+        if now - oldest < self.ttl_seconds or pool.get("refreshing_until", 0) > now:
+            return
+        # Claim the refresh in the shared pool so other workers don't repeat it
+        pool["refreshing_until"] = now + REFRESH_LEASE_SECONDS
+        self.cache.set(key, pool)
+        try:
+            self.queue.put_nowait(key)
+        except queue.Full:
+            pass
+
+    def refresh(self, key):
+        """Replace the oldest reply in a pool with a new one"""
+        pool = self.cache.peek(key)
+        if pool is None:
+            return
+        variant, usable = self._live(pool["prompt"], priority="background")
+        pool = self.cache.peek(key) or pool
+        if not usable:
+            self._count("refresh_failed")
+            # Retry after the lease runs out
+            return
+        replies = sorted(pool["replies"], key=lambda v: v["created_at"])
+        pool["replies"] = replies[1:] + [variant]
+        pool["refreshing_until"] = 0
+        self.cache.set(key, pool)
+        self._count("refreshed")
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="guest-reply-refresher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                key = self.queue.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            try:
+                self.refresh(key)
+            except Exception as e:
+                self._count("refresh_failed")
+                print(f"Refreshing guest replies for {key!r} failed: {e}")
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self.counts)
+        answered = counts["served"] + counts["filled"] + counts["uncached"]
+        return {
+            "enabled": ENABLED,
+            "prompts": len(self.prompts),
+            **counts,
+            "served_rate": round(counts["served"] / answered, 4) if answered else None,
+            "refresh_queue": self.queue.qsize(),
+        }
+
+
+guest_cache = GuestReplyCache()
@@ -0,0 +1,178 @@
+"""
+Admission and scheduling for OpenAI calls.
+
+Every completion goes through one LLMDispatcher, which caps how many calls
+are in flight at once (ELI_LLM_MAX_CONCURRENCY) and hands free slots out by
+priority class, so interactive chat never waits behind a burst of dashboard
+summaries:
+
+    chat        Eli's reply to a check-in
+    sentiment   scoring a check-in
+    background  daily summaries and weekly insights
+
+Within a class, callers are served first come, first served. Background
+calls only get a bounded queue (ELI_LLM_BACKGROUND_QUEUE); past that they
+are rejected immediately instead of tying up a worker thread, and callers
+fall back to their canned text. Waits longer than ELI_LLM_QUEUE_TIMEOUT
+seconds give up the same way.
+
+The OpenAI client is built on a shared httpx connection pool sized to the
+concurrency cap, with long keep-alive so calls reuse warm TLS connections.
+Queue depth and wait times are reported by /api/internal/metrics.
+"""
+import heapq
+import itertools
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from timing import span
+
+PRIORITIES = {"chat": 0, "sentiment": 1, "background": 2}
+
+MAX_CONCURRENCY = int(os.environ.get("ELI_LLM_MAX_CONCURRENCY", "16"))
+QUEUE_TIMEOUT = float(os.environ.get("ELI_LLM_QUEUE_TIMEOUT", "30"))
+QUEUE_LIMITS = {"background": int(os.environ.get("ELI_LLM_BACKGROUND_QUEUE", "8"))}
+
+KEEPALIVE_SECONDS = 120
+CONNECT_TIMEOUT = 5.0
+REQUEST_TIMEOUT = 60.0
+
+
+class LLMQueueFull(Exception):
+    """Raised when a call can't be admitted (queue limit or wait timeout)"""
+
+
+class _ClassStats:
+    __slots__ = ("admitted", "rejected", "timed_out", "queued", "max_queued", "wait_total", "wait_max", "recent_waits")
+
+    def __init__(self):
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.queued = 0
+        self.max_queued = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.recent_waits = deque(maxlen=1000)
+
+    def as_dict(self):
+        waits = sorted(self.recent_waits)
+
+        def pct(p):
+            return round(waits[min(len(waits) - 1, int(p * len(waits)))] * 1000, 2) if waits else None
+
+        return {
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "queued": self.queued,
+            "max_queued": self.max_queued,
+            "wait_ms_avg": round(self.wait_total / self.admitted * 1000, 2) if self.admitted else None,
+            "wait_ms_p50": pct(0.5),
+            "wait_ms_p95": pct(0.95),
+            "wait_ms_max": round(self.wait_max * 1000, 2),
+        }
+
+
+class LLMDispatcher:
+    def __init__(self, max_concurrency=MAX_CONCURRENCY, queue_timeout=QUEUE_TIMEOUT, queue_limits=None):
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self.queue_limits = QUEUE_LIMITS if queue_limits is None else queue_limits
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._max_in_flight = 0
+        # (priority, seq) of every waiting caller; the smallest goes next
+        self._waiting = []
+        self._seq = itertools.count()
+        self._stats = {name: _ClassStats() for name in PRIORITIES}
+
+    def _acquire(self, priority):
+        stats = self._stats[priority]
+        start = time.perf_counter()
+        with self._cond:
+            if self._in_flight < self.max_concurrency and not self._waiting:
+                self._admit(stats, 0.0)
+                return
+
+            limit = self.queue_limits.get(priority)
+            if limit is not None and stats.queued >= limit:
+                stats.rejected += 1
+                raise LLMQueueFull(f"too many queued {priority} calls")
+
+            ticket = (PRIORITIES[priority], next(self._seq))
+            heapq.heappush(self._waiting, ticket)
+            stats.queued += 1
+            stats.max_queued = max(stats.max_queued, stats.queued)
+            deadline = start + self.queue_timeout
+            try:
+                while not (self._in_flight < self.max_concurrency and self._waiting[0] == ticket):
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        self._waiting.remove(ticket)
+                        heapq.heapify(self._waiting)
+                        stats.timed_out += 1
+                        # Whoever is next in line may be admissible now
+                        self._cond.notify_all()
+                        raise LLMQueueFull(f"{priority} call waited more than {self.queue_timeout:g}s")
+                    self._cond.wait(remaining)
+                heapq.heappop(self._waiting)
+            finally:
+                stats.queued -= 1
+            self._admit(stats, time.perf_counter() - start)
+            # More than one slot may have opened up
+            self._cond.notify_all()
+
+    def _admit(self, stats, waited):
+        self._in_flight += 1
+        self._max_in_flight = max(self._max_in_flight, self._in_flight)
+        stats.admitted += 1
+        stats.wait_total += waited
+        stats.wait_max = max(stats.wait_max, waited)
+        stats.recent_waits.append(waited)
+
+    def _release(self):
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, priority):
+        """Hold one of the concurrency slots for the duration of an LLM call"""
+        # Queue time is reported separately from the call itself
+        with span("llmq"):
+            self._acquire(priority)
+        try:
+            yield
+        finally:
+            self._release()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "max_concurrency": self.max_concurrency,
+                "in_flight": self._in_flight,
+                "max_in_flight": self._max_in_flight,
+                "queued": len(self._waiting),
+                "classes": {name: s.as_dict() for name, s in self._stats.items()},
+            }
+
+
+def build_http_client(max_connections=MAX_CONCURRENCY):
+    """Keep-alive connection pool for the OpenAI client, sized to the concurrency cap"""
+    import httpx
+
+    return httpx.Client(
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+            keepalive_expiry=KEEPALIVE_SECONDS,
+        ),
+        timeout=httpx.Timeout(REQUEST_TIMEOUT, connect=CONNECT_TIMEOUT),
+    )
+
+
+dispatcher = LLMDispatcher()
@@ -1,15 +1,74 @@
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session, undefer
 from pydantic import BaseModel, EmailStr
 from typing import List, Optional
-from datetime import datetime, timedelta
+from contextlib import asynccontextmanager
+from datetime import date, datetime, timedelta
+import os
 import database
-from database import get_db, MoodEntry, Settings, User
+from database import get_db, EnrichmentJob, MoodEntry, Settings, User
 from eli_ai import eli
-from auth import create_access_token, get_current_user, get_current_user_required
-
-app = FastAPI(title="Mood Tracker API")
+from llm_dispatcher import dispatcher
+from auth import create_access_token, get_current_user, get_current_user_required, require_admin
+import analytics
+import archive
+import backups
+import compressed_text
+import enrichment
+import export
+import guest_replies
+import memory
+import search
+import trends
+import cache
+import rate_limit
+import reminders
+import settings_store
+import summaries
+import tags
+import usage
+from timezones import is_valid_timezone, local_day, local_today, user_timezone
+from timing import ServerTimingMiddleware, TimedRoute, instrument_engine
+
+@asynccontextmanager
+async def lifespan(app):
+    # Schema setup runs once at startup rather than when database.py is imported.
+    # Under serve.py the master has already done it before forking this worker
+    if os.environ.get("ELI_SCHEMA_READY") == "1":
+        # A worker respawned after a --retrain still writes with the newest dictionary
+        compressed_text.load_dictionaries(database.engine)
+    else:
+        database.init_db()
+    # Also drains jobs left from an earlier run with deferred sentiment on
+    enrichment.worker.start()
+    if reminders.ENABLED:
+        reminders.scheduler.start()
+    # Only runs when ELI_BACKUP_INTERVAL_MINUTES is set
+    backups.job.start()
+    if guest_replies.ENABLED:
+        guest_replies.guest_cache.start()
+    usage.ledger.start()
+    yield
+    guest_replies.guest_cache.stop()
+    backups.job.stop()
+    reminders.scheduler.stop()
+    enrichment.worker.stop()
+    # Last, so it writes what the workers above recorded while stopping
+    usage.ledger.stop()
+
+app = FastAPI(title="Mood Tracker API", lifespan=lifespan)
+
+def warmup():
+    """Pay one-off costs before a worker takes traffic: open a DB connection,
+    build the OpenAI client and load the local sentiment model and NumPy."""
+    with database.engine.connect() as conn:
+        conn.exec_driver_sql("SELECT 1")
+    eli.client
+    eli.local_sentiment("warming up")
+    trends.compute_trends([], datetime.utcnow().date(), 7, "day")
+app.router.route_class = TimedRoute
 
 app.add_middleware(
     CORSMiddleware,
@@ -17,17 +76,22 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", "X-Trace-Id"],
 )
+# Outermost, so the reported total covers CORS handling too
+app.add_middleware(ServerTimingMiddleware)
+instrument_engine(database.engine)
 
 class ChatRequest(BaseModel):
     message: str
 
 class ChatResponse(BaseModel):
     eli_response: str
-    sentiment_score: float
-    sentiment_label: str
-    mood_tags: str
+    sentiment_score: Optional[float]  # None while sentiment_pending
+    sentiment_label: Optional[str]
+    mood_tags: Optional[str]
     entry_id: Optional[int] = None  # None for guest users
+    sentiment_pending: bool = False  # Scored in the background (ELI_DEFERRED_SENTIMENT)
 
 class MoodEntryResponse(BaseModel):
     id: int
@@ -46,12 +110,14 @@ class SettingsRequest(BaseModel):
     reminder_time: Optional[str] = None
     privacy_mode: Optional[bool] = None
     safe_mode: Optional[bool] = None
+    timezone: Optional[str] = None
 
 class SettingsResponse(BaseModel):
     reminder_enabled: bool
     reminder_time: str
     privacy_mode: bool
     safe_mode: bool
+    timezone: str
 
     class Config:
         from_attributes = True
@@ -60,6 +126,7 @@ class SignupRequest(BaseModel):
     username: str
     email: str  # Changed from EmailStr to str for simpler validation
     password: str
+    timezone: Optional[str] = None  # IANA name from the browser, e.g. "America/Chicago"
 
 class LoginRequest(BaseModel):
     username: str
@@ -115,8 +182,11 @@ def signup(request: SignupRequest, db: Session = Depends(get_db)):
 
         # Create default settings for user
         user_settings = Settings(user_id=new_user.id)
+        if request.timezone and is_valid_timezone(request.timezone):
+            user_settings.timezone = request.timezone
         db.add(user_settings)
         db.commit()
+        settings_store.prime(user_settings)
 
         # Create access token
         access_token = create_access_token(data={"sub": new_user.id})
@@ -186,7 +256,7 @@ def verify_password(
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/api/chat", response_model=ChatResponse)
+@app.post("/api/chat", response_model=ChatResponse, dependencies=[Depends(rate_limit.limit_chat)])
 def chat_with_eli(
     request: ChatRequest,
     db: Session = Depends(get_db),
@@ -196,10 +266,12 @@ def chat_with_eli(
         # For authenticated users: load conversation history from database
         # For guest users: no conversation history (frontend will provide via localStorage)
         conversation_history = []
+        memories = []
 
         if current_user:
             print(f"🔐 /api/chat - Authenticated user: {current_user.username} (ID: {current_user.id})")
-            recent_entries = db.query(MoodEntry).filter(
+            usage.set_user(current_user.id)
+            recent_entries = db.query(MoodEntry).options(undefer(MoodEntry.eli_response)).filter(
                 MoodEntry.user_id == current_user.id
             ).order_by(MoodEntry.created_at.desc()).limit(5).all()
 
@@ -210,31 +282,52 @@ def chat_with_eli(
                 }
                 for entry in reversed(recent_entries)
             ]
+            # Older check-ins similar to this one, beyond the recent turns
+            memories = memory.recall(db, current_user.id, request.message,
+                                     exclude_ids=[entry.id for entry in recent_entries])
         else:
             print(f"👤 /api/chat - Guest user (no auth token)")
 
-        eli_response = eli.chat(request.message, conversation_history)
-
-        sentiment_data = eli.analyze_sentiment(request.message)
-        mood_tags = eli.get_mood_tags(sentiment_data)
+        sentiment_pending = current_user is not None and enrichment.DEFERRED_SENTIMENT
+        if sentiment_pending:
+            # Sentiment and mood tags are filled in later by the enrichment worker
+            eli_response = eli.chat(request.message, conversation_history, memories)
+            sentiment_data, mood_tags = {"score": None, "label": None}, None
+        elif not current_user:
+            # GUEST USERS: no history, so quick prompts are answered from a pool of cached replies
+            eli_response, sentiment_data, mood_tags = guest_replies.guest_cache.reply(request.message)
+        else:
+            eli_response, sentiment_data = eli.respond(request.message, conversation_history, memories)
+            mood_tags = eli.get_mood_tags(sentiment_data)
 
         # ONLY save to database for authenticated users
         entry_id = None
         if current_user:
+            created_at = datetime.utcnow()
             new_entry = MoodEntry(
                 user_id=current_user.id,
                 user_message=request.message,
                 eli_response=eli_response,
                 sentiment_score=sentiment_data["score"],
                 sentiment_label=sentiment_data["label"],
+                sentiment_source=sentiment_data.get("source"),
                 mood_tags=mood_tags,
-                created_at=datetime.utcnow()
+                created_at=created_at,
+                local_day=local_day(created_at, user_timezone(db, current_user.id))
             )
 
             db.add(new_entry)
+            db.flush()
+            tags.add_entry_tags(db, new_entry)
+            if sentiment_pending:
+                db.add(EnrichmentJob(entry_id=new_entry.id))
             db.commit()
             db.refresh(new_entry)
             entry_id = new_entry.id
+            if sentiment_pending:
+                enrichment.worker.enqueue(entry_id)
+            memory.remember(current_user.id, entry_id, request.message)
+            trends.invalidate_user(current_user.id)
             print(f"   Saved entry {entry_id} for user {current_user.id}")
 
         return ChatResponse(
@@ -242,9 +335,12 @@ def chat_with_eli(
             sentiment_score=sentiment_data["score"],
             sentiment_label=sentiment_data["label"],
             mood_tags=mood_tags,
-            entry_id=entry_id  # None for guests, actual ID for authenticated users
+            entry_id=entry_id,  # None for guests, actual ID for authenticated users
+            sentiment_pending=sentiment_pending
         )
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -259,7 +355,7 @@ def get_mood_entries(
         if current_user:
             print(f"🔐 /api/entries - Authenticated user: {current_user.username} (ID: {current_user.id})")
             cutoff_date = datetime.utcnow() - timedelta(days=days)
-            entries = db.query(MoodEntry).filter(
+            entries = db.query(MoodEntry).options(undefer(MoodEntry.eli_response)).filter(
                 MoodEntry.user_id == current_user.id,
                 MoodEntry.created_at >= cutoff_date
             ).order_by(MoodEntry.created_at.desc()).all()
@@ -281,10 +377,10 @@ def get_today_entries(
     try:
         # AUTHENTICATED USERS ONLY: Return their entries from database
         if current_user:
-            today_start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
-            entries = db.query(MoodEntry).filter(
+            today = local_today(user_timezone(db, current_user.id))
+            entries = db.query(MoodEntry).options(undefer(MoodEntry.eli_response)).filter(
                 MoodEntry.user_id == current_user.id,
-                MoodEntry.created_at >= today_start
+                MoodEntry.local_day == today
             ).order_by(MoodEntry.created_at.asc()).all()
             return entries
         else:
@@ -294,69 +390,86 @@ def get_today_entries(
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/api/summary/daily")
-def get_daily_summary(
+@app.get("/api/entries/export")
+def export_entries(
+    format: str = "ndjson",
+    gzip: bool = False,
+    current_user: User = Depends(get_current_user_required)
+):
+    """Stream the user's complete mood history as NDJSON or CSV, optionally gzipped"""
+    if format not in export.FORMATS:
+        raise HTTPException(status_code=400, detail="format must be 'ndjson' or 'csv'")
+
+    filename = f"mood-history-{datetime.utcnow().strftime('%Y%m%d')}.{format}"
+    media_type = export.FORMATS[format]
+    if gzip:
+        filename += ".gz"
+        media_type = "application/gzip"
+
+    return StreamingResponse(
+        export.stream_export(current_user.id, format, gzip=gzip),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@app.get("/api/entries/search")
+def search_mood_entries(
+    q: str,
+    page: int = 1,
+    page_size: int = 20,
     db: Session = Depends(get_db),
     current_user: Optional[User] = Depends(get_current_user)
 ):
     try:
-        today_start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
-
-        # AUTHENTICATED USERS ONLY: Return their summary from database
+        # AUTHENTICATED USERS ONLY: search their entries in the database
         if current_user:
-            entries = db.query(MoodEntry).filter(
-                MoodEntry.user_id == current_user.id,
-                MoodEntry.created_at >= today_start
-            ).all()
+            results = search.search_entries(db, current_user.id, q, page=page, page_size=page_size)
+        else:
+            # GUEST USERS: Nothing stored server-side to search
+            results = {"results": [], "page": page, "page_size": page_size, "has_more": False}
+        return {"query": q, **results}
 
-            summary = eli.generate_daily_summary(entries)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/summary/daily", dependencies=[Depends(rate_limit.limit_summary)])
+def get_daily_summary(
+    db: Session = Depends(get_db),
+    current_user: Optional[User] = Depends(get_current_user)
+):
+    try:
+        # AUTHENTICATED USERS ONLY: Return their summary from database
+        if current_user:
+            usage.set_user(current_user.id)
+            today = local_today(user_timezone(db, current_user.id))
             return {
-                "summary": summary,
-                "entry_count": len(entries),
-                "date": today_start.date().isoformat()
+                **summaries.get_daily_summary(db, current_user.id, today),
+                "date": today.isoformat()
             }
         else:
             # GUEST USERS: Return empty summary (they use localStorage on frontend)
             return {
                 "summary": "",
                 "entry_count": 0,
-                "date": today_start.date().isoformat()
+                "date": datetime.utcnow().date().isoformat()
             }
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/api/summary/weekly")
+@app.get("/api/summary/weekly", dependencies=[Depends(rate_limit.limit_summary)])
 def get_weekly_summary(
     db: Session = Depends(get_db),
     current_user: Optional[User] = Depends(get_current_user)
 ):
     try:
-        week_start = datetime.utcnow() - timedelta(days=7)
-
-        # AUTHENTICATED USERS ONLY: Return their summary from database
+        # AUTHENTICATED USERS ONLY: Build insights from their stored daily summaries
         if current_user:
-            entries = db.query(MoodEntry).filter(
-                MoodEntry.user_id == current_user.id,
-                MoodEntry.created_at >= week_start
-            ).all()
-
-            insights = eli.generate_weekly_insights(entries)
-
-            positive_count = sum(1 for e in entries if e.sentiment_label == "positive")
-            negative_count = sum(1 for e in entries if e.sentiment_label == "negative")
-            neutral_count = sum(1 for e in entries if e.sentiment_label == "neutral")
-
-            return {
-                "insights": insights,
-                "entry_count": len(entries),
-                "positive_count": positive_count,
-                "negative_count": negative_count,
-                "neutral_count": neutral_count,
-                "week_start": week_start.date().isoformat()
-            }
+            usage.set_user(current_user.id)
+            today = local_today(user_timezone(db, current_user.id))
+            return summaries.get_weekly_insights(db, current_user.id, today)
         else:
+            week_start = datetime.utcnow() - timedelta(days=summaries.WEEK_DAYS - 1)
             # GUEST USERS: Return empty summary (they use localStorage on frontend)
             return {
                 "insights": "",
@@ -370,38 +483,40 @@ def get_weekly_summary(
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/api/settings", response_model=SettingsResponse)
-def get_settings(
+@app.get("/api/trends")
+def get_mood_trends(
+    range_: str = Query("90d", alias="range"),
+    bucket: str = "day",
     db: Session = Depends(get_db),
     current_user: Optional[User] = Depends(get_current_user)
 ):
+    n_days = trends.parse_range(range_)
+    if n_days is None:
+        raise HTTPException(status_code=400, detail=f"range must look like 90d, 12w or 1y (max {trends.MAX_RANGE_DAYS} days)")
+    if bucket not in trends.BUCKETS:
+        raise HTTPException(status_code=400, detail="bucket must be 'day' or 'week'")
+
     try:
-        # Query settings based on user
+        # AUTHENTICATED USERS ONLY: Return their trends from database
         if current_user:
-            settings = db.query(Settings).filter(Settings.user_id == current_user.id).first()
-
-            if not settings:
-                # Create new settings for authenticated user
-                settings = Settings(user_id=current_user.id)
-                db.add(settings)
-                db.commit()
-                db.refresh(settings)
+            today = local_today(user_timezone(db, current_user.id))
+            return {"range": range_, **trends.get_trends(db, current_user.id, today, n_days, bucket)}
         else:
-            # Guest mode - get first settings or create default
-            settings = db.query(Settings).filter(Settings.user_id == None).first()
-
-            if not settings:
-                settings = Settings(user_id=None)
-                db.add(settings)
-                db.commit()
-                db.refresh(settings)
-
-        return SettingsResponse(
-            reminder_enabled=bool(settings.reminder_enabled),
-            reminder_time=settings.reminder_time,
-            privacy_mode=bool(settings.privacy_mode),
-            safe_mode=bool(settings.safe_mode)
-        )
+            # GUEST USERS: Return an empty series (they use localStorage on frontend)
+            return {"range": range_, "bucket": bucket, "points": []}
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/settings", response_model=SettingsResponse)
+def get_settings(
+    db: Session = Depends(get_db),
+    current_user: Optional[User] = Depends(get_current_user)
+):
+    try:
+        # Served from the settings cache; guests share the user_id IS NULL row
+        user_id = current_user.id if current_user else None
+        return SettingsResponse(**settings_store.get_user_settings(db, user_id))
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -413,41 +528,93 @@ def update_settings(
     current_user: Optional[User] = Depends(get_current_user)
 ):
     try:
-        # Query settings based on user
-        if current_user:
-            settings = db.query(Settings).filter(Settings.user_id == current_user.id).first()
+        if request.timezone is not None and not is_valid_timezone(request.timezone):
+            raise HTTPException(status_code=400, detail="Unknown timezone")
 
-            if not settings:
-                settings = Settings(user_id=current_user.id)
-                db.add(settings)
-        else:
-            # Guest mode - get first settings or create default
-            settings = db.query(Settings).filter(Settings.user_id == None).first()
-
-            if not settings:
-                settings = Settings(user_id=None)
-                db.add(settings)
-
-        # Only update fields that are provided
-        if request.reminder_enabled is not None:
-            settings.reminder_enabled = int(request.reminder_enabled)
-        if request.reminder_time is not None:
-            settings.reminder_time = request.reminder_time
-        if request.privacy_mode is not None:
-            settings.privacy_mode = int(request.privacy_mode)
-        if request.safe_mode is not None:
-            settings.safe_mode = int(request.safe_mode)
-        settings.updated_at = datetime.utcnow()
+        # Only fields that are provided get updated; the cache is written through
+        user_id = current_user.id if current_user else None
+        settings = settings_store.update_user_settings(db, user_id, request.model_dump())
+        reminders.scheduler.apply(user_id, settings)
+        return SettingsResponse(**settings)
 
-        db.commit()
-        db.refresh(settings)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-        return SettingsResponse(
-            reminder_enabled=bool(settings.reminder_enabled),
-            reminder_time=settings.reminder_time,
-            privacy_mode=bool(settings.privacy_mode),
-            safe_mode=bool(settings.safe_mode)
-        )
+@app.get("/api/internal/metrics", dependencies=[Depends(require_admin)])
+def get_internal_metrics():
+    """Cache hit rates, LLM queue depth and wait times, and other in-process counters"""
+    return {"caches": cache.all_stats(), "llm": dispatcher.stats(), "rate_limits": rate_limit.limiter.stats(),
+            "enrichment": enrichment.worker.stats(), "reminders": reminders.scheduler.stats(),
+            "backups": backups.job.stats(), "memory": memory.index.stats(),
+            "guest_replies": guest_replies.guest_cache.stats(), "usage": usage.ledger.stats()}
+
+@app.get("/api/internal/usage", dependencies=[Depends(require_admin)])
+def get_internal_usage(
+    days: int = Query(7, ge=1, le=366),
+    top: int = Query(20, ge=1, le=500)
+):
+    """OpenAI token usage and estimated cost by operation, day and top user"""
+    try:
+        return usage.ledger.report(days, top)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/internal/analytics/export", dependencies=[Depends(require_admin)])
+def export_analytics(
+    format: str = "parquet",
+    text: bool = False,
+    start: Optional[date] = None,
+    end: Optional[date] = None
+):
+    """Stream every user's mood entries (local_day between start and end) as Parquet or an Arrow IPC stream"""
+    if format not in analytics.FORMATS:
+        raise HTTPException(status_code=400, detail="format must be 'parquet' or 'arrow'")
+
+    try:
+        chunks = analytics.stream_export(format, include_text=text, start=start, end=end)
+    except RuntimeError as e:
+        # pyarrow not installed
+        raise HTTPException(status_code=503, detail=str(e))
+
+    media_type, extension = analytics.FORMATS[format]
+    filename = f"mood-entries-{datetime.utcnow().strftime('%Y%m%d')}.{extension}"
+    return StreamingResponse(
+        chunks,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@app.get("/api/stats/tags")
+def get_tag_stats(
+    days: int = Query(30, ge=1, le=3650),
+    db: Session = Depends(get_db),
+    current_user: Optional[User] = Depends(get_current_user)
+):
+    """How often each mood tag appeared over the last `days` local days"""
+    try:
+        # AUTHENTICATED USERS ONLY: Count tags from database
+        if current_user:
+            end = local_today(user_timezone(db, current_user.id))
+            start = end - timedelta(days=days - 1)
+            counts = tags.tag_histogram(db, current_user.id, start, end)
+        else:
+            # GUEST USERS: Nothing stored server-side
+            end = datetime.utcnow().date()
+            start = end - timedelta(days=days - 1)
+            counts = []
+
+        total = sum(count for _, count in counts)
+        return {
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            "total_tags": total,
+            "tags": [
+                {"tag": tag, "count": count, "share": round(count / total, 4)}
+                for tag, count in counts
+            ]
+        }
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -461,11 +628,11 @@ def get_stats_overview(
         # AUTHENTICATED USERS ONLY: Return their stats from database
         if current_user:
             week_start = datetime.utcnow() - timedelta(days=7)
-            today_start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+            today = local_today(user_timezone(db, current_user.id))
 
             total_entries = db.query(MoodEntry).filter(
                 MoodEntry.user_id == current_user.id
-            ).count()
+            ).count() + archive.archived_count(db, current_user.id)
 
             week_entries = db.query(MoodEntry).filter(
                 MoodEntry.user_id == current_user.id,
@@ -474,7 +641,7 @@ def get_stats_overview(
 
             today_entries = db.query(MoodEntry).filter(
                 MoodEntry.user_id == current_user.id,
-                MoodEntry.created_at >= today_start
+                MoodEntry.local_day == today
             ).count()
 
             avg_sentiment = 0.5
@@ -0,0 +1,312 @@
+"""
+Long-term memory: earlier check-ins that resemble the current one.
+
+Eli's prompt only carries the last few turns (see chat_with_eli), so a
+stressor that came up weeks ago is invisible to it. This keeps a small
+vector index per user and, for each chat, retrieves the most similar earlier
+check-ins that fit in a fixed token budget.
+
+Embeddings are hashed TF-IDF on CPU: the words of a message, minus stop
+words and with common suffixes stripped, are hashed with crc32 (as in
+sentiment_model.py) into DIMENSIONS signed buckets, weighted by 1 + log(tf)
+times the word's IDF and L2-normalized. Bigrams were tried and left out:
+check-ins are short, and they diluted the overlap of the words themselves.
+The IDF table (idf.npy) is computed over every check-in by build_memory.py;
+until it exists all words weigh the same.
+
+Each user's index is one append-only file of fixed-size records (entry id,
+scale, int8-quantized vector) under MEMORY_DIR, read as a NumPy memmap.
+remember() appends a record when a check-in is saved; a query is a
+matrix-vector product over the user's records restricted to the query's
+nonzero buckets, well under a millisecond for thousands of check-ins. The
+files are derived data: build_memory.py rebuilds them from the database and
+the archive.
+"""
+import os
+import threading
+import time
+import zlib
+
+from sqlalchemy import select
+
+import archive
+from database import ArchiveBlock, ArchivedEntry, MoodEntry
+from timing import span
+
+# Set to 0 to stop retrieving and indexing memories
+ENABLED = os.environ.get("ELI_MEMORY", "1") == "1"
+MEMORY_DIR = os.environ.get("ELI_MEMORY_DIR", "memory_index")
+TOP_K = int(os.environ.get("ELI_MEMORY_TOP_K", "3"))
+# Rough token budget for all the memories added to one prompt
+TOKEN_BUDGET = int(os.environ.get("ELI_MEMORY_TOKEN_BUDGET", "200"))
+MIN_SIMILARITY = float(os.environ.get("ELI_MEMORY_MIN_SIMILARITY", "0.15"))
+
+DIMENSIONS = 1024
+IDF_FEATURES = 2 ** 18
+# Longer messages are cut before they are added to the prompt
+MAX_MEMORY_CHARS = 280
+
+STOP_WORDS = frozenset("""
+a about am an and are as at be been but by can could did do does doing for from
+had has have having he her him his how i i'm i've if in into is it it's its just
+me my myself of on or our so some than that the their them then there they this
+to too was we were what when which who why will with would you your
+""".split())
+
+
+def estimate_tokens(text):
+    """About four characters per token for English text"""
+    return len(text) // 4 + 1
+
+
+def _record_dtype():
+    import numpy as np
+    return np.dtype([("id", "<i8"), ("scale", "<f4"), ("vector", "i1", (DIMENSIONS,))])
+
+
+def _stem(token):
+    """Crude suffix stripping, enough to match plurals and tenses of the same word"""
+    if token.endswith(("ies", "ied")) and len(token) > 4:
+        return token[:-3] + "y"
+    if token.endswith("s") and not token.endswith("ss") and len(token) > 3:
+        token = token[:-1]
+    for suffix in ("ing", "ed"):
+        if token.endswith(suffix) and len(token) - len(suffix) >= 3:
+            return token[:-len(suffix)]
+    return token
+
+
+def terms(text):
+    """The words of `text` that are embedded (nightmares -> nightmare, "the" dropped)"""
+    from sentiment_model import tokenize
+    return [_stem(token) for token in tokenize(text) if token not in STOP_WORDS]
+
+
+class MemoryIndex:
+    def __init__(self, directory):
+        self.directory = directory
+        self._idf = None
+        self._idf_mtime = None
+        self._lock = threading.Lock()
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.appends = 0
+
+    def user_path(self, user_id):
+        # Sharded so no directory holds more than a few thousand files
+        return os.path.join(self.directory, f"{user_id % 256:02x}", f"{user_id}.vec")
+
+    @property
+    def idf_path(self):
+        return os.path.join(self.directory, "idf.npy")
+
+    def idf(self):
+        """The IDF table, reloaded when build_memory.py replaces it; None until built"""
+        import numpy as np
+        try:
+            mtime = os.stat(self.idf_path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        if mtime != self._idf_mtime:
+            with self._lock:
+                self._idf = np.load(self.idf_path)
+                self._idf_mtime = mtime
+        return self._idf
+
+    def embed(self, text, idf=None):
+        """Normalized float32 vector for `text`, or None if it has no usable words"""
+        import numpy as np
+        counts = {}
+        for term in terms(text):
+            h = zlib.crc32(term.encode("utf-8"))
+            counts[h] = counts.get(h, 0) + 1
+        if not counts:
+            return None
+        hashes = np.fromiter(counts.keys(), dtype=np.uint32, count=len(counts))
+        weights = 1 + np.log(np.fromiter(counts.values(), dtype=np.float32, count=len(counts)))
+        idf = self.idf() if idf is None else idf
+        if idf is not None:
+            weights *= idf[hashes % IDF_FEATURES]
+        # The top bit picks the sign, so colliding words tend to cancel out
+        # instead of piling up in one bucket
+        weights = np.where(hashes >> 31, -weights, weights)
+        vector = np.zeros(DIMENSIONS, dtype=np.float32)
+        np.add.at(vector, hashes % DIMENSIONS, weights)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
+
+    def encode(self, entry_id, vector):
+        """One index record for an embedded entry"""
+        import numpy as np
+        record = np.zeros(1, dtype=_record_dtype())
+        scale = float(np.abs(vector).max()) / 127
+        record["id"] = entry_id
+        record["scale"] = scale
+        record["vector"] = np.round(vector / scale).astype(np.int8)
+        return record
+
+    def add(self, user_id, entry_id, text):
+        vector = self.embed(text)
+        if vector is None:
+            return
+        path = self.user_path(user_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # One small O_APPEND write, so concurrent workers don't interleave records
+        with open(path, "ab") as f:
+            f.write(self.encode(entry_id, vector).tobytes())
+        self.appends += 1
+
+    def records(self, user_id):
+        """The user's records as a read-only memmap (None if there are none)"""
+        import numpy as np
+        path = self.user_path(user_id)
+        dtype = _record_dtype()
+        try:
+            # A record cut short by a crash is ignored
+            count = os.path.getsize(path) // dtype.itemsize
+        except FileNotFoundError:
+            return None
+        if not count:
+            return None
+        return np.memmap(path, dtype=dtype, mode="r", shape=(count,))
+
+    def search(self, user_id, text, k=TOP_K, exclude_ids=(), min_similarity=MIN_SIMILARITY):
+        """[(entry_id, similarity)] of the user's most similar entries, best first"""
+        import numpy as np
+        started = time.perf_counter()
+        try:
+            query = self.embed(text)
+            records = self.records(user_id)
+            if query is None or records is None:
+                return []
+            # The query only has a dozen or so nonzero buckets; reading just
+            # those columns is much cheaper than converting the whole matrix
+            columns = np.flatnonzero(query)
+            scores = (records["vector"][:, columns].astype(np.float32) @ query[columns]) * records["scale"]
+            ids = records["id"]
+            if exclude_ids:
+                scores[np.isin(ids, list(exclude_ids))] = -1
+            # A few extra candidates, in case an entry was indexed twice
+            n = min(len(scores), k * 2)
+            top = np.argpartition(-scores, n - 1)[:n]
+            results, seen = [], set()
+            for i in top[np.argsort(-scores[top])]:
+                entry_id = int(ids[i])
+                if scores[i] < min_similarity or len(results) == k:
+                    break
+                if entry_id not in seen:
+                    seen.add(entry_id)
+                    results.append((entry_id, round(float(scores[i]), 3)))
+            return results
+        finally:
+            self.queries += 1
+            self.query_seconds += time.perf_counter() - started
+
+    def rebuild_user(self, user_id, entries, idf=None):
+        """Replace a user's index with [(entry_id, text)]; returns the number indexed"""
+        import numpy as np
+        records = []
+        for entry_id, text in entries:
+            vector = self.embed(text, idf)
+            if vector is not None:
+                records.append(self.encode(entry_id, vector))
+        path = self.user_path(user_id)
+        if not records:
+            self.drop_users([user_id])
+            return 0
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        np.concatenate(records).tofile(tmp_path)
+        os.replace(tmp_path, path)
+        return len(records)
+
+    def save_idf(self, document_frequency, n_documents):
+        """Write idf.npy from per-word document counts (an IDF_FEATURES array)"""
+        import numpy as np
+        idf = np.log((1 + n_documents) / (1 + document_frequency)) + 1
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = os.path.join(self.directory, "idf.tmp.npy")
+        np.save(tmp_path, idf.astype(np.float32))
+        os.replace(tmp_path, self.idf_path)
+
+    def drop_users(self, user_ids):
+        for user_id in user_ids:
+            try:
+                os.remove(self.user_path(user_id))
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        return {
+            "enabled": ENABLED,
+            "idf": self._idf is not None,
+            "queries": self.queries,
+            "avg_query_ms": round(self.query_seconds / self.queries * 1000, 3) if self.queries else None,
+            "appends": self.appends,
+        }
+
+
+index = MemoryIndex(MEMORY_DIR)
+
+
+def _load_texts(db, user_id, entry_ids):
+    """{entry_id: (local_day or created_at date, user_message)} from hot rows, then the archive"""
+    found = {
+        row.id: (row.local_day or row.created_at.date(), row.user_message)
+        for row in db.query(MoodEntry.id, MoodEntry.local_day, MoodEntry.created_at, MoodEntry.user_message)
+        .filter(MoodEntry.user_id == user_id, MoodEntry.id.in_(entry_ids))
+    }
+    missing = [entry_id for entry_id in entry_ids if entry_id not in found]
+    if missing:
+        archived = db.execute(
+            select(ArchivedEntry.id, ArchivedEntry.block_id)
+            .join(ArchiveBlock, ArchiveBlock.id == ArchivedEntry.block_id)
+            .where(ArchiveBlock.user_id == user_id, ArchivedEntry.id.in_(missing))
+        ).all()
+        for entry_id, block_id in archived:
+            row = next(r for r in archive.load_block(db, block_id) if r[0] == entry_id)
+            found[entry_id] = (row[1].date(), row[2])
+    return found
+
+
+def recall(db, user_id, text, exclude_ids=()):
+    """
+    Earlier check-ins relevant to `text`, most similar first, as dicts with
+    "day" and "user_message", trimmed to fit TOKEN_BUDGET. Never raises:
+    chat works without memories.
+    """
+    if not ENABLED:
+        return []
+    try:
+        with span("mem"):
+            matches = index.search(user_id, text, exclude_ids=exclude_ids)
+        if not matches:
+            return []
+        texts = _load_texts(db, user_id, [entry_id for entry_id, _ in matches])
+        memories, budget = [], TOKEN_BUDGET
+        for entry_id, _ in matches:
+            # Entries deleted since they were indexed are skipped
+            if entry_id not in texts:
+                continue
+            day, message = texts[entry_id]
+            if len(message) > MAX_MEMORY_CHARS:
+                message = message[:MAX_MEMORY_CHARS].rsplit(" ", 1)[0] + "..."
+            cost = estimate_tokens(message) + 8
+            if cost > budget:
+                continue
+            budget -= cost
+            memories.append({"day": day.isoformat(), "user_message": message})
+        return memories
+    except Exception as e:
+        print(f"Memory recall failed for user {user_id}: {e}")
+        return []
+
+
+def remember(user_id, entry_id, text):
+    """Index a newly saved check-in; failures are logged and left for build_memory.py"""
+    if not ENABLED:
+        return
+    try:
+        index.add(user_id, entry_id, text)
+    except Exception as e:
+        print(f"Could not index entry {entry_id} for memory: {e}")
@@ -0,0 +1,31 @@
+"""
+One-holder locks between the worker processes on a host.
+
+Used to elect the single process that runs a background job (the reminder
+scheduler, scheduled backups) when serve.py forks several workers.
+try_lock() takes a non-blocking flock and returns the open lock file; the
+lock is held until it is closed or the process exits, so if the holder dies
+another worker can take over on its next attempt.
+"""
+import os
+
+
+class _NoLock:
+    def close(self):
+        pass
+
+
+def try_lock(path):
+    """The held lock (close it to release), or None if another process holds it"""
+    try:
+        import fcntl
+    except ImportError:
+        # No flock (Windows): a single process is assumed
+        return _NoLock()
+    lock_file = open(os.path.abspath(path), "a")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return None
+    return lock_file
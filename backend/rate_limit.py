@@ -0,0 +1,161 @@
+"""
+Token-bucket admission control for the LLM-backed endpoints.
+
+Each limit is a bucket size (burst) and a refill rate (requests per minute),
+kept in memory per user, per guest IP, plus one global bucket sized to our
+OpenAI quota. A request takes tokens from its own bucket and the global one
+together, or from neither, and is refused with a 429 and Retry-After as soon
+as either is empty, so load is shed before any LLM call is queued. Guest
+chats are the exception: they take the global tokens only when the reply
+can't come from the guest reply pool (see guest_replies.py).
+
+Limits are configured as "burst:per_minute":
+
+    ELI_RATE_LIMIT_CHAT         per signed-in user on /api/chat (default 10:6)
+    ELI_RATE_LIMIT_GUEST_CHAT   per guest IP on /api/chat (default 5:3)
+    ELI_RATE_LIMIT_SUMMARY      per user on the summary endpoints (default 6:2)
+    ELI_RATE_LIMIT_GLOBAL       LLM requests for the whole deployment (default 100:500)
+
+Buckets live in each worker process. serve.py exports ELI_WORKER_COUNT and
+the global limit is divided by it, so the deployment-wide total holds across
+workers on average. Per-user and per-guest limits are not divided: one
+client's requests land on whichever worker accepts them, so a divided burst
+would mean nothing. A client whose requests spread over several workers can
+therefore get up to that many times its limit; the global bucket still caps
+the total.
+"""
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from fastapi import Depends, HTTPException, Request
+
+import eli_ai
+from auth import get_current_user
+
+WORKER_COUNT = max(int(os.environ.get("ELI_WORKER_COUNT", "1")), 1)
+
+# Buckets that haven't been touched for a while are full again anyway, so
+# dropping the least recently used ones is harmless
+MAX_BUCKETS = 100000
+
+
+def parse_limit(value, workers=1):
+    """'burst:per_minute' -> (burst, tokens per second), split across `workers` processes"""
+    burst, per_minute = value.split(":")
+    return max(float(burst) / workers, 1.0), float(per_minute) / 60 / workers
+
+
+LIMITS = {
+    "chat": parse_limit(os.environ.get("ELI_RATE_LIMIT_CHAT", "10:6")),
+    "guest_chat": parse_limit(os.environ.get("ELI_RATE_LIMIT_GUEST_CHAT", "5:3")),
+    "summary": parse_limit(os.environ.get("ELI_RATE_LIMIT_SUMMARY", "6:2")),
+    "global": parse_limit(os.environ.get("ELI_RATE_LIMIT_GLOBAL", "100:500"), WORKER_COUNT),
+}
+
+
+class RateLimiter:
+    def __init__(self, limits=LIMITS, max_buckets=MAX_BUCKETS):
+        self.limits = limits
+        self.max_buckets = max_buckets
+        # (limit name, key) -> [tokens, last refill time]
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+        self.allowed = {name: 0 for name in limits}
+        self.rejected = {name: 0 for name in limits}
+
+    def _refill(self, name, key, now):
+        burst, rate = self.limits[name]
+        bucket = self._buckets.get((name, key))
+        if bucket is None:
+            bucket = self._buckets[(name, key)] = [burst, now]
+            if len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+        else:
+            bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            self._buckets.move_to_end((name, key))
+        return bucket
+
+    def take(self, checks):
+        """
+        checks: [(limit name, key, cost)]. Takes the tokens from every bucket
+        if all of them have enough; otherwise takes nothing. Returns 0 when
+        admitted, or the seconds until the request could be admitted.
+        """
+        now = time.monotonic()
+        with self._lock:
+            buckets = [(name, cost, self._refill(name, key, now)) for name, key, cost in checks]
+            wait = 0.0
+            for name, cost, (tokens, _) in buckets:
+                burst, rate = self.limits[name]
+                # A cost above the burst is admitted from a full bucket and
+                # leaves it in debt, rather than never being admitted
+                need = min(cost, burst)
+                if tokens < need:
+                    wait = max(wait, (need - tokens) / rate if rate else math.inf)
+                    self.rejected[name] += 1
+            if wait:
+                return wait
+            for name, cost, bucket in buckets:
+                bucket[0] -= cost
+                self.allowed[name] += 1
+            return 0.0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "buckets": len(self._buckets),
+                "workers": WORKER_COUNT,
+                "limits": {
+                    name: {
+                        "burst": round(burst, 2),
+                        "per_minute": round(rate * 60, 2),
+                        "allowed": self.allowed[name],
+                        "rejected": self.rejected[name],
+                    }
+                    for name, (burst, rate) in self.limits.items()
+                },
+            }
+
+
+limiter = RateLimiter()
+
+
+def _admit(checks):
+    wait = limiter.take(checks)
+    if wait:
+        retry_after = max(1, math.ceil(wait)) if wait != math.inf else 3600
+        raise HTTPException(
+            status_code=429,
+            detail="Too many requests, please slow down",
+            headers={"Retry-After": str(retry_after)}
+        )
+
+
+def _chat_cost():
+    # A check-in is one LLM request in combined mode, otherwise two
+    return 1 if eli_ai.COMBINED_CALL else 2
+
+
+def limit_chat(request: Request, current_user=Depends(get_current_user)):
+    """Dependency for /api/chat"""
+    if current_user:
+        _admit([("chat", current_user.id, 1), ("global", None, _chat_cost())])
+    else:
+        # Guests are often answered from the reply pool without an LLM call,
+        # so guest_replies charges the global bucket only for live replies
+        _admit([("guest_chat", request.client.host if request.client else "unknown", 1)])
+
+
+def limit_guest_llm():
+    """Charge the global bucket for a guest reply that needs a live LLM call (429 if empty)"""
+    _admit([("global", None, _chat_cost())])
+
+
+def limit_summary(current_user=Depends(get_current_user)):
+    """Dependency for the summary endpoints; guests get empty summaries without an LLM call"""
+    if current_user:
+        _admit([("summary", current_user.id, 1), ("global", None, 1)])
@@ -0,0 +1,331 @@
+"""
+Server-side check-in reminders.
+
+Every user with reminders enabled sits in a timing wheel of 1440 one-minute
+slots, in the slot for the UTC minute of their next reminder (reminder_time
+in their own timezone). Each minute the scheduler looks only at the slot
+that just came due, hands those reminders to the sink and moves each user to
+the slot of their next one, so a tick costs O(reminders due) however many
+users there are. The next reminder is worked out in the user's zone each
+time, so DST changes are followed; an entry more than a full turn of the
+wheel ahead (after a 25-hour day) stays in its slot until its minute really
+comes round.
+
+The wheel is loaded from the settings table once and then kept current
+incrementally: update_settings applies a user's change directly, and every
+tick also applies settings rows whose (indexed) updated_at moved past the
+last one seen, which is how signups and changes handled by other worker
+processes arrive. updated_at is set before the transaction commits, so a row
+can become visible after a sync that already passed its timestamp; each sync
+therefore looks SYNC_OVERLAP_SECONDS further back and skips rows it has
+already applied.
+
+The scheduler is opt-in (ELI_REMINDER_SCHEDULER=1). Only one process runs
+the wheel. Under serve.py every worker tries to take an flock on
+ELI_REMINDER_LOCK (by default next to the database) and the others keep
+retrying each minute, so if the holder exits another worker takes over.
+Reminders are delivered to a pluggable sink: LogSink (the default) prints
+them, QueueSink collects them for a consumer (or a test).
+"""
+import os
+import queue
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, time as clock_time, timedelta, timezone
+
+from sqlalchemy import func
+
+from database import SessionLocal, Settings, engine
+from process_lock import try_lock
+from timezones import DEFAULT_TIMEZONE, get_zone
+
+ENABLED = os.environ.get("ELI_REMINDER_SCHEDULER", "0") == "1"
+LOCK_PATH = os.environ.get(
+    "ELI_REMINDER_LOCK", os.path.join(os.path.dirname(os.path.abspath(engine.url.database)), "reminders.lock")
+)
+
+SLOTS = 24 * 60
+LEADER_RETRY_SECONDS = 60
+# How far before the newest updated_at seen each sync looks again
+SYNC_OVERLAP_SECONDS = 300
+
+Reminder = namedtuple("Reminder", ["user_id", "due_at", "reminder_time", "timezone"])
+
+
+def parse_reminder_time(value):
+    """'09:30' -> minute of the day (570), or None if it isn't a valid HH:MM"""
+    try:
+        hours, minutes = value.split(":")
+        hours, minutes = int(hours), int(minutes)
+    except (AttributeError, ValueError):
+        return None
+    if 0 <= hours < 24 and 0 <= minutes < 60:
+        return hours * 60 + minutes
+    return None
+
+
+def next_fire_minute(minute_of_day, tz_name, after):
+    """Epoch minute of the first local minute_of_day in tz_name strictly after epoch minute `after`"""
+    zone = get_zone(tz_name)
+    day = datetime.fromtimestamp(after * 60, zone).date()
+    at = clock_time(minute_of_day // 60, minute_of_day % 60)
+    for offset in range(3):
+        # A time skipped by a DST jump resolves to just after the jump
+        fire = int(datetime.combine(day + timedelta(days=offset), at, zone).timestamp()) // 60
+        if fire > after:
+            return fire
+
+
+def epoch_minute(dt=None):
+    return int((dt or datetime.now(timezone.utc)).timestamp()) // 60
+
+
+class LogSink:
+    """Prints due reminders; stands in for push or email delivery"""
+
+    def __init__(self, show=5):
+        self.show = show
+
+    def deliver(self, reminders):
+        for reminder in reminders[:self.show]:
+            print(f"   ⏰ reminder for user {reminder.user_id} ({reminder.reminder_time} {reminder.timezone})")
+        if len(reminders) > self.show:
+            print(f"   ⏰ ... and {len(reminders) - self.show} more")
+
+
+class QueueSink:
+    """Puts due reminders on a queue for a consumer; drops (and counts) them when it is full"""
+
+    def __init__(self, maxsize=0):
+        self.queue = queue.Queue(maxsize)
+        self.dropped = 0
+
+    def deliver(self, reminders):
+        for reminder in reminders:
+            try:
+                self.queue.put_nowait(reminder)
+            except queue.Full:
+                self.dropped += 1
+
+
+class ReminderWheel:
+    def __init__(self, sink):
+        self.sink = sink
+        # slot -> user ids whose next reminder falls in that minute of the UTC day
+        self._slots = [set() for _ in range(SLOTS)]
+        # user id -> (fire minute, (minute of day, timezone)); the pairs are
+        # interned because most users share a handful of them
+        self._users = {}
+        self._schedules = {}
+        self._cursor = None
+        self._lock = threading.Lock()
+        self.fired = 0
+        self.ticks = 0
+        self.last_tick_ms = 0.0
+        self.max_tick_ms = 0.0
+
+    def __len__(self):
+        return len(self._users)
+
+    def _remove(self, user_id):
+        current = self._users.pop(user_id, None)
+        if current is not None:
+            self._slots[current[0] % SLOTS].discard(user_id)
+
+    def _place(self, user_id, schedule, fire):
+        self._users[user_id] = (fire, schedule)
+        self._slots[fire % SLOTS].add(user_id)
+
+    def _schedule(self, enabled, reminder_time, tz_name):
+        minute_of_day = parse_reminder_time(reminder_time) if enabled else None
+        if minute_of_day is None:
+            return None
+        key = (minute_of_day, tz_name or DEFAULT_TIMEZONE)
+        return self._schedules.setdefault(key, key)
+
+    def load(self, rows, now_minute):
+        """Replace the wheel's contents. rows: (user_id, reminder_enabled, reminder_time, timezone)"""
+        with self._lock:
+            for slot in self._slots:
+                slot.clear()
+            self._users.clear()
+            self._cursor = now_minute - 1
+            next_fires = {}
+            for user_id, enabled, reminder_time, tz_name in rows:
+                schedule = self._schedule(enabled, reminder_time, tz_name)
+                if schedule is None:
+                    continue
+                fire = next_fires.get(schedule)
+                if fire is None:
+                    fire = next_fires[schedule] = next_fire_minute(*schedule, self._cursor)
+                self._place(user_id, schedule, fire)
+
+    def apply(self, user_id, enabled, reminder_time, tz_name):
+        """Reschedule one user after a settings change"""
+        with self._lock:
+            if self._cursor is None:
+                return
+            self._remove(user_id)
+            schedule = self._schedule(enabled, reminder_time, tz_name)
+            if schedule is not None:
+                self._place(user_id, schedule, next_fire_minute(*schedule, self._cursor))
+
+    def advance(self, now_minute):
+        """Fire everything due up to and including now_minute; returns the reminders delivered"""
+        started = time.perf_counter()
+        due = []
+        with self._lock:
+            if self._cursor is None or now_minute <= self._cursor:
+                return due
+            # After a long stall every slot is visited once, not once per missed turn
+            next_fires = {}
+            due_ats = {}
+            for minute in range(max(self._cursor + 1, now_minute - SLOTS + 1), now_minute + 1):
+                slot = self._slots[minute % SLOTS]
+                for user_id in [u for u in slot if self._users[u][0] <= now_minute]:
+                    fire, schedule = self._users[user_id]
+                    slot.discard(user_id)
+                    due_at = due_ats.get(fire)
+                    if due_at is None:
+                        due_at = due_ats[fire] = datetime.fromtimestamp(fire * 60, timezone.utc).replace(tzinfo=None)
+                    due.append(Reminder(user_id, due_at, f"{schedule[0] // 60:02d}:{schedule[0] % 60:02d}", schedule[1]))
+                    next_fire = next_fires.get(schedule)
+                    if next_fire is None:
+                        next_fire = next_fires[schedule] = next_fire_minute(*schedule, now_minute)
+                    self._place(user_id, schedule, next_fire)
+            self._cursor = now_minute
+
+        if due:
+            try:
+                self.sink.deliver(due)
+            except Exception as e:
+                print(f"Reminder delivery failed for {len(due)} reminders: {e}")
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.fired += len(due)
+        self.ticks += 1
+        self.last_tick_ms = elapsed_ms
+        self.max_tick_ms = max(self.max_tick_ms, elapsed_ms)
+        return due
+
+
+class ReminderScheduler:
+    """Runs a ReminderWheel on a background thread in whichever process holds the lock"""
+
+    def __init__(self, sink=None, session_factory=SessionLocal, lock_path=LOCK_PATH):
+        self.wheel = ReminderWheel(sink or LogSink())
+        self.session_factory = session_factory
+        self.lock_path = lock_path
+        self.leader = False
+        self._lock_file = None
+        self._synced_at = None
+        # user id -> updated_at of the rows applied within the overlap window
+        self._applied = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="reminder-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+        self.leader = False
+
+    def _acquire(self):
+        self._lock_file = try_lock(self.lock_path)
+        return self._lock_file is not None
+
+    def load(self, now_minute=None):
+        """Fill the wheel from every user's settings"""
+        started = time.perf_counter()
+        db = self.session_factory()
+        try:
+            self._synced_at = db.query(func.max(Settings.updated_at)).scalar()
+            rows = db.query(
+                Settings.user_id, Settings.reminder_enabled, Settings.reminder_time, Settings.timezone
+            ).filter(Settings.user_id.isnot(None), Settings.reminder_enabled == 1).yield_per(10000)
+            self.wheel.load(rows, now_minute or epoch_minute())
+        finally:
+            db.close()
+        print(f"⏰ Reminder scheduler loaded {len(self.wheel)} users in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+    def sync(self):
+        """Apply settings rows changed since the last sync (signups, other processes)"""
+        db = self.session_factory()
+        try:
+            query = db.query(
+                Settings.user_id, Settings.reminder_enabled, Settings.reminder_time,
+                Settings.timezone, Settings.updated_at
+            ).filter(Settings.user_id.isnot(None))
+            if self._synced_at is not None:
+                query = query.filter(
+                    Settings.updated_at >= self._synced_at - timedelta(seconds=SYNC_OVERLAP_SECONDS)
+                )
+            rows = query.order_by(Settings.updated_at).all()
+        finally:
+            db.close()
+        applied = 0
+        for user_id, enabled, reminder_time, tz_name, updated_at in rows:
+            if updated_at is not None and self._applied.get(user_id) == updated_at:
+                continue
+            self.wheel.apply(user_id, enabled, reminder_time, tz_name)
+            self._applied[user_id] = updated_at
+            applied += 1
+            if updated_at is not None and (self._synced_at is None or updated_at > self._synced_at):
+                self._synced_at = updated_at
+        if self._synced_at is not None:
+            horizon = self._synced_at - timedelta(seconds=SYNC_OVERLAP_SECONDS)
+            self._applied = {
+                user_id: updated_at for user_id, updated_at in self._applied.items()
+                if updated_at is not None and updated_at >= horizon
+            }
+        return applied
+
+    def apply(self, user_id, settings):
+        """Called after a settings update in this process, so the change applies before the next tick"""
+        if self.leader and user_id is not None:
+            self.wheel.apply(user_id, settings["reminder_enabled"], settings["reminder_time"], settings["timezone"])
+
+    def _run(self):
+        while not self._stop.is_set():
+            if not self.leader:
+                if not self._acquire():
+                    self._stop.wait(LEADER_RETRY_SECONDS)
+                    continue
+                try:
+                    self.load()
+                    self.leader = True
+                except Exception as e:
+                    print(f"Reminder scheduler failed to load: {e}")
+                    self._stop.wait(LEADER_RETRY_SECONDS)
+                    continue
+            try:
+                self.sync()
+                self.wheel.advance(epoch_minute())
+            except Exception as e:
+                print(f"Reminder tick failed: {e}")
+            # Wake just after the next minute boundary
+            self._stop.wait(60 - time.time() % 60 + 0.05)
+
+    def stats(self):
+        wheel = self.wheel
+        return {
+            "leader": self.leader,
+            "scheduled": len(wheel),
+            "fired": wheel.fired,
+            "ticks": wheel.ticks,
+            "last_tick_ms": round(wheel.last_tick_ms, 3),
+            "max_tick_ms": round(wheel.max_tick_ms, 3),
+        }
+
+
+scheduler = ReminderScheduler()
@@ -8,7 +8,7 @@ import sys
 # Add the backend directory to the path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from database import Base, engine
+from database import Base, engine, init_db
 from sqlalchemy import inspect
 
 def reset_database():
@@ -29,7 +29,7 @@ def reset_database():
 
     print("\nCreating fresh tables...")
     # Create all tables
-    Base.metadata.create_all(bind=engine)
+    init_db(engine)
     print("   All tables created")
 
     print("\nDatabase reset complete!")
@@ -0,0 +1,111 @@
+"""
+Ranked, highlighted full-text search over a user's check-ins (SQLite FTS5).
+The index and its sync triggers are defined in database.py.
+
+Archived entries (see archive.py) have their own contentless index, queried
+in the same statement. Their text, label and tags come from the decompressed
+archive block, and their highlighting is done here rather than by FTS5.
+"""
+import html
+import re
+
+from sqlalchemy import text
+
+import archive
+
+# Private-use markers from highlight(), swapped for <mark> after HTML escaping
+_MARK_START = "\ue000"
+_MARK_END = "\ue001"
+
+_TERM_RE = re.compile(r"\w+", re.UNICODE)
+
+MAX_PAGE_SIZE = 50
+
+# bm25 statistics are per index, so hot and archived scores are only roughly
+# comparable; archived entries are few per query and old, which is fine
+SEARCH_SQL = text(f"""
+    SELECT m.id, m.created_at, m.sentiment_label, m.mood_tags,
+           highlight(mood_entries_fts, 0, '{_MARK_START}', '{_MARK_END}') AS highlighted,
+           bm25(mood_entries_fts, 1.0, 0.0) AS score, NULL AS block_id
+    FROM mood_entries_fts
+    JOIN mood_entries m ON m.id = mood_entries_fts.rowid
+    WHERE mood_entries_fts MATCH :match
+    UNION ALL
+    SELECT a.id, NULL, NULL, NULL, NULL,
+           bm25(mood_entry_archive_fts, 1.0, 0.0), a.block_id
+    FROM mood_entry_archive_fts
+    JOIN archived_entries a ON a.id = mood_entry_archive_fts.rowid
+    WHERE mood_entry_archive_fts MATCH :match
+    ORDER BY score, created_at DESC
+    LIMIT :limit OFFSET :offset
+""")
+
+
+def build_match(query, user_id):
+    """
+    Turn free text into a safe FTS5 expression scoped to one user.
+    Every word is quoted (so FTS syntax in user input is inert) and the last
+    one is a prefix match so partially typed words still find results.
+    """
+    terms = _TERM_RE.findall(query)
+    if not terms:
+        return None
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] += "*"
+    return f'owner:"u{user_id}" AND user_message:({" ".join(quoted)})'
+
+
+def highlight_terms(value, terms):
+    """
+    Mark words starting with any of the query terms, for archived text that
+    FTS5 can't highlight. Unlike the porter tokenizer this doesn't stem, so a
+    match on another form of a word may go unmarked.
+    """
+    prefixes = tuple(term.lower() for term in terms)
+    return _TERM_RE.sub(
+        lambda m: f"{_MARK_START}{m.group(0)}{_MARK_END}" if m.group(0).lower().startswith(prefixes) else m.group(0),
+        value
+    )
+
+
+def render_highlight(value):
+    return html.escape(value).replace(_MARK_START, "<mark>").replace(_MARK_END, "</mark>")
+
+
+def search_entries(db, user_id, query, page=1, page_size=20):
+    """Return one page of matching entries, best match first"""
+    page = max(page, 1)
+    page_size = min(max(page_size, 1), MAX_PAGE_SIZE)
+    match = build_match(query, user_id)
+    if match is None:
+        return {"results": [], "page": page, "page_size": page_size, "has_more": False}
+
+    rows = db.execute(SEARCH_SQL, {
+        "match": match,
+        # One extra row tells us whether another page exists without a COUNT(*)
+        "limit": page_size + 1,
+        "offset": (page - 1) * page_size,
+    }).all()
+
+    terms = _TERM_RE.findall(query)
+    results = []
+    for row in rows[:page_size]:
+        result = {
+            "id": row.id,
+            "created_at": row.created_at,
+            "sentiment_label": row.sentiment_label,
+            "mood_tags": row.mood_tags,
+            "highlighted_message": None,
+            "rank": round(row.score, 4),
+        }
+        if row.block_id is None:
+            result["highlighted_message"] = render_highlight(row.highlighted)
+        else:
+            archived = next(r for r in archive.load_block(db, row.block_id) if r[0] == row.id)
+            # Same text format SQLAlchemy stores DateTime columns in
+            result["created_at"] = archived[1].isoformat(sep=" ", timespec="microseconds")
+            result["sentiment_label"] = archived[5]
+            result["mood_tags"] = archived[6]
+            result["highlighted_message"] = render_highlight(highlight_terms(archived[2], terms))
+        results.append(result)
+    return {"results": results, "page": page, "page_size": page_size, "has_more": len(rows) > page_size}
@@ -0,0 +1,189 @@
+"""
+Compact local sentiment model trained from the labels gpt-4o already wrote
+into mood_entries.
+
+Text is turned into hashed unigram + bigram features (no vocabulary to ship),
+and two linear heads are fit on top of them in NumPy:
+  - a softmax classifier for the negative / neutral / positive label
+  - a linear regression for the -1..1 polarity
+
+Models are saved as versioned artifacts in backend/models/ (sentiment_vN.npz
+plus a sentiment_vN.json metadata/evaluation file). Prediction is a sparse
+dot product over a few dozen feature rows, well under a millisecond on CPU.
+"""
+import json
+import os
+import re
+import zlib
+from datetime import datetime
+
+import numpy as np
+
+MODELS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models")
+
+LABELS = ("negative", "neutral", "positive")
+DEFAULT_N_FEATURES = 2 ** 18
+
+_TOKEN_RE = re.compile(r"[a-z0-9']+")
+
+
+def tokenize(text):
+    return _TOKEN_RE.findall(text.lower())
+
+
+def hash_features(text, n_features=DEFAULT_N_FEATURES):
+    """
+    Hash unigrams and bigrams of `text` into `n_features` buckets.
+    Returns (indices, values) with log-scaled counts, L2-normalized.
+    crc32 is used instead of hash() so features are stable across processes.
+    """
+    tokens = tokenize(text)
+    grams = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+    counts = {}
+    for gram in grams:
+        idx = zlib.crc32(gram.encode("utf-8")) % n_features
+        counts[idx] = counts.get(idx, 0) + 1
+    if not counts:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+    indices = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+    values = np.log1p(np.fromiter(counts.values(), dtype=np.float32, count=len(counts)))
+    values /= np.linalg.norm(values)
+    return indices, values
+
+
+class SparseBatch:
+    """Minimal CSR matrix of hashed feature rows (NumPy only, no SciPy)"""
+
+    def __init__(self, texts, n_features):
+        indices, values, lengths = [], [], []
+        for text in texts:
+            idx, val = hash_features(text, n_features)
+            indices.append(idx)
+            values.append(val)
+            lengths.append(len(idx))
+        self.n_rows = len(lengths)
+        self.indices = np.concatenate(indices) if indices else np.zeros(0, dtype=np.int64)
+        self.values = np.concatenate(values) if values else np.zeros(0, dtype=np.float32)
+        self.rows = np.repeat(np.arange(self.n_rows), lengths)
+
+    def dot(self, weights):
+        """X @ weights for a (n_features, k) weight matrix"""
+        out = np.zeros((self.n_rows, weights.shape[1]), dtype=np.float64)
+        np.add.at(out, self.rows, weights[self.indices] * self.values[:, None])
+        return out
+
+    def t_dot(self, grad, n_features):
+        """X.T @ grad for a (n_rows, k) gradient, returned as a dense weight gradient"""
+        out = np.zeros((n_features, grad.shape[1]), dtype=np.float64)
+        np.add.at(out, self.indices, grad[self.rows] * self.values[:, None])
+        return out
+
+
+def _softmax(z):
+    z = z - z.max(axis=1, keepdims=True)
+    e = np.exp(z)
+    return e / e.sum(axis=1, keepdims=True)
+
+
+class SentimentModel:
+    def __init__(self, n_features=DEFAULT_N_FEATURES, version=None, metadata=None):
+        self.n_features = n_features
+        self.version = version
+        self.metadata = metadata or {}
+        # Column 0..2 are class logits, column 3 is the polarity regression
+        self.weights = np.zeros((n_features, len(LABELS) + 1), dtype=np.float32)
+        self.bias = np.zeros(len(LABELS) + 1, dtype=np.float32)
+
+    def fit(self, texts, polarities, labels, epochs=100, learning_rate=0.1, l2=1e-6, seed=0):
+        """Full-batch Adam on cross-entropy (labels) + squared error (polarity)"""
+        X = SparseBatch(texts, self.n_features)
+        y_cls = np.array([LABELS.index(label) for label in labels])
+        y_reg = np.asarray(polarities, dtype=np.float64)
+        onehot = np.eye(len(LABELS))[y_cls]
+        n = max(X.n_rows, 1)
+
+        rng = np.random.default_rng(seed)
+        W = rng.normal(0, 1e-3, size=self.weights.shape)
+        b = np.zeros(self.bias.shape)
+        m_W, v_W = np.zeros_like(W), np.zeros_like(W)
+        m_b, v_b = np.zeros_like(b), np.zeros_like(b)
+        beta1, beta2, eps = 0.9, 0.999, 1e-8
+
+        for step in range(1, epochs + 1):
+            z = X.dot(W) + b
+            grad = np.empty_like(z)
+            grad[:, :3] = (_softmax(z[:, :3]) - onehot) / n
+            grad[:, 3] = (np.tanh(z[:, 3]) - y_reg) * (1 - np.tanh(z[:, 3]) ** 2) / n
+
+            g_W = X.t_dot(grad, self.n_features) + l2 * W
+            g_b = grad.sum(axis=0)
+
+            m_W = beta1 * m_W + (1 - beta1) * g_W
+            v_W = beta2 * v_W + (1 - beta2) * g_W ** 2
+            m_b = beta1 * m_b + (1 - beta1) * g_b
+            v_b = beta2 * v_b + (1 - beta2) * g_b ** 2
+            correction = np.sqrt(1 - beta2 ** step) / (1 - beta1 ** step)
+            W -= learning_rate * correction * m_W / (np.sqrt(v_W) + eps)
+            b -= learning_rate * correction * m_b / (np.sqrt(v_b) + eps)
+
+        self.weights = W.astype(np.float32)
+        self.bias = b.astype(np.float32)
+        return self
+
+    def predict(self, text):
+        """Return a result shaped like EliAI.analyze_sentiment plus a confidence"""
+        indices, values = hash_features(text, self.n_features)
+        z = values @ self.weights[indices] + self.bias
+        probs = _softmax(z[None, :3])[0]
+        polarity = float(np.tanh(z[3]))
+        return {
+            "score": round((polarity + 1) / 2, 2),
+            "label": LABELS[int(probs.argmax())],
+            "polarity": round(polarity, 2),
+            "confidence": float(probs.max()),
+        }
+
+    def save(self, directory=MODELS_DIR):
+        """Write sentiment_vN.npz/.json with the next free version number"""
+        os.makedirs(directory, exist_ok=True)
+        self.version = (latest_version(directory) or 0) + 1
+        base = os.path.join(directory, f"sentiment_v{self.version}")
+        np.savez_compressed(base + ".npz", weights=self.weights, bias=self.bias)
+        self.metadata.update({
+            "version": self.version,
+            "n_features": self.n_features,
+            "labels": list(LABELS),
+            "saved_at": datetime.utcnow().isoformat(),
+        })
+        with open(base + ".json", "w") as f:
+            json.dump(self.metadata, f, indent=2)
+        return base + ".npz"
+
+    @classmethod
+    def load(cls, path):
+        with open(path[:-len(".npz")] + ".json") as f:
+            metadata = json.load(f)
+        model = cls(n_features=metadata["n_features"], version=metadata["version"], metadata=metadata)
+        with np.load(path) as data:
+            model.weights = data["weights"]
+            model.bias = data["bias"]
+        return model
+
+
+def latest_version(directory=MODELS_DIR):
+    if not os.path.isdir(directory):
+        return None
+    versions = [
+        int(m.group(1))
+        for m in (re.fullmatch(r"sentiment_v(\d+)\.npz", name) for name in os.listdir(directory))
+        if m
+    ]
+    return max(versions) if versions else None
+
+
+def load_latest(directory=MODELS_DIR):
+    """Load the newest saved model, or return None if none has been trained yet"""
+    version = latest_version(directory)
+    if version is None:
+        return None
+    return SentimentModel.load(os.path.join(directory, f"sentiment_v{version}.npz"))
@@ -0,0 +1,152 @@
+"""
+Production launcher: N uvicorn worker processes sharing one listening socket
+
+Usage: python serve.py [--workers N] [--host 0.0.0.0] [--port 8000]
+
+- Preload: the master imports the app and runs database.init_db() once,
+  then forks the workers, so migrations never race and workers start warm.
+  ELI_SCHEMA_READY=1 tells the workers' startup hook to skip init_db().
+- Warmup: each worker calls main.warmup() before it starts accepting.
+- Graceful drain: SIGTERM/SIGINT is forwarded to the workers, which stop
+  accepting, finish in-flight requests for up to --graceful-timeout
+  seconds, then exit. Workers that die unexpectedly are replaced.
+- Shared caches: ELI_SHARED_CACHE_PATH points every worker's caches
+  (settings, trends, ...) at one SQLite file on tmpfs, so hit rates don't
+  drop by a factor of N and invalidations reach every worker.
+"""
+import argparse
+import os
+import signal
+import socket
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def default_cache_path(port):
+    # /dev/shm keeps the shared cache in memory on Linux
+    directory = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(directory, f"eli-cache-{port}.db")
+
+
+def bind_socket(host, port, backlog):
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(app_module, sock, args):
+    """Child process body: warm up, then serve until told to stop"""
+    import uvicorn
+
+    # Let uvicorn install its own handlers for a graceful shutdown
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+
+    app_module.warmup()
+    config = uvicorn.Config(
+        app_module.app,
+        timeout_graceful_shutdown=args.graceful_timeout,
+        timeout_keep_alive=args.keep_alive,
+        log_level=args.log_level,
+    )
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the API with multiple worker processes")
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("WEB_CONCURRENCY", os.cpu_count() or 1)))
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--backlog", type=int, default=2048)
+    parser.add_argument("--graceful-timeout", type=int, default=30, help="Seconds to drain in-flight requests")
+    parser.add_argument("--keep-alive", type=int, default=5)
+    parser.add_argument("--log-level", default="info")
+    parser.add_argument("--shared-cache", default=None, help="SQLite file for caches shared by all workers")
+    args = parser.parse_args()
+
+    # Must be set before the app (and its caches and rate limits) are imported
+    cache_path = args.shared_cache or default_cache_path(args.port)
+    if os.path.exists(cache_path):
+        os.remove(cache_path)
+    os.environ["ELI_SHARED_CACHE_PATH"] = cache_path
+    # Rate limits are per process; each worker enforces its share
+    os.environ["ELI_WORKER_COUNT"] = str(args.workers)
+
+    # Preload the app in the master; schema setup happens exactly once here
+    import database
+    import main as app_module
+    database.init_db()
+    os.environ["ELI_SCHEMA_READY"] = "1"
+    # Connections must not be shared across fork()
+    database.engine.dispose()
+
+    sock = bind_socket(args.host, args.port, args.backlog)
+    print(f"Serving on {args.host}:{args.port} with {args.workers} workers (shared cache: {cache_path})")
+
+    workers = {}
+    shutting_down = False
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            try:
+                run_worker(app_module, sock, args)
+            finally:
+                os._exit(0)
+        workers[pid] = time.monotonic()
+        print(f"  worker {pid} started")
+
+    def request_shutdown(signum, frame):
+        nonlocal shutting_down
+        if not shutting_down:
+            shutting_down = True
+            print(f"Draining {len(workers)} workers (up to {args.graceful_timeout}s)...")
+            for pid in workers:
+                os.kill(pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, request_shutdown)
+    signal.signal(signal.SIGINT, request_shutdown)
+
+    for _ in range(args.workers):
+        spawn()
+
+    deadline = None
+    while workers:
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            break
+        if pid == 0:
+            if shutting_down:
+                deadline = deadline or time.monotonic() + args.graceful_timeout + 5
+                if time.monotonic() > deadline:
+                    for remaining in workers:
+                        os.kill(remaining, signal.SIGKILL)
+            time.sleep(0.2)
+            continue
+
+        started = workers.pop(pid, None)
+        if shutting_down:
+            print(f"  worker {pid} stopped")
+        else:
+            print(f"  worker {pid} exited unexpectedly (status {status}), restarting")
+            # Avoid a tight crash loop if workers die right after starting
+            if started is not None and time.monotonic() - started < 1:
+                time.sleep(1)
+            spawn()
+
+    sock.close()
+    for path in (cache_path, cache_path + "-wal", cache_path + "-shm"):
+        if os.path.exists(path):
+            os.remove(path)
+    print("All workers stopped")
+
+
+if __name__ == "__main__":
+    main()
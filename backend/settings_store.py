@@ -0,0 +1,118 @@
+"""
+Write-through cache in front of the settings table.
+
+Reads are served from memory (or the shared cache file under serve.py); a
+user's row is loaded (or created with defaults) once, under a striped lock
+so concurrent first requests for the same user don't race to insert
+duplicate rows. update_user_settings writes
+to the database and then replaces the cached copy.
+
+Every cache write is versioned by the row's updated_at and an older version
+never replaces a newer one. The locks only cover one process, so under
+serve.py a worker that read the row just before another worker's update
+would otherwise put the old settings back over the new ones, for good.
+"""
+import threading
+from datetime import datetime
+
+from sqlalchemy import Integer, exists, insert, literal, select
+
+from cache import make_cache
+from database import Settings
+from timezones import DEFAULT_TIMEZONE
+
+settings_cache = make_cache("settings", max_entries=200000)
+
+_locks = [threading.Lock() for _ in range(64)]
+
+FIELDS = ("reminder_enabled", "reminder_time", "privacy_mode", "safe_mode", "timezone")
+
+
+def _key(user_id):
+    # Guests share the single user_id IS NULL row
+    return "guest" if user_id is None else str(user_id)
+
+
+def _lock_for(key):
+    return _locks[hash(key) % len(_locks)]
+
+
+def _version(settings):
+    return settings.updated_at.timestamp() if settings.updated_at else 0.0
+
+
+def _as_dict(settings):
+    return {
+        "reminder_enabled": bool(settings.reminder_enabled),
+        "reminder_time": settings.reminder_time,
+        "privacy_mode": bool(settings.privacy_mode),
+        "safe_mode": bool(settings.safe_mode),
+        "timezone": settings.timezone or DEFAULT_TIMEZONE,
+    }
+
+
+def _load_or_create(db, user_id):
+    settings = db.query(Settings).filter(Settings.user_id == user_id).first()
+    if not settings:
+        # INSERT ... SELECT WHERE NOT EXISTS is a single statement, so even
+        # separate worker processes can't both create a row for this user
+        db.execute(
+            insert(Settings).from_select(
+                ["user_id"],
+                select(literal(user_id, Integer)).where(
+                    ~exists().where(Settings.user_id == user_id)
+                )
+            )
+        )
+        db.commit()
+        settings = db.query(Settings).filter(Settings.user_id == user_id).first()
+    return settings
+
+
+def get_user_settings(db, user_id):
+    """Settings for a user (None for guests) as a plain dict"""
+    key = _key(user_id)
+    cached = settings_cache.get(key)
+    if cached is not None:
+        return cached
+
+    with _lock_for(key):
+        # Another request may have loaded it while we waited for the lock
+        cached = settings_cache.peek(key)
+        if cached is not None:
+            return cached
+        settings = _load_or_create(db, user_id)
+        value = _as_dict(settings)
+        if not settings_cache.set_if_newer(key, value, _version(settings)):
+            # Updated meanwhile by another worker; serve what it cached
+            value = settings_cache.peek(key, value)
+        return value
+
+
+def update_user_settings(db, user_id, changes):
+    """Apply the non-None values in `changes`, write them to the database, then to the cache"""
+    key = _key(user_id)
+    with _lock_for(key):
+        settings = _load_or_create(db, user_id)
+        if changes.get("reminder_enabled") is not None:
+            settings.reminder_enabled = int(changes["reminder_enabled"])
+        if changes.get("reminder_time") is not None:
+            settings.reminder_time = changes["reminder_time"]
+        if changes.get("privacy_mode") is not None:
+            settings.privacy_mode = int(changes["privacy_mode"])
+        if changes.get("safe_mode") is not None:
+            settings.safe_mode = int(changes["safe_mode"])
+        if changes.get("timezone") is not None:
+            settings.timezone = changes["timezone"]
+        settings.updated_at = datetime.utcnow()
+
+        db.commit()
+        db.refresh(settings)
+        value = _as_dict(settings)
+        settings_cache.set_if_newer(key, value, _version(settings))
+        return value
+
+
+def prime(settings):
+    """Cache a freshly created settings row (e.g. at signup) so the first read is a hit"""
+    settings_cache.set_if_newer(_key(settings.user_id), _as_dict(settings), _version(settings))
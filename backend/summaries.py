@@ -0,0 +1,177 @@
+"""
+Daily summaries and weekly insights, built hierarchically.
+
+Each day's summary is generated from that day's check-ins and stored in
+daily_summaries. It is reused until the day gets new entries. Weekly insights
+are then a reduce step over at most seven stored daily summaries plus the
+week's label counts, so the weekly prompt stays the same size however many
+check-ins the week had, and every one of them is covered.
+
+Only the current day is summarized while the user waits. A past day without
+an up-to-date summary (late check-ins, or a summary that failed) is handed to
+the enrichment worker, and until it is done the weekly view uses its older
+summary or, failing that, the day's label counts; no day is left out.
+
+A user over today's LLM token budget (see usage.py) gets their stored
+summaries even when they are behind, and the weekly insights last generated
+for the week, if this process has them.
+"""
+from datetime import timedelta
+
+from sqlalchemy import case, func
+
+import enrichment
+import usage
+from cache import make_cache
+from database import DailySummary, MoodEntry
+from eli_ai import eli
+
+WEEK_DAYS = 7
+
+# Last weekly insights per user and week, served while the user is over budget
+weekly_cache = make_cache("weekly_insights", max_entries=2000)
+
+NO_ENTRIES_TODAY = "No entries today yet. How are you feeling?"
+SUMMARY_FALLBACK = "You've checked in multiple times today. That shows real commitment to understanding yourself better."
+
+
+def _day_stats(db, user_id, start, end):
+    """{local_day: (entry count, last entry id, positive, negative, neutral)} for days with entries"""
+    def label_count(label):
+        return func.sum(case((MoodEntry.sentiment_label == label, 1), else_=0))
+
+    rows = db.query(
+        MoodEntry.local_day,
+        func.count(MoodEntry.id),
+        func.max(MoodEntry.id),
+        label_count("positive"),
+        label_count("negative"),
+        label_count("neutral"),
+    ).filter(
+        MoodEntry.user_id == user_id,
+        MoodEntry.local_day >= start,
+        MoodEntry.local_day <= end
+    ).group_by(MoodEntry.local_day).all()
+    return {row[0]: tuple(row[1:]) for row in rows}
+
+
+def _summarize(db, user_id, day, entry_count, last_entry_id, day_label):
+    """Generate and store the summary for one day; None if the LLM call failed"""
+    messages = [
+        message for (message,) in db.query(MoodEntry.user_message).filter(
+            MoodEntry.user_id == user_id,
+            MoodEntry.local_day == day,
+            MoodEntry.id <= last_entry_id
+        ).order_by(MoodEntry.created_at)
+    ]
+    try:
+        summary = eli.summarize_day(messages, day_label)
+    except Exception as e:
+        print(f"Daily summary failed for user {user_id} on {day}: {e}")
+        return None
+
+    db.merge(DailySummary(
+        user_id=user_id,
+        local_day=day,
+        summary=summary,
+        entry_count=entry_count,
+        last_entry_id=last_entry_id,
+    ))
+    db.commit()
+    return summary
+
+
+def _stored_summaries(db, user_id, start, end):
+    return {
+        row.local_day: row
+        for row in db.query(DailySummary).filter(
+            DailySummary.user_id == user_id,
+            DailySummary.local_day >= start,
+            DailySummary.local_day <= end
+        )
+    }
+
+
+def _current(stored, stats):
+    return stored is not None and (stored.entry_count, stored.last_entry_id) == stats[:2]
+
+
+def _day_label(day, today):
+    return "today" if day == today else day.strftime("%A, %B %d")
+
+
+def _stats_line(stats):
+    """Stands in for a day that has no summary yet"""
+    return f"not summarized yet; {stats[2]} positive, {stats[3]} negative, {stats[4]} neutral"
+
+
+def summarize_past_day(db, user_id, day):
+    """Bring one earlier day's stored summary up to date (run by the enrichment worker)"""
+    stats = _day_stats(db, user_id, day, day).get(day)
+    if stats is None:
+        return None
+    stored = _stored_summaries(db, user_id, day, day).get(day)
+    if _current(stored, stats):
+        return stored.summary
+    return _summarize(db, user_id, day, *stats[:2], _day_label(day, None))
+
+
+def get_daily_summary(db, user_id, today):
+    """Today's summary, regenerated only when there are new check-ins"""
+    stats = _day_stats(db, user_id, today, today).get(today)
+    if stats is None:
+        return {"summary": NO_ENTRIES_TODAY, "entry_count": 0}
+
+    stored = _stored_summaries(db, user_id, today, today).get(today)
+    if _current(stored, stats):
+        summary = stored.summary
+    elif usage.ledger.over_budget(user_id):
+        summary = stored.summary if stored is not None else None
+    else:
+        summary = _summarize(db, user_id, today, *stats[:2], "today")
+    return {"summary": summary or SUMMARY_FALLBACK, "entry_count": stats[0]}
+
+
+def get_weekly_insights(db, user_id, today):
+    """Insights for the last seven local days, reduced from their daily summaries"""
+    start = today - timedelta(days=WEEK_DAYS - 1)
+    stats = _day_stats(db, user_id, start, today)
+    stored = _stored_summaries(db, user_id, start, today)
+    over_budget = usage.ledger.over_budget(user_id)
+
+    daily = []
+    for day in sorted(stats):
+        day_stats = stats[day]
+        day_label = _day_label(day, today)
+        stored_day = stored.get(day)
+        if _current(stored_day, day_stats):
+            summary = stored_day.summary
+        elif day == today and not over_budget:
+            summary = _summarize(db, user_id, day, *day_stats[:2], day_label)
+        else:
+            summary = None
+        if summary is None:
+            if day != today and not over_budget:
+                enrichment.worker.enqueue_summary(user_id, day)
+            summary = stored_day.summary if stored_day is not None else _stats_line(day_stats)
+        daily.append((day_label, day_stats[0], summary))
+
+    counts = {
+        "positive": sum(s[2] for s in stats.values()),
+        "negative": sum(s[3] for s in stats.values()),
+        "neutral": sum(s[4] for s in stats.values()),
+    }
+    cache_key = f"user:{user_id}:{start.isoformat()}"
+    if over_budget:
+        insights = weekly_cache.get(cache_key) or eli.weekly_fallback(counts)
+    else:
+        insights = eli.generate_weekly_insights(daily, counts)
+        weekly_cache.set(cache_key, insights)
+    return {
+        "insights": insights,
+        "entry_count": sum(s[0] for s in stats.values()),
+        "positive_count": counts["positive"],
+        "negative_count": counts["negative"],
+        "neutral_count": counts["neutral"],
+        "week_start": start.isoformat(),
+    }
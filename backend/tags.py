@@ -0,0 +1,94 @@
+"""
+Normalized mood tags.
+
+EliAI.get_mood_tags() produces comma-joined strings ("struggling, anxious"),
+which stay in MoodEntry.mood_tags for display. Each tag is also written as a
+row of mood_entry_tags when the entry is saved, keyed by (user_id,
+local_day, tag), so per-tag counts over any window come from an index range
+scan. Existing entries, including archived ones, are backfilled the first
+time init_db() creates the table.
+"""
+from datetime import date
+
+from sqlalchemy import func, insert, select
+
+import archive
+from database import ArchiveBlock, MoodEntry, MoodEntryTag
+
+
+def split_tags(mood_tags):
+    """'struggling, anxious' -> ['struggling', 'anxious'] (lowercased, no duplicates)"""
+    seen = []
+    for tag in (mood_tags or "").split(","):
+        tag = tag.strip().lower()
+        if tag and tag not in seen:
+            seen.append(tag)
+    return seen
+
+
+def tag_rows(entry_id, user_id, local_day, mood_tags):
+    return [
+        {"entry_id": entry_id, "tag": tag, "user_id": user_id, "local_day": local_day}
+        for tag in split_tags(mood_tags)
+    ]
+
+
+def add_entry_tags(db, entry):
+    """Stage tag rows for a flushed MoodEntry in the same transaction"""
+    db.add_all(
+        MoodEntryTag(**row)
+        for row in tag_rows(entry.id, entry.user_id, entry.local_day, entry.mood_tags)
+    )
+
+
+def tag_histogram(db, user_id, start, end):
+    """[(tag, count)] for entries with local_day in [start, end], most frequent first"""
+    count = func.count().label("count")
+    return db.query(MoodEntryTag.tag, count).filter(
+        MoodEntryTag.user_id == user_id,
+        MoodEntryTag.local_day >= start,
+        MoodEntryTag.local_day <= end
+    ).group_by(MoodEntryTag.tag).order_by(count.desc(), MoodEntryTag.tag).all()
+
+
+def backfill_entry_tags(bind, batch_size=10000):
+    """Create tag rows for entries stored before mood_entry_tags existed"""
+    upsert = insert(MoodEntryTag).prefix_with("OR IGNORE")
+    last_id = 0
+    while True:
+        with bind.begin() as conn:
+            rows = conn.execute(
+                select(MoodEntry.id, MoodEntry.user_id, MoodEntry.local_day,
+                       MoodEntry.created_at, MoodEntry.mood_tags)
+                .where(MoodEntry.id > last_id, MoodEntry.user_id.isnot(None))
+                .order_by(MoodEntry.id)
+                .limit(batch_size)
+            ).all()
+            if not rows:
+                break
+            values = [
+                tag_row
+                for entry_id, user_id, day, created_at, mood_tags in rows
+                for tag_row in tag_rows(entry_id, user_id, day or created_at.date(), mood_tags)
+            ]
+            if values:
+                conn.execute(upsert, values)
+        last_id = rows[-1][0]
+
+    with bind.begin() as conn:
+        block_ids = conn.execute(select(ArchiveBlock.id)).scalars().all()
+    for block_id in block_ids:
+        with bind.begin() as conn:
+            user_id, codec, payload = conn.execute(
+                select(ArchiveBlock.user_id, ArchiveBlock.codec, ArchiveBlock.payload)
+                .where(ArchiveBlock.id == block_id)
+            ).one()
+            values = [
+                tag_row
+                for row in archive.decode_block(codec, payload)
+                for tag_row in tag_rows(
+                    row[0], user_id, date.fromisoformat(row[7]) if row[7] else row[1].date(), row[6]
+                )
+            ]
+            if values:
+                conn.execute(upsert, values)
@@ -0,0 +1,146 @@
+"""
+Check that compressed replies round-trip, including across a dictionary swap
+
+Runs against a throwaway database in a temporary directory. Rows written with
+no dictionary, with a first dictionary and with a second one (plus a plain
+text row from before compression) must all read back unchanged, also in a
+"fresh process" that has to fetch the dictionaries from the table.
+"""
+import os
+import random
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+# database.py opens ./mood_tracker.db, so work somewhere disposable
+os.chdir(tempfile.mkdtemp())
+
+import compressed_text
+from database import CompressionDictionary, MoodEntry, SessionLocal, engine, init_db
+
+failures = []
+
+
+def check(name, ok):
+    print(f"  {'PASS' if ok else 'FAIL'}  {name}")
+    if not ok:
+        failures.append(name)
+
+
+def sample_replies(rng, n, topic):
+    openers = ["It sounds like", "I hear that", "Thank you for sharing that", "It makes sense that"]
+    middles = ["today has been a lot", "you're carrying a lot right now", "things feel uncertain",
+               "you made real progress", "the evening was hard", "work has been stressful"]
+    closers = ["What would help most right now?", "Be gentle with yourself.",
+               "Small steps still count.", "I'm here whenever you want to talk."]
+    return [
+        f"{rng.choice(openers)} {rng.choice(middles)} ({topic} #{i}). {rng.choice(closers)}"
+        for i in range(n)
+    ]
+
+
+def add_dictionary(samples):
+    dict_data = compressed_text.train_dictionary(samples)
+    with engine.begin() as conn:
+        dict_id = conn.execute(CompressionDictionary.__table__.insert().values(
+            column="mood_entries.eli_response", dict_data=dict_data, sample_count=len(samples)
+        )).inserted_primary_key[0]
+    compressed_text.load_dictionaries(engine)
+    return dict_id
+
+
+def write(replies):
+    db = SessionLocal()
+    try:
+        entries = [MoodEntry(user_message="check-in", eli_response=reply) for reply in replies]
+        db.add_all(entries)
+        db.commit()
+        return {entry.id: reply for entry, reply in zip(entries, replies)}
+    finally:
+        db.close()
+
+
+def stored_dict_ids(ids):
+    """dictionary id each row was written with (None for plain text)"""
+    with engine.connect() as conn:
+        rows = conn.exec_driver_sql(
+            f"SELECT id, eli_response FROM mood_entries WHERE id IN ({','.join(map(str, ids))})"
+        ).all()
+    return {
+        row_id: None if isinstance(value, str) else compressed_text._DICT_ID.unpack_from(value, 1)[0]
+        for row_id, value in rows
+    }
+
+
+def read_all():
+    db = SessionLocal()
+    try:
+        return {entry_id: reply for entry_id, reply in db.query(MoodEntry.id, MoodEntry.eli_response)}
+    finally:
+        db.close()
+
+
+print("=" * 70)
+print("COMPRESSED TEXT ROUND-TRIP TEST")
+print("=" * 70)
+
+if not compressed_text.zstd_available():
+    print("\nzstandard is not installed; replies are stored as plain text and there is nothing to check")
+    sys.exit(0)
+
+init_db()
+rng = random.Random(0)
+expected = {}
+
+# A row stored before compression existed
+with engine.begin() as conn:
+    conn.exec_driver_sql(
+        "INSERT INTO mood_entries (user_message, eli_response, created_at) VALUES (?, ?, datetime('now'))",
+        ("check-in", "A plain reply from before compression.")
+    )
+    plain_id = conn.exec_driver_sql("SELECT max(id) FROM mood_entries").scalar()
+expected[plain_id] = "A plain reply from before compression."
+
+print("\n>> No dictionary")
+written = write(sample_replies(rng, 50, "none") + ["", "Short.", "Emoji and accents: 🌱 café, naïve — ok"])
+expected.update(written)
+check("rows without a dictionary use id 0 or plain text",
+      set(stored_dict_ids(written).values()) <= {0, None})
+
+print("\n>> First dictionary")
+first_id = add_dictionary(sample_replies(rng, 3000, "first"))
+written = write(sample_replies(rng, 200, "first"))
+expected.update(written)
+check(f"new rows use dictionary {first_id}", set(stored_dict_ids(written).values()) == {first_id})
+
+print("\n>> Second dictionary (swap)")
+second_id = add_dictionary(sample_replies(rng, 3000, "second"))
+written = write(sample_replies(rng, 200, "second"))
+expected.update(written)
+check(f"new rows use dictionary {second_id}", set(stored_dict_ids(written).values()) == {second_id})
+
+print("\n>> Reading back")
+check("every row reads back unchanged in this process", read_all() == expected)
+
+# Forget the loaded dictionaries, as a process that never called load_dictionaries would have
+with compressed_text._lock:
+    compressed_text._dictionaries.clear()
+compressed_text._local.__dict__.clear()
+check("every row reads back unchanged after fetching dictionaries on demand", read_all() == expected)
+
+# Rewriting an old row moves it to the current dictionary
+db = SessionLocal()
+try:
+    entry = db.get(MoodEntry, plain_id)
+    entry.eli_response = entry.eli_response + " (edited)"
+    db.commit()
+finally:
+    db.close()
+expected[plain_id] += " (edited)"
+check("a rewritten plain row reads back", read_all()[plain_id] == expected[plain_id])
+
+print("\n" + "=" * 70)
+if failures:
+    print(f"FAILED: {len(failures)} check(s)")
+    sys.exit(1)
+print(f"OK: {len(expected)} rows round-tripped across dictionaries 0, {first_id} and {second_id}")
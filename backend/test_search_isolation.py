@@ -0,0 +1,120 @@
+"""
+Check that search never returns another user's entries
+
+Runs against a throwaway database in a temporary directory. Several users
+(including ids 1 and 12, whose owner tokens share a prefix) and a guest write
+check-ins with the same words; some are archived. Every query, including ones
+made of FTS syntax, must only ever return the searching user's own entries.
+"""
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+# database.py opens ./mood_tracker.db, so work somewhere disposable
+os.chdir(tempfile.mkdtemp())
+
+import archive
+from database import MoodEntry, SessionLocal, User, engine, init_db
+from search import search_entries
+
+USER_IDS = [1, 2, 12]
+MESSAGES = [
+    "Feeling anxious about work and the deadline",
+    "A calm walk in the park helped a lot",
+    "Work was fine, family dinner was lovely",
+    "Couldn't sleep, anxious again",
+]
+QUERIES = [
+    "anxious", "work", "work deadline", "anx", "park walk", "family",
+    # FTS syntax must stay inert
+    'owner:"u2"', "owner:u12", "u2", "anxious OR owner", '"work" OR "park"', "NOT work", "*", "work*",
+    "user_message:anxious", "NEAR(work anxious)", "(", '"', "^work", "u1 u2 u12",
+]
+
+failures = []
+
+
+def check(name, ok):
+    print(f"  {'PASS' if ok else 'FAIL'}  {name}")
+    if not ok:
+        failures.append(name)
+
+
+def seed():
+    """Returns {entry_id: user_id}; the first half of each user's entries is a year old"""
+    owners = {}
+    old = datetime.utcnow() - timedelta(days=400)
+    db = SessionLocal()
+    try:
+        for user_id in USER_IDS:
+            db.add(User(id=user_id, username=f"user{user_id}", email=f"user{user_id}@example.com",
+                        password_hash="x"))
+        db.flush()
+        for user_id in USER_IDS + [None]:
+            for i, message in enumerate(MESSAGES * 2):
+                created_at = old + timedelta(hours=i) if i < len(MESSAGES) else datetime.utcnow()
+                entry = MoodEntry(user_id=user_id, user_message=f"{message} (u{user_id})",
+                                  eli_response="Thanks for telling me.", created_at=created_at,
+                                  sentiment_label="neutral", sentiment_score=0.0)
+                db.add(entry)
+                db.flush()
+                owners[entry.id] = user_id
+        db.commit()
+    finally:
+        db.close()
+    return owners
+
+
+def search_all(db, user_id, query):
+    """Every result id across all pages"""
+    ids, page = [], 1
+    while True:
+        result = search_entries(db, user_id, query, page=page, page_size=5)
+        ids += [r["id"] for r in result["results"]]
+        if not result["has_more"]:
+            return ids
+        page += 1
+
+
+def run_queries(label, owners):
+    print(f"\n>> {label}")
+    db = SessionLocal()
+    try:
+        for user_id in USER_IDS:
+            leaked, found = [], 0
+            for query in QUERIES:
+                ids = search_all(db, user_id, query)
+                found += len(ids)
+                leaked += [(query, entry_id, owners.get(entry_id)) for entry_id in ids
+                           if owners.get(entry_id) != user_id]
+            check(f"user {user_id}: {found} results over {len(QUERIES)} queries, none from anyone else", not leaked)
+            for query, entry_id, owner in leaked[:5]:
+                print(f"        {query!r} returned entry {entry_id} of user {owner}")
+            # Each message is written twice, and the first copy is the one that gets archived
+            expected = 2 * sum("anxious" in message for message in MESSAGES)
+            own = search_all(db, user_id, "anxious")
+            check(f"user {user_id}: 'anxious' finds all {expected} of their own matches", len(own) == expected)
+    finally:
+        db.close()
+
+
+print("=" * 70)
+print("SEARCH ISOLATION TEST")
+print("=" * 70)
+
+init_db()
+owners = seed()
+run_queries("Hot entries", owners)
+
+totals = archive.archive_old_entries(engine, older_than_days=90)
+print(f"\n   archived {totals['entries']} entries into {totals['blocks']} blocks")
+check("old entries of every signed-in user were archived", totals["blocks"] == len(USER_IDS))
+run_queries("Hot and archived entries", owners)
+
+print("\n" + "=" * 70)
+if failures:
+    print(f"FAILED: {len(failures)} check(s)")
+    sys.exit(1)
+print("OK: no search returned another user's entries")
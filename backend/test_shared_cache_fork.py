@@ -0,0 +1,113 @@
+"""
+Check that the shared cache behaves across fork(), the way serve.py runs it
+
+The parent uses the cache (so its thread holds an open connection) and then
+forks several workers, as the preforking master does. Each worker must open
+its own connection, see what the parent cached, and have its writes and
+invalidations seen by the parent and the other workers. Concurrent
+set_if_newer() calls must leave the newest version in place, and the file
+must pass an integrity check afterwards. POSIX only.
+"""
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ["ELI_SHARED_CACHE_PATH"] = os.path.join(tempfile.mkdtemp(), "cache.db")
+
+import cache
+
+WORKERS = 4
+WRITES = 300
+
+failures = []
+
+
+def check(name, ok):
+    # One write per line, so lines from workers don't interleave
+    sys.stdout.write(f"  {'PASS' if ok else 'FAIL'}  {name}\n")
+    sys.stdout.flush()
+    if not ok:
+        failures.append(name)
+
+
+def worker(shared, n, parent_conn):
+    """Runs in a forked child; returns the number of failed checks"""
+    check(f"worker {n}: sees the value the parent cached", shared.get("parent") == "from parent")
+    check(f"worker {n}: uses its own connection, not the parent's", shared._conn() is not parent_conn)
+    check(f"worker {n}: still finds the parent's entry to invalidate", shared.peek("user:1:trends") is not None)
+
+    for i in range(WRITES):
+        shared.set(f"worker:{n}:{i}", i)
+        # Every worker races on the same key; versions interleave across workers
+        shared.set_if_newer("race", (n, i), version=i * WORKERS + n)
+    return len(failures)
+
+
+def run_forked(target, *args):
+    """Fork, run target in the child and exit with its result; returns the child's pid"""
+    sys.stdout.flush()
+    pid = os.fork()
+    if pid == 0:
+        code = 1
+        try:
+            code = min(target(*args), 100)
+        except Exception as e:
+            sys.stdout.write(f"  FAIL  {target.__name__}{args[1:2]}: {e!r}\n")
+            sys.stdout.flush()
+        finally:
+            os._exit(code)
+    return pid
+
+
+def wait(pids):
+    for pid in pids:
+        _, status = os.waitpid(pid, 0)
+        if os.waitstatus_to_exitcode(status) != 0:
+            failures.append(f"child {pid} exited with {os.waitstatus_to_exitcode(status)}")
+
+
+def invalidate(shared):
+    shared.delete_prefix("user:1:")
+    return 0
+
+
+print("=" * 70)
+print("SHARED CACHE FORK TEST")
+print("=" * 70)
+
+if not hasattr(os, "fork"):
+    print("\nos.fork() is not available here; nothing to check")
+    sys.exit(0)
+
+shared = cache.make_cache("fork-test")
+check("ELI_SHARED_CACHE_PATH gives a SharedCache", isinstance(shared, cache.SharedCache))
+shared.set("parent", "from parent")
+shared.set("user:1:trends", [1, 2, 3])
+shared.set("user:12:trends", [4, 5, 6])
+parent_conn = shared._conn()
+
+print(f"\n>> Forking {WORKERS} workers")
+wait([run_forked(worker, shared, n, parent_conn) for n in range(WORKERS)])
+# Invalidate from one more child once every worker has checked the entry is there
+wait([run_forked(invalidate, shared)])
+
+print("\n>> Back in the parent")
+check("the parent's connection was left open and usable", shared.get("parent") == "from parent")
+check("every worker's writes are visible", all(
+    shared.peek(f"worker:{n}:{i}") == i for n in range(WORKERS) for i in range(WRITES)
+))
+check("a worker's delete_prefix reached the parent", shared.peek("user:1:trends") is None)
+check("delete_prefix left other users alone (user:12: is not under user:1:)",
+      shared.peek("user:12:trends") == [4, 5, 6])
+check("the newest set_if_newer version won the race", shared.peek("race") == (WORKERS - 1, WRITES - 1))
+check("an older version is rejected", shared.set_if_newer("race", "stale", version=0) is False)
+check("a newer version is accepted", shared.set_if_newer("race", "fresh", version=WRITES * WORKERS) is True)
+check("the cache file passes an integrity check",
+      parent_conn.execute("PRAGMA integrity_check").fetchone()[0] == "ok")
+
+print("\n" + "=" * 70)
+if failures:
+    print(f"FAILED: {len(failures)} check(s)")
+    sys.exit(1)
+print(f"OK: {WORKERS} forked workers shared one cache file")
@@ -0,0 +1,46 @@
+"""
+Per-user local time helpers.
+
+Timestamps are stored in UTC. Each entry also stores the user's local
+calendar day (MoodEntry.local_day), computed once at insert time from the
+timezone in their Settings, so "today" is an equality lookup on
+(user_id, local_day) instead of a UTC range scan.
+"""
+from datetime import datetime, timezone
+from functools import lru_cache
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+DEFAULT_TIMEZONE = "UTC"
+
+
+@lru_cache(maxsize=512)
+def get_zone(name):
+    """ZoneInfo for `name`, falling back to UTC for unknown or empty names"""
+    try:
+        return ZoneInfo(name or DEFAULT_TIMEZONE)
+    except (ZoneInfoNotFoundError, ValueError):
+        return ZoneInfo(DEFAULT_TIMEZONE)
+
+
+def is_valid_timezone(name):
+    try:
+        ZoneInfo(name)
+        return True
+    except (ZoneInfoNotFoundError, ValueError):
+        return False
+
+
+def local_day(utc_dt, tz_name):
+    """Local calendar date for a naive UTC datetime"""
+    return utc_dt.replace(tzinfo=timezone.utc).astimezone(get_zone(tz_name)).date()
+
+
+def local_today(tz_name):
+    return local_day(datetime.utcnow(), tz_name)
+
+
+def user_timezone(db, user_id):
+    """Timezone name from the user's (cached) settings"""
+    from settings_store import get_user_settings
+
+    return get_user_settings(db, user_id)["timezone"]
@@ -0,0 +1,167 @@
+"""
+Lightweight per-request span timing, reported as a Server-Timing header.
+
+Each request gets a RequestTimings object stored in a context variable.
+Code that wants to be measured wraps itself in `span("name")`; durations for
+the same name are summed. The SQLAlchemy engine hooks add every cursor
+execution to the "db" span, and TimedRoute splits the route handler into the
+endpoint itself and response serialization ("ser").
+
+All bookkeeping is a couple of perf_counter() calls and a dict update, so
+the overhead stays in the low microseconds and it can stay on in production.
+"""
+import inspect
+import os
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+
+# Print a one-line trace summary per request (trace id, path, spans)
+TIMING_LOG = os.environ.get("SERVER_TIMING_LOG", "0") == "1"
+
+# Spans are emitted in this order; anything else is appended after
+SPAN_ORDER = ("auth", "db", "llmq", "llm", "ser")
+
+
+class RequestTimings:
+    __slots__ = ("trace_id", "start", "spans", "endpoint_end")
+
+    def __init__(self):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.start = time.perf_counter()
+        self.spans = {}
+        self.endpoint_end = None
+
+    def add(self, name, seconds):
+        self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+    def header_value(self):
+        total = (time.perf_counter() - self.start) * 1000
+        names = [n for n in SPAN_ORDER if n in self.spans]
+        names += [n for n in self.spans if n not in SPAN_ORDER]
+        parts = [f"{name};dur={self.spans[name] * 1000:.2f}" for name in names]
+        parts.append(f"total;dur={total:.2f}")
+        return ", ".join(parts)
+
+
+_current = ContextVar("request_timings", default=None)
+
+
+def current_timings():
+    """Return the RequestTimings for the active request, or None outside a request"""
+    return _current.get()
+
+
+@contextmanager
+def span(name):
+    """Time the enclosed block and add it to the current request's `name` span"""
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - start)
+
+
+def instrument_engine(engine):
+    """Attribute every cursor execution on `engine` to the "db" span"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_execute(conn, cursor, statement, parameters, context, executemany):
+        start = conn.info["query_start"].pop()
+        timings = _current.get()
+        if timings is not None:
+            timings.add("db", time.perf_counter() - start)
+
+
+class TimedRoute(APIRoute):
+    """
+    APIRoute that records when the endpoint function returns, so the time
+    FastAPI then spends validating and serializing the response can be
+    reported separately as "ser".
+    """
+
+    def __init__(self, path, endpoint, **kwargs):
+        super().__init__(path, _mark_endpoint_end(endpoint), **kwargs)
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def timed_handler(request):
+            response = await handler(request)
+            timings = _current.get()
+            if timings is not None and timings.endpoint_end is not None:
+                timings.add("ser", time.perf_counter() - timings.endpoint_end)
+            return response
+
+        return timed_handler
+
+
+def _mark_endpoint_end(endpoint):
+    def mark():
+        timings = _current.get()
+        if timings is not None:
+            timings.endpoint_end = time.perf_counter()
+
+    # functools.wraps keeps the signature FastAPI inspects for dependencies
+    if inspect.iscoroutinefunction(endpoint):
+        @wraps(endpoint)
+        async def timed_async_endpoint(*args, **kwargs):
+            try:
+                return await endpoint(*args, **kwargs)
+            finally:
+                mark()
+
+        return timed_async_endpoint
+
+    @wraps(endpoint)
+    def timed_endpoint(*args, **kwargs):
+        try:
+            return endpoint(*args, **kwargs)
+        finally:
+            mark()
+
+    return timed_endpoint
+
+
+class ServerTimingMiddleware:
+    """Pure ASGI middleware that owns the per-request RequestTimings"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings = RequestTimings()
+        token = _current.set(timings)
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", timings.header_value().encode("latin-1")))
+                headers.append((b"x-trace-id", timings.trace_id.encode("latin-1")))
+                message["headers"] = headers
+                if TIMING_LOG:
+                    print(f"[trace {timings.trace_id}] {scope['method']} {scope['path']} "
+                          f"{message['status']} {timings.header_value()}")
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
@@ -0,0 +1,162 @@
+"""
+Train the local sentiment model from labels stored in mood_entries
+
+Usage: python train_sentiment.py [--limit N] [--test-fraction 0.2] [--seed 0]
+
+Rows scored by gpt-4o (sentiment_source = 'llm') are split into train and
+held-out sets, the model is fit on the training rows, evaluated against the
+held-out LLM labels and saved as the next backend/models/sentiment_vN
+artifact. Scores from TextBlob, seed data or the local model itself are never
+used, so the model only ever learns from the LLM. Entries stored before
+sentiment_source existed are marked 'llm' by the schema migration when their
+label matches the LLM's thresholds (see database.backfill_sentiment_sources).
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+
+from database import SessionLocal, MoodEntry, init_db
+from sentiment_model import SentimentModel, LABELS, DEFAULT_N_FEATURES
+
+
+def load_labeled_rows(db, limit):
+    """Most recent `limit` entries scored by the LLM that have both a score and a label"""
+    query = db.query(
+        MoodEntry.user_message, MoodEntry.sentiment_score, MoodEntry.sentiment_label
+    ).filter(
+        MoodEntry.sentiment_source == "llm",
+        MoodEntry.sentiment_score.isnot(None),
+        MoodEntry.sentiment_label.in_(LABELS)
+    ).order_by(MoodEntry.id.desc()).limit(limit)
+
+    texts, polarities, labels = [], [], []
+    for message, score, label in query.yield_per(5000):
+        texts.append(message)
+        # Stored scores are normalized to 0-1; the model works in -1..1 polarity
+        polarities.append(score * 2 - 1)
+        labels.append(label)
+    return texts, polarities, labels
+
+
+def evaluate(model, texts, polarities, labels, min_confidence):
+    """Compare model predictions with held-out LLM labels"""
+    start = time.perf_counter()
+    predictions = [model.predict(text) for text in texts]
+    per_call_ms = (time.perf_counter() - start) * 1000 / max(len(texts), 1)
+
+    confusion = np.zeros((len(LABELS), len(LABELS)), dtype=int)
+    for pred, label in zip(predictions, labels):
+        confusion[LABELS.index(label), LABELS.index(pred["label"])] += 1
+
+    total = confusion.sum()
+    accuracy = np.trace(confusion) / total if total else 0.0
+    f1_scores = []
+    for i in range(len(LABELS)):
+        tp = confusion[i, i]
+        precision = tp / confusion[:, i].sum() if confusion[:, i].sum() else 0.0
+        recall = tp / confusion[i, :].sum() if confusion[i, :].sum() else 0.0
+        f1_scores.append(2 * precision * recall / (precision + recall) if precision + recall else 0.0)
+
+    mae = float(np.mean([abs(p["polarity"] - y) for p, y in zip(predictions, polarities)])) if predictions else 0.0
+
+    confident = [(p, label) for p, label in zip(predictions, labels) if p["confidence"] >= min_confidence]
+    coverage = len(confident) / total if total else 0.0
+    confident_accuracy = (
+        sum(1 for p, label in confident if p["label"] == label) / len(confident) if confident else 0.0
+    )
+
+    return {
+        "n_test": int(total),
+        "accuracy": round(float(accuracy), 4),
+        "macro_f1": round(float(np.mean(f1_scores)), 4),
+        "polarity_mae": round(mae, 4),
+        "confusion_matrix": {"labels": list(LABELS), "rows_are_llm_labels": confusion.tolist()},
+        "min_confidence": min_confidence,
+        "coverage_at_min_confidence": round(coverage, 4),
+        "accuracy_at_min_confidence": round(confident_accuracy, 4),
+        "predict_ms_per_call": round(per_call_ms, 4),
+    }
+
+
+def print_report(report):
+    print("\nEvaluation against held-out LLM labels")
+    print("-" * 70)
+    print(f"  Held-out rows:        {report['n_test']}")
+    print(f"  Label accuracy:       {report['accuracy']:.1%}")
+    print(f"  Macro F1:             {report['macro_f1']:.3f}")
+    print(f"  Polarity MAE:         {report['polarity_mae']:.3f}")
+    print(f"  Confidence >= {report['min_confidence']:.2f}:  "
+          f"{report['coverage_at_min_confidence']:.1%} of rows, "
+          f"{report['accuracy_at_min_confidence']:.1%} accurate")
+    print(f"  Predict latency:      {report['predict_ms_per_call']:.3f} ms/call")
+    print("\n  Confusion (rows = LLM label, columns = model label)")
+    print("  " + " " * 10 + "".join(f"{label:>10}" for label in LABELS))
+    for label, row in zip(LABELS, report["confusion_matrix"]["rows_are_llm_labels"]):
+        print(f"  {label:>10}" + "".join(f"{n:>10}" for n in row))
+
+
+def train(limit, test_fraction, seed, epochs, n_features, min_confidence):
+    init_db()
+    db = SessionLocal()
+    try:
+        print("=" * 70)
+        print("TRAINING LOCAL SENTIMENT MODEL")
+        print("=" * 70)
+
+        texts, polarities, labels = load_labeled_rows(db, limit)
+        if len(texts) < 20:
+            print(f"\nERROR: Only {len(texts)} LLM-labeled entries found, need at least 20")
+            print("   (older entries whose source couldn't be told apart from TextBlob or seed data are not used)")
+            return None
+
+        order = np.random.default_rng(seed).permutation(len(texts))
+        n_test = max(1, int(len(texts) * test_fraction))
+        test_idx, train_idx = order[:n_test], order[n_test:]
+
+        def pick(values, idx):
+            return [values[i] for i in idx]
+
+        print(f"\n>> {len(train_idx)} training rows, {len(test_idx)} held-out rows")
+        start = time.perf_counter()
+        model = SentimentModel(n_features=n_features)
+        model.fit(pick(texts, train_idx), pick(polarities, train_idx), pick(labels, train_idx),
+                  epochs=epochs, seed=seed)
+        print(f">> Trained in {time.perf_counter() - start:.1f}s")
+
+        report = evaluate(model, pick(texts, test_idx), pick(polarities, test_idx),
+                          pick(labels, test_idx), min_confidence)
+        print_report(report)
+
+        model.metadata = {
+            "n_train": len(train_idx),
+            "epochs": epochs,
+            "seed": seed,
+            "evaluation": report,
+        }
+        path = model.save()
+        print(f"\n>> Saved model version {model.version} to {path}")
+        print("=" * 70)
+        return model
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train the local sentiment model from stored LLM labels")
+    parser.add_argument("--limit", type=int, default=200000, help="Use at most this many recent entries")
+    parser.add_argument("--test-fraction", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--epochs", type=int, default=100)
+    parser.add_argument("--n-features", type=int, default=DEFAULT_N_FEATURES)
+    parser.add_argument("--min-confidence", type=float, default=0.75,
+                        help="Confidence at which EliAI trusts the local model (for the coverage report)")
+    args = parser.parse_args()
+
+    model = train(args.limit, args.test_fraction, args.seed, args.epochs, args.n_features, args.min_confidence)
+    if model is None:
+        sys.exit(1)
@@ -0,0 +1,149 @@
+"""
+Mood trend time series: per-bucket mean score, rolling mean, EWMA and
+volatility over a user's sentiment_score history.
+
+SQLite does the per-day grouping (count, sum, sum of squares) over the
+(user_id, local_day) index, and everything after that is NumPy array math
+over at most a few hundred buckets. Days that have been archived (see
+archive.py) contribute their stored per-day sums. NumPy is imported on first use to keep
+app startup fast. Results are cached per user until a new entry arrives
+(see invalidate_user).
+"""
+import re
+from datetime import timedelta
+
+from sqlalchemy import func
+
+import archive
+from cache import make_cache
+from database import MoodEntry
+
+MAX_RANGE_DAYS = 730
+EWMA_SPAN = 7
+# Rolling window, in buckets, for each bucket size (7 days / 4 weeks)
+BUCKETS = {"day": (1, 7), "week": (7, 4)}
+
+_RANGE_RE = re.compile(r"^(\d+)([dwy])$")
+_RANGE_UNITS = {"d": 1, "w": 7, "y": 365}
+
+trend_cache = make_cache("trends", max_entries=5000)
+
+
+def parse_range(value):
+    """'90d' / '12w' / '1y' -> number of days, or None if invalid"""
+    match = _RANGE_RE.match(value.strip().lower())
+    if not match:
+        return None
+    days = int(match.group(1)) * _RANGE_UNITS[match.group(2)]
+    return days if 0 < days <= MAX_RANGE_DAYS else None
+
+
+def invalidate_user(user_id):
+    trend_cache.delete_prefix(f"{user_id}:")
+
+
+def _trailing_sum(values, window):
+    """Sum over the last `window` buckets at every position (shorter at the start)"""
+    import numpy as np
+    c = np.cumsum(np.concatenate(([0.0], values)))
+    idx = np.arange(1, len(values) + 1)
+    return c[idx] - c[np.maximum(idx - window, 0)]
+
+
+def _ewma(values, span):
+    """EWMA (adjust=False) of a dense series, as one lower-triangular matrix product"""
+    import numpy as np
+
+    n = len(values)
+    if n == 0:
+        return values
+    alpha = 2.0 / (span + 1)
+    idx = np.arange(n)
+    lag = idx[:, None] - idx[None, :]
+    weights = np.where(lag >= 0, alpha * (1 - alpha) ** np.maximum(lag, 0), 0.0)
+    # The first value seeds the average instead of being weighted by alpha
+    weights[:, 0] = (1 - alpha) ** idx
+    return weights @ values
+
+
+def compute_trends(day_rows, start, n_days, bucket):
+    """
+    day_rows: (local_day, count, sum, sum_of_squares) per day with entries.
+    Returns the list of per-bucket points.
+    """
+    import numpy as np
+
+    bucket_days, window = BUCKETS[bucket]
+    n_buckets = -(-n_days // bucket_days)
+
+    counts = np.zeros(n_buckets)
+    sums = np.zeros(n_buckets)
+    squares = np.zeros(n_buckets)
+    if day_rows:
+        days = np.array([(row[0] - start).days for row in day_rows])
+        slots = days // bucket_days
+        np.add.at(counts, slots, [row[1] for row in day_rows])
+        np.add.at(sums, slots, [row[2] for row in day_rows])
+        np.add.at(squares, slots, [row[3] for row in day_rows])
+
+    has_data = counts > 0
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.where(has_data, sums / counts, np.nan)
+
+        window_counts = _trailing_sum(counts, window)
+        window_sums = _trailing_sum(sums, window)
+        window_squares = _trailing_sum(squares, window)
+        rolling_mean = np.where(window_counts > 0, window_sums / window_counts, np.nan)
+        variance = window_squares / window_counts - rolling_mean ** 2
+        volatility = np.where(window_counts > 1, np.sqrt(np.maximum(variance, 0)), np.nan)
+
+    # EWMA over buckets that have data, carried forward across empty ones
+    ewma = np.full(n_buckets, np.nan)
+    if has_data.any():
+        ewma[has_data] = _ewma(mean[has_data], EWMA_SPAN)
+        last_seen = np.maximum.accumulate(np.where(has_data, np.arange(n_buckets), -1))
+        ewma = np.where(last_seen >= 0, ewma[np.maximum(last_seen, 0)], np.nan)
+
+    def clean(values):
+        return [None if np.isnan(v) else round(float(v), 4) for v in values]
+
+    dates = [(start + timedelta(days=i * bucket_days)).isoformat() for i in range(n_buckets)]
+    return [
+        {"date": d, "count": int(c), "mean": m, "rolling_mean": r, "ewma": e, "volatility": v}
+        for d, c, m, r, e, v in zip(
+            dates, counts, clean(mean), clean(rolling_mean), clean(ewma), clean(volatility)
+        )
+    ]
+
+
+def get_trends(db, user_id, today, n_days, bucket):
+    """Trend series for the `n_days` local days ending today, cached per user"""
+    key = f"{user_id}:{today.isoformat()}:{n_days}:{bucket}"
+    cached = trend_cache.get(key)
+    if cached is not None:
+        return cached
+
+    start = today - timedelta(days=n_days - 1)
+    day_rows = db.query(
+        MoodEntry.local_day,
+        func.count(MoodEntry.sentiment_score),
+        func.sum(MoodEntry.sentiment_score),
+        func.sum(MoodEntry.sentiment_score * MoodEntry.sentiment_score),
+    ).filter(
+        MoodEntry.user_id == user_id,
+        MoodEntry.local_day >= start,
+        MoodEntry.local_day <= today,
+        MoodEntry.sentiment_score.isnot(None)
+    ).group_by(MoodEntry.local_day).all()
+    day_rows += archive.archived_day_rows(db, user_id, start, today)
+
+    result = {
+        "start": start.isoformat(),
+        "end": today.isoformat(),
+        "bucket": bucket,
+        "window": BUCKETS[bucket][1],
+        "ewma_span": EWMA_SPAN,
+        "points": compute_trends(day_rows, start, n_days, bucket),
+    }
+    trend_cache.set(key, result)
+    return result
@@ -0,0 +1,286 @@
+"""
+OpenAI token ledger and per-user daily budgets.
+
+EliAI._complete reports the usage of every completion here (prompt and
+completion tokens, model) along with its operation: "chat", "sentiment",
+"daily" or "weekly". The user it was made for comes from a context variable:
+request handlers call set_user() and workers use `with for_user(...)`, the way
+timing.py carries request spans, so nothing is threaded through EliAI's
+methods. Guests and work done for no one are recorded with user_id NULL.
+
+Records are buffered in memory, and a writer thread appends them to
+llm_usage in one transaction every FLUSH_SECONDS (sooner once BATCH_SIZE are
+waiting), adding the same totals to llm_usage_daily, one row per user per
+UTC day. A chat never waits on a ledger insert; a crash loses at most the
+last few seconds of records.
+
+With ELI_LLM_DAILY_TOKEN_BUDGET set, a user who has used that many tokens
+today (stored totals plus what this process still buffers) gets the local
+sentiment model instead of gpt-4o and their stored summaries instead of new
+ones until the next UTC day. Eli's chat replies are never cut off.
+"""
+import os
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+
+from sqlalchemy import desc, func, insert, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from database import LLMUsage, LLMUsageDaily, engine
+
+# 0 means no budget
+DAILY_TOKEN_BUDGET = int(os.environ.get("ELI_LLM_DAILY_TOKEN_BUDGET", "0"))
+# USD per million tokens, for cost estimates (gpt-4o list prices)
+PROMPT_PRICE = float(os.environ.get("ELI_LLM_PROMPT_PRICE", "2.50"))
+COMPLETION_PRICE = float(os.environ.get("ELI_LLM_COMPLETION_PRICE", "10.00"))
+
+FLUSH_SECONDS = 5.0
+BATCH_SIZE = 500
+# While the database can't be written, keep at most this many records
+MAX_BUFFERED = 100000
+
+_user_id = ContextVar("llm_usage_user_id", default=None)
+
+
+def set_user(user_id):
+    """Attribute the LLM calls made in the rest of this request to user_id"""
+    _user_id.set(user_id)
+
+
+@contextmanager
+def for_user(user_id):
+    """Attribute the LLM calls made inside the block to user_id"""
+    token = _user_id.set(user_id)
+    try:
+        yield
+    finally:
+        _user_id.reset(token)
+
+
+def estimate_cost(prompt_tokens, completion_tokens):
+    return round((prompt_tokens * PROMPT_PRICE + completion_tokens * COMPLETION_PRICE) / 1e6, 4)
+
+
+def _totals(calls, prompt_tokens, completion_tokens):
+    prompt_tokens, completion_tokens = int(prompt_tokens or 0), int(completion_tokens or 0)
+    return {
+        "calls": int(calls or 0),
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+        "estimated_cost_usd": estimate_cost(prompt_tokens, completion_tokens),
+    }
+
+
+class UsageLedger:
+    def __init__(self, bind=engine, daily_budget=DAILY_TOKEN_BUDGET, flush_seconds=FLUSH_SECONDS,
+                 batch_size=BATCH_SIZE):
+        self.bind = bind
+        self.daily_budget = daily_budget
+        self.flush_seconds = flush_seconds
+        self.batch_size = batch_size
+        self._buffer = []
+        # (user_id, day) -> tokens recorded but not written yet
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self.counts = {"recorded": 0, "written": 0, "flushes": 0, "flush_failed": 0, "dropped": 0,
+                       "over_budget": 0}
+
+    def record(self, operation, model, usage):
+        """Buffer one completion's usage for the current user"""
+        if usage is None:
+            return
+        prompt_tokens = int(getattr(usage, "prompt_tokens", 0) or 0)
+        completion_tokens = int(getattr(usage, "completion_tokens", 0) or 0)
+        user_id = _user_id.get()
+        now = datetime.utcnow()
+        with self._lock:
+            self._buffer.append({
+                "user_id": user_id,
+                "operation": operation,
+                "model": model,
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "created_at": now,
+            })
+            if user_id is not None:
+                key = (user_id, now.date())
+                self._pending[key] = self._pending.get(key, 0) + prompt_tokens + completion_tokens
+            self.counts["recorded"] += 1
+            full = len(self._buffer) >= self.batch_size
+        if full:
+            self._wake.set()
+
+    def flush(self):
+        """Write the buffered records; returns how many were written"""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._buffer = self._buffer, []
+            if not batch:
+                return 0
+
+            daily = {}
+            for row in batch:
+                if row["user_id"] is None:
+                    continue
+                key = (row["user_id"], row["created_at"].date())
+                calls, prompt_tokens, completion_tokens = daily.get(key, (0, 0, 0))
+                daily[key] = (calls + 1, prompt_tokens + row["prompt_tokens"],
+                              completion_tokens + row["completion_tokens"])
+
+            try:
+                with self.bind.begin() as conn:
+                    conn.execute(insert(LLMUsage), batch)
+                    if daily:
+                        stmt = sqlite_insert(LLMUsageDaily)
+                        conn.execute(stmt.on_conflict_do_update(
+                            index_elements=[LLMUsageDaily.user_id, LLMUsageDaily.day],
+                            set_={
+                                "calls": LLMUsageDaily.calls + stmt.excluded.calls,
+                                "prompt_tokens": LLMUsageDaily.prompt_tokens + stmt.excluded.prompt_tokens,
+                                "completion_tokens": LLMUsageDaily.completion_tokens + stmt.excluded.completion_tokens,
+                            }
+                        ), [
+                            {"user_id": user_id, "day": day, "calls": calls,
+                             "prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens}
+                            for (user_id, day), (calls, prompt_tokens, completion_tokens) in daily.items()
+                        ])
+            except Exception:
+                with self._lock:
+                    # Put the batch back for the next flush, oldest records first
+                    self._buffer[:0] = batch
+                    overflow = len(self._buffer) - MAX_BUFFERED
+                    if overflow > 0:
+                        del self._buffer[:overflow]
+                        self.counts["dropped"] += overflow
+                    self.counts["flush_failed"] += 1
+                raise
+
+            with self._lock:
+                for key, (_, prompt_tokens, completion_tokens) in daily.items():
+                    left = self._pending.get(key, 0) - prompt_tokens - completion_tokens
+                    if left > 0:
+                        self._pending[key] = left
+                    else:
+                        self._pending.pop(key, None)
+                self.counts["written"] += len(batch)
+                self.counts["flushes"] += 1
+            return len(batch)
+
+    def used_today(self, user_id):
+        """Tokens the user has used today (UTC), including records not written yet"""
+        day = datetime.utcnow().date()
+        with self.bind.connect() as conn:
+            stored = conn.execute(
+                select(LLMUsageDaily.prompt_tokens + LLMUsageDaily.completion_tokens)
+                .where(LLMUsageDaily.user_id == user_id, LLMUsageDaily.day == day)
+            ).scalar()
+        with self._lock:
+            return (stored or 0) + self._pending.get((user_id, day), 0)
+
+    def over_budget(self, user_id=None):
+        """Whether the user (default: the current one) has used up today's budget"""
+        if not self.daily_budget:
+            return False
+        user_id = _user_id.get() if user_id is None else user_id
+        if user_id is None:
+            return False
+        if self.used_today(user_id) < self.daily_budget:
+            return False
+        with self._lock:
+            self.counts["over_budget"] += 1
+        return True
+
+    def report(self, days=7, top=20):
+        """Usage over the last `days` UTC days by operation and model, by day and by top user"""
+        self.flush()
+        today = datetime.utcnow().date()
+        first_day = today - timedelta(days=days - 1)
+        since = datetime.combine(first_day, datetime.min.time())
+        calls = func.count(LLMUsage.id)
+        prompt_sum = func.sum(LLMUsage.prompt_tokens)
+        completion_sum = func.sum(LLMUsage.completion_tokens)
+        with self.bind.connect() as conn:
+            by_operation = conn.execute(
+                select(LLMUsage.operation, LLMUsage.model, calls, prompt_sum, completion_sum)
+                .where(LLMUsage.created_at >= since)
+                .group_by(LLMUsage.operation, LLMUsage.model)
+                .order_by(desc(prompt_sum + completion_sum))
+            ).all()
+            day = func.date(LLMUsage.created_at)
+            by_day = conn.execute(
+                select(day, calls, prompt_sum, completion_sum)
+                .where(LLMUsage.created_at >= since).group_by(day).order_by(day)
+            ).all()
+            guests = conn.execute(
+                select(calls, prompt_sum, completion_sum)
+                .where(LLMUsage.created_at >= since, LLMUsage.user_id.is_(None))
+            ).one()
+            user_total = func.sum(LLMUsageDaily.prompt_tokens + LLMUsageDaily.completion_tokens)
+            top_users = conn.execute(
+                select(LLMUsageDaily.user_id, func.sum(LLMUsageDaily.calls),
+                       func.sum(LLMUsageDaily.prompt_tokens), func.sum(LLMUsageDaily.completion_tokens))
+                .where(LLMUsageDaily.day >= first_day)
+                .group_by(LLMUsageDaily.user_id).order_by(desc(user_total)).limit(top)
+            ).all()
+            over_budget_today = conn.execute(
+                select(func.count()).select_from(LLMUsageDaily).where(
+                    LLMUsageDaily.day == today,
+                    LLMUsageDaily.prompt_tokens + LLMUsageDaily.completion_tokens >= self.daily_budget
+                )
+            ).scalar() if self.daily_budget else 0
+
+        total = [sum(row[i] or 0 for row in by_operation) for i in (2, 3, 4)]
+        return {
+            "days": days,
+            "since": first_day.isoformat(),
+            "total": _totals(*total),
+            "guests": _totals(*guests),
+            "by_operation": [
+                {"operation": row[0], "model": row[1], **_totals(*row[2:])} for row in by_operation
+            ],
+            "by_day": [{"day": row[0], **_totals(*row[1:])} for row in by_day],
+            "top_users": [{"user_id": row[0], **_totals(*row[1:])} for row in top_users],
+            "daily_token_budget": self.daily_budget or None,
+            "users_over_budget_today": over_budget_today,
+        }
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="usage-ledger", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5.0):
+        """Stop the writer and write whatever is still buffered"""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        try:
+            self.flush()
+        except Exception as e:
+            print(f"Final usage ledger flush failed: {e}")
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_seconds)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Usage ledger flush failed: {e}")
+
+    def stats(self):
+        with self._lock:
+            return {**self.counts, "buffered": len(self._buffer), "daily_token_budget": self.daily_budget or None}
+
+
+ledger = UsageLedger()
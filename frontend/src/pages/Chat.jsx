@@ -109,9 +109,12 @@ function Chat({ safeMode }) {
       })
     } catch (error) {
       console.error('Error sending message:', error)
+      const rateLimited = error.response?.status === 429
       const errorMessage = {
         user: userMessage,
-        eli: "I'm having trouble connecting right now. Please try again.",
+        eli: rateLimited
+          ? `You're sending messages faster than I can keep up. Please wait ${error.response.headers['retry-after'] || 'a few'} seconds and try again.`
+          : "I'm having trouble connecting right now. Please try again.",
         sentiment: 'neutral',
         tags: ''
       }
@@ -142,6 +145,7 @@ function Chat({ safeMode }) {
     }
   }
 
+  // Keep in sync with QUICK_PROMPTS in backend/guest_replies.py, which caches guests' replies to them
   const quickPrompts = [
     "I'm feeling overwhelmed today",
     "Things are going well",
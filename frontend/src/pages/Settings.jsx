@@ -3,11 +3,20 @@ import axios from '../config/axios'
 import '../styles/Settings.css'
 import NotificationModal from '../components/NotificationModal'
 
+// All IANA zones the browser knows, always including the current value
+const timezoneOptions = (current) => {
+  const zones = typeof Intl.supportedValuesOf === 'function'
+    ? Intl.supportedValuesOf('timeZone')
+    : [Intl.DateTimeFormat().resolvedOptions().timeZone]
+  return zones.includes(current) ? zones : [current, ...zones]
+}
+
 function Settings({setActiveTab}) {
   const [settings, setSettings] = useState({
     reminder_enabled: true,
     reminder_time: '09:00',
-    privacy_mode: false
+    privacy_mode: false,
+    timezone: Intl.DateTimeFormat().resolvedOptions().timeZone
   })
   const [loading, setLoading] = useState(true)
   const [saving, setSaving] = useState(false)
@@ -89,6 +98,13 @@ function Settings({setActiveTab}) {
     }))
   }
 
+  const handleTimezoneChange = (e) => {
+    setSettings(prev => ({
+      ...prev,
+      timezone: e.target.value
+    }))
+  }
+
   const handleTimeChange = (e) => {
     setSettings(prev => ({
       ...prev,
@@ -160,6 +176,25 @@ function Settings({setActiveTab}) {
         )}
       </div>
 
+      <div className="settings-section">
+        <h3>Time Zone</h3>
+        <div className="setting-item">
+          <div className="setting-info">
+            <label>Your Time Zone</label>
+            <p className="setting-description">Used to decide which check-ins count as "today"</p>
+          </div>
+          <select
+            value={settings.timezone}
+            onChange={handleTimezoneChange}
+            className="time-input"
+          >
+            {timezoneOptions(settings.timezone).map(tz => (
+              <option key={tz} value={tz}>{tz}</option>
+            ))}
+          </select>
+        </div>
+      </div>
+
       <div className="settings-section">
         <h3>About</h3>
         <div className="about-content">
@@ -41,6 +41,8 @@ function Signup() {
 
     try {
       const { confirmPassword, ...signupData } = formData
+      // Let the backend work out "today" in the user's own timezone
+      signupData.timezone = Intl.DateTimeFormat().resolvedOptions().timeZone
       const response = await axios.post('/api/auth/signup', signupData)
       const { access_token, user } = response.data
 